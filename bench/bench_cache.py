@@ -0,0 +1,95 @@
+
+'''
+编译缓存启动测试：生成一个脚本，比较不用缓存、冷缓存（解析后写入缓存）和热缓存（直接加载）的启动时间
+
+python bench/bench_cache.py [--size=KB] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import my_lox
+from my_env import GlobalEnv
+
+# 每段声明一个函数和一个类，顶层只做很少的计算，运行时间主要花在启动上
+snippet = '''
+fun f{i}(a, b) {{
+  var t = a * 2 + b;
+  if (t > 10 and a != b) {{ t = t - 1; }} else {{ t = t + 1; }}
+  while (t > 100) t = t / 2;
+  return t;
+}}
+class C{i} {{
+  init(x) {{ this.x = x; }}
+  get() {{ return f{i}(this.x, {i}); }}
+}}
+var v{i} = C{i}({i}).get();
+'''
+
+def generate(path, size):
+    total = 0
+    i = 0
+    with open(path, 'w') as f:
+        while total < size:
+            part = snippet.format(i=i)
+            f.write(part)
+            total += len(part)
+            i += 1
+
+def load_time(path, scanner, cache, cache_dir, repeat, clear):
+    best = None
+    for _ in range(repeat):
+        if clear:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        start = time.perf_counter()
+        my_lox.load_file(path, GlobalEnv(), scanner, cache, cache_dir)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def process_time(args, repeat, clear_dir=None):
+    '''
+    完整运行一次 my_lox.py 的墙钟时间，包含 Python 解释器启动
+    '''
+    best = None
+    for _ in range(repeat):
+        if clear_dir is not None:
+            shutil.rmtree(clear_dir, ignore_errors=True)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(root, 'my_lox.py')] + args,
+                       stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=float, default=200, help='脚本大小（KB）')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.lox')
+        cache_dir = os.path.join(tmp, 'cache')
+        generate(path, int(args.size * 1024))
+        print(f'source: {os.path.getsize(path) / 1024:.0f} KB')
+        print('load_file (scan + parse + resolve, or cache load):')
+        for name in ['char', 'regex']:
+            scanner = my_lox.scanners[name]
+            nocache = load_time(path, scanner, False, cache_dir, args.repeat, False)
+            cold = load_time(path, scanner, True, cache_dir, args.repeat, True)
+            warm = load_time(path, scanner, True, cache_dir, args.repeat, False)
+            print(f'{name:>8}: no cache {nocache:7.3f} s  cold {cold:7.3f} s  warm {warm:7.3f} s  ({nocache / warm:.1f}x)')
+        print('whole process (python my_lox.py startup.lox):')
+        cold = process_time([f'--cache-dir={cache_dir}', path], args.repeat, cache_dir)
+        warm = process_time([f'--cache-dir={cache_dir}', path], args.repeat)
+        print(f'{"char":>8}: cold {cold:7.3f} s  warm {warm:7.3f} s')
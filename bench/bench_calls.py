@@ -0,0 +1,67 @@
+
+'''
+函数调用性能测试：递归调用、在循环和块中提前 return 的调用
+
+python bench/bench_calls.py [--engine=tree --engine=vm ...] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+workloads = {
+    'fib': '''
+fun fib(n) {
+  if (n < 2) return n;
+  return fib(n - 1) + fib(n - 2);
+}
+print fib(22);
+''',
+    'early': '''
+fun first(limit) {
+  var i = 0;
+  while (true) {
+    {
+      if (i >= limit) return i;
+    }
+    i = i + 1;
+  }
+}
+var total = 0;
+for (var k = 0; k < 30000; k = k + 1) {
+  total = total + first(3);
+}
+print total;
+''',
+    'method': '''
+class Counter {
+  init() { this.n = 0; }
+  inc() { this.n = this.n + 1; return this; }
+  get() { return this.n; }
+}
+var c = Counter();
+for (var k = 0; k < 50000; k = k + 1) {
+  c.inc();
+}
+print c.get();
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source, e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
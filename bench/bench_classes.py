@@ -0,0 +1,65 @@
+
+'''
+深继承层次测试：30 层的类继承链上，创建叶子类的实例（init 在根类中）和查找根类中的方法
+
+python bench/bench_classes.py [--engine=tree --engine=vm ...] [--depth=N] [--n=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+def hierarchy(depth):
+    '''
+    C0 定义 init 和 base，C1..C{depth} 逐层继承，每层有一个自己的方法
+    '''
+    lines = ['class C0 { init(x) { this.x = x; } base() { return this.x; } }']
+    for i in range(1, depth + 1):
+        lines.append(f'class C{i} < C{i-1} {{ m{i}() {{ return {i}; }} }}')
+    return '\n'.join(lines) + '\n'
+
+workloads = {
+    'new': '''
+var total = 0;
+for (var i = 0; i < {n}; i = i + 1) {{
+  total = total + C{depth}(i).x;
+}}
+print total;
+''',
+    # 两个类的实例交替经过同一个调用处，调用处缓存总是失效；取属性得到绑定方法也要查找
+    'lookup': '''
+fun get(o) {{ return o.base(); }}
+var a = C{depth}(1);
+var b = C{half}(2);
+var total = 0;
+for (var i = 0; i < {n}; i = i + 1) {{
+  total = total + get(a) + get(b);
+  var m = a.base;
+  total = total + m();
+}}
+print total;
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--depth', type=int, default=30, help='继承层数')
+    arg_parser.add_argument('--n', type=int, default=20000, help='循环次数')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    classes = hierarchy(args.depth)
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        source = classes + source.format(n=args.n, depth=args.depth, half=args.depth // 2)
+        times = [measure(source, e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
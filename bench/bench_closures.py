@@ -0,0 +1,90 @@
+'''
+闭包内存测试：函数中创建一大块数据（100 个实例的链表）后返回只用到一个小变量的回调，保留 N 个回调，
+用 tracemalloc 统计执行结束后仍然被占用的内存，即回调通过闭包保留下来的内存
+callback 中大数据和被捕获的变量在同一个作用域，nested 中大数据在外层函数、回调在内层块中的函数里
+
+python bench/bench_closures.py [--engine=tree --engine=vm ...] [--count=N]
+'''
+
+import os
+import sys
+import argparse
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import GlobalEnv
+from my_native import native_table
+
+header = '''
+class Node { init(next) { this.next = next; } }
+class Holder { init(f, next) { this.f = f; this.next = next; } }
+fun big() {
+  var list = nil;
+  for (var j = 0; j < 100; j = j + 1) list = Node(list);
+  return list;
+}
+'''
+
+workloads = {
+    'callback': '''
+fun make(i) {
+  var data = big();
+  var small = i;
+  fun get() { small = small + 1; return small; }
+  return get;
+}
+var keep = nil;
+for (var i = 0; i < {n}; i = i + 1) keep = Holder(make(i), keep);
+print keep.f();
+''',
+    'nested': '''
+fun make(i) {
+  var data = big();
+  {
+    var other = big();
+    fun get() { return i; }
+    return get;
+  }
+}
+var keep = nil;
+for (var i = 0; i < {n}; i = i + 1) keep = Holder(make(i), keep);
+print keep.f();
+''',
+}
+
+def retained(source, engine):
+    '''
+    执行后仍被占用的字节数：全局变量（和其中的回调）在 env 中，统计时 env 还活着
+    '''
+    env = GlobalEnv()
+    env.values.update(native_table)
+    statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+    statements = my_lox.resolve(statements, Resolver(), True)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        my_lox.engines[engine](statements, env)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--count', type=int, default=1000, help='保留的回调个数')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>12}' for e in engines))
+    for name, source in workloads.items():
+        source = header + source.replace('{n}', str(args.count))
+        sizes = [retained(source, e) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{s / (1024 * 1024):9.2f} MB' for s in sizes))
@@ -0,0 +1,38 @@
+
+'''
+深递归测试：各引擎执行几千层的 Lox 递归调用（默认上限内），比较运行时间
+
+python bench/bench_depth.py [--engine=tree --engine=vm ...] [--depth=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+source = '''
+fun sum(n) {{
+  if (n == 0) return 0;
+  return sum(n - 1) + n;
+}}
+var total = 0;
+for (var i = 0; i < 20; i = i + 1) total = total + sum({depth});
+print total;
+'''
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--depth', type=int, default=8000, help='递归深度')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    for engine in engines:
+        print(f'{engine:>8}: {measure(source.format(depth=args.depth), engine, args.repeat):7.3f} s')
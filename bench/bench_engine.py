@@ -0,0 +1,102 @@
+
+'''
+执行引擎性能测试：在调用密集、循环密集、方法调用和闭包几类脚本上比较各引擎的运行时间
+
+python bench/bench_engine.py [--engine=tree --engine=vm ...] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import GlobalEnv
+from my_native import native_table
+
+workloads = {
+    'fib': '''
+fun fib(n) {
+  if (n < 2) return n;
+  return fib(n - 1) + fib(n - 2);
+}
+print fib(20);
+''',
+    'loop': '''
+var total = 0;
+var i = 0;
+while (i < 200000) {
+  if (i / 2 > 10) total = total + i; else total = total - 1;
+  i = i + 1;
+}
+print total;
+''',
+    'method': '''
+class Point {
+  init(x, y) { this.x = x; this.y = y; }
+  add(other) { return Point(this.x + other.x, this.y + other.y); }
+}
+class Point3 < Point {
+  init(x, y, z) { super.init(x, y); this.z = z; }
+  len() { return this.x + this.y + this.z; }
+}
+var p = Point(0, 0);
+var d = Point(1, 2);
+var i = 0;
+while (i < 20000) {
+  p = p.add(d);
+  i = i + 1;
+}
+print p.x + Point3(p.x, p.y, 1).len();
+''',
+    'closure': '''
+fun counter() {
+  var n = 0;
+  fun inc() { n = n + 1; return n; }
+  return inc;
+}
+var c = counter();
+var total = 0;
+for (var i = 0; i < 50000; i = i + 1) {
+  total = total + c();
+}
+print total;
+''',
+}
+
+def measure(source, engine, repeat, optimize=True):
+    '''
+    只统计执行时间，扫描、解析和变量解析不计入；每次重新解析，避免引擎在语法树上留下的缓存影响结果
+    '''
+    best = None
+    for _ in range(repeat):
+        env = GlobalEnv()
+        env.values.update(native_table)
+        statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+        statements = my_lox.resolve(statements, Resolver(optimize), optimize)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            my_lox.engines[engine](statements, env)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source, e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
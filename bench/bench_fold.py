@@ -0,0 +1,44 @@
+
+'''
+常量折叠测试：在含有大量常量子表达式和常量条件的循环上，比较各引擎打开和关闭折叠时的运行时间
+
+python bench/bench_fold.py [--engine=tree --engine=vm ...] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+# 调试开关、单位换算这类写成常量表达式的代码
+source = '''
+var debug = false;
+var total = 0;
+var i = 0;
+while (i < 100000) {
+  total = total + i * (60 * 60 * 24) / (1000 * 1000) - (2 * 3 - 6);
+  if (false and debug) print "trace";
+  if (!nil) total = total + (1 + 2 + 3) * (4 - 5);
+  i = i + (10 - 9);
+}
+print total;
+'''
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}{"no fold":>10}{"fold":>10}')
+    for engine in engines:
+        off = measure(source, engine, args.repeat, False)
+        on = measure(source, engine, args.repeat, True)
+        print(f'{engine:>8}{off:9.3f}s{on:9.3f}s  ({off / on:.2f}x)')
@@ -0,0 +1,76 @@
+'''
+全局变量测试：递归调用全局函数、在全局作用域中循环读写变量、在函数中调用本地函数，比较 tree 和 closure 引擎的运行时间
+（vm 和 python 引擎按名字读写 GlobalEnv.values，不受全局变量表影响）
+
+python bench/bench_globals.py [--engine=tree --engine=closure] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import GlobalEnv
+from my_native import native_table
+
+workloads = {
+    'fib': '''
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+print fib(25);
+''',
+    'loop': '''
+var i = 0;
+var total = 0;
+var step = 3;
+while (i < 200000) {
+  total = total + step;
+  i = i + 1;
+}
+print total;
+''',
+    'natives': '''
+var limit = 100000;
+fun work() {
+  var s = 0;
+  for (var i = 0; i < limit; i = i + 1) {
+    if (clock() > 0) s = s + 1;
+  }
+  return s;
+}
+print work();
+''',
+}
+
+def measure(source, engine, repeat):
+    best = None
+    for _ in range(repeat):
+        env = GlobalEnv()
+        env.values.update(native_table)
+        statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+        statements = my_lox.resolve(statements, Resolver(), True)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            my_lox.engines[engine](statements, env)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=['tree', 'closure'],
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or ['tree', 'closure']
+
+    print(f'{"":>10}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        print(f'{name:>10}' + ''.join(f'{measure(source, e, args.repeat):9.3f}s' for e in engines))
@@ -0,0 +1,56 @@
+
+'''
+类型推导测试：函数中只对局部变量做数值运算的循环，操作数类型都能被证明，各引擎不再检查类型
+numeric 中的运算都能证明；mixed 中 i * step 和 total - step 的操作数来自参数，仍然要检查
+
+python bench/bench_infer.py [--engine=tree --engine=vm ...] [--n=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+workloads = {
+    'numeric': '''
+fun run(n) {{
+  var total = 0;
+  for (var i = 0; i < n; i = i + 1) {{
+    total = total + i * 2 - i / 4;
+    if (total > 1000000) total = total - 1000000;
+  }}
+  return total;
+}}
+print run({n});
+''',
+    'mixed': '''
+fun run(n, step) {{
+  var total = 0;
+  for (var i = 0; i < n; i = i + 1) {{
+    total = total + i * step - i / 4;
+    if (total > 1000000) total = total - step;
+  }}
+  return total;
+}}
+print run({n}, 2);
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--n', type=int, default=200000, help='循环次数')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source.format(n=args.n), e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
@@ -0,0 +1,81 @@
+
+'''
+方法调用性能测试：craftinginterpreters 的 method_call 和 invocation 基准（缩小了迭代次数）
+
+python bench/bench_invoke.py [--engine=tree --engine=vm ...] [--n=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+method_call = '''
+class Toggle {{
+  init(startState) {{ this.state = startState; }}
+  value() {{ return this.state; }}
+  activate() {{
+    this.state = !this.state;
+    return this;
+  }}
+}}
+class NthToggle < Toggle {{
+  init(startState, maxCounter) {{
+    super.init(startState);
+    this.countMax = maxCounter;
+    this.count = 0;
+  }}
+  activate() {{
+    this.count = this.count + 1;
+    if (this.count >= this.countMax) {{
+      super.activate();
+      this.count = 0;
+    }}
+    return this;
+  }}
+}}
+var val = true;
+var toggle = Toggle(val);
+for (var i = 0; i < {n}; i = i + 1) {{
+''' + '  val = toggle.activate().value();\n' * 10 + '''}}
+print toggle.value();
+val = true;
+var ntoggle = NthToggle(val, 3);
+for (var i = 0; i < {n}; i = i + 1) {{
+''' + '  val = ntoggle.activate().value();\n' * 10 + '''}}
+print ntoggle.value();
+'''
+
+invocation = '''
+class Foo {{
+''' + ''.join(f'  method{i}() {{{{}}}}\n' for i in range(30)) + '''}}
+var foo = Foo();
+var i = 0;
+while (i < {n}) {{
+''' + ''.join(f'  foo.method{i}();\n' for i in range(30)) + '''  i = i + 1;
+}}
+'''
+
+workloads = {
+    'method_call': method_call,
+    'invocation': invocation,
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--n', type=int, default=3000, help='外层循环次数')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>11}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source.format(n=args.n), e, args.repeat) for e in engines]
+        print(f'{name:>11}' + ''.join(f'{t:9.3f}s' for t in times))
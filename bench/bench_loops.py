@@ -0,0 +1,59 @@
+
+'''
+循环性能测试：紧凑的数值 for 循环、嵌套 for 循环和循环体中声明变量的 while 循环
+
+python bench/bench_loops.py [--engine=tree --engine=vm ...] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+workloads = {
+    'tight': '''
+var total = 0;
+for (var i = 0; i < 300000; i = i + 1) {
+  total = total + i;
+}
+print total;
+''',
+    'nested': '''
+var n = 300;
+var total = 0;
+for (var i = 0; i < n; i = i + 1) {
+  for (var j = 0; j < n * 2; j = j + 1) {
+    total = total + i * j;
+  }
+}
+print total;
+''',
+    'body-var': '''
+var total = 0;
+var i = 0;
+while (i < 200000) {
+  var half = i / 2;
+  total = total + half;
+  i = i + 1;
+}
+print total;
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source, e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
@@ -0,0 +1,162 @@
+'''
+对象内存测试：解析一个生成的大脚本，用 tracemalloc 统计整棵语法树占用的字节数（平均到每个节点）；
+再逐个统计几种语法树节点、Token 和运行时的 Func、Instance、Env 每个对象的字节数，以及读取节点属性和执行树遍历解释器的速度
+
+python bench/bench_objects.py [--lines=N]
+'''
+
+import os
+import sys
+import time
+import timeit
+import argparse
+import tracemalloc
+import contextlib
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+import my_expr
+import my_stmt
+from my_token import Token
+from my_type import Func, Instance
+from my_env import Env, GlobalEnv
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_native import native_table
+
+snippet = '''
+fun f{i}(a, b) {{
+  var s = 0;
+  for (var j = 0; j < a; j = j + 1) {{
+    if (j > b and j != 3) s = s + j * 2; else s = s - 1;
+  }}
+  return s;
+}}
+class C{i} {{
+  init(x) {{ this.x = x; }}
+  get() {{ return this.x + f{i}(3, 1); }}
+}}
+print C{i}({i}).get();
+'''
+
+def fields(obj):
+    '''
+    对象的属性：有 __dict__ 时取 __dict__，否则取各层 __slots__ 中已经赋值的属性
+    '''
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        return d
+    result = {}
+    for cls in type(obj).__mro__:
+        for k in getattr(cls, '__slots__', ()):
+            if hasattr(obj, k):
+                result[k] = getattr(obj, k)
+    return result
+
+def allocated(make, n=100000):
+    '''
+    用 tracemalloc 统计 make() 创建的每个对象平均占用的字节数（不读取 __dict__，避免它被实际创建出来）
+    '''
+    objects = [None] * n
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        objects[i] = make()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size / n
+
+def walk(statements):
+    '''
+    返回语法树中的所有节点和 Token（按 id 去重）
+    '''
+    nodes = {}
+    tokens = {}
+    stack = list(statements)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, Token):
+            tokens[id(obj)] = obj
+        elif isinstance(obj, (my_expr.Expr, my_stmt.Stmt)) and id(obj) not in nodes:
+            nodes[id(obj)] = obj
+            stack.extend(fields(obj).values())
+    return list(nodes.values()), list(tokens.values())
+
+def parse(source):
+    env = GlobalEnv()
+    env.values.update(native_table)
+    statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+    return my_lox.resolve(statements, Resolver(), True), env
+
+def ast_memory(lines):
+    source = ''.join(snippet.format(i=i) for i in range(lines // snippet.count('\n') + 1))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    statements, _ = parse(source)
+    total = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    nodes, tokens = walk(statements)
+    print(f'source: {source.count(chr(10))} lines, {len(nodes)} nodes, {len(tokens)} tokens kept by the tree')
+    print(f'{"whole tree":>12}: {total / (1024 * 1024):7.2f} MB ({total / len(nodes):.1f} bytes per node, including tokens and lists)')
+    kinds = Counter(type(n).__name__ for n in nodes)
+    print('  ' + ', '.join(f'{k} {v}' for k, v in kinds.most_common(6)))
+
+def object_memory():
+    statements, env = parse(snippet.format(i=0))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        my_lox.exec_tree(statements, env)
+    function = statements[0]
+    cls = env.values['C0']
+    token = function.name
+    variable = my_expr.Variable(token)
+    literal = my_expr.Literal(1.0)
+    values = [None, None]
+    makers = [
+        ('Token', lambda: Token(token.type_, token.lexme, None, 1)),
+        ('Literal', lambda: my_expr.Literal(1.0)),
+        ('Variable', lambda: my_expr.Variable(token)),
+        ('Binary', lambda: my_expr.Binary(variable, token, literal)),
+        ('Call', lambda: my_expr.Call(variable, values, token)),
+        ('Var', lambda: my_stmt.Var(token, literal)),
+        ('Func', lambda: Func(function.name, function.parameters, function.body, env)),
+        ('Instance', lambda: Instance(cls)),
+        ('Env', lambda: Env(env, values)),
+    ]
+    for name, make in makers:
+        print(f'{name:>12}: {allocated(make):7.1f} bytes each')
+
+def access_speed():
+    statements, _ = parse('var a = 1; var b = 2; print a + b;')
+    node = statements[-1].expr
+    n = 1000000
+    t = min(timeit.repeat(lambda: (node.left, node.right, node.operator), number=n, repeat=5))
+    print(f'{"attribute":>12}: {t / (3 * n) * 1e9:7.1f} ns per read')
+    source = '''
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+var i = 0; var s = 0;
+while (i < 100000) { s = s + i; i = i + 1; }
+print fib(20) + s;
+'''
+    best = None
+    for _ in range(3):
+        statements, env = parse(source)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            my_lox.exec_tree(statements, env)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{"tree engine":>12}: {best:7.3f} s (fib(20) and a 100000-iteration loop)')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--lines', type=int, default=100000, help='生成的脚本行数')
+    args = arg_parser.parse_args()
+    ast_memory(args.lines)
+    object_memory()
+    access_speed()
@@ -0,0 +1,83 @@
+
+'''
+词法分析吞吐量测试：生成一个多 MB 的 lox 脚本，比较 Scanner 与 RegexScanner
+
+python bench/bench_scanner.py [--size=MB] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from my_scanner import Scanner, RegexScanner
+from my_env import GlobalEnv
+
+snippet = '''
+// generated block {i}
+class Point{i} < Base {{
+  init(x, y) {{
+    this.x = x;
+    this.y = y;
+  }}
+  length() {{
+    return this.x * this.x + this.y * this.y >= 12.5;
+  }}
+}}
+fun fib{i}(n) {{
+  if (n <= 1) return n;
+  return fib{i}(n - 2) + fib{i}(n - 1);
+}}
+var s{i} = "line {i}
+continued";
+for (var i = 0; i < 100; i = i + 1) {{
+  if (i != 3 and !(i == 4) or nil) print s{i};
+}}
+'''
+
+def generate(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = snippet.format(i=i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return ''.join(parts)
+
+def measure(scanner, src, repeat):
+    best = None
+    tokens = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = scanner(src, GlobalEnv()).scan_tokens()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, tokens
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=float, default=4, help='脚本大小（MB）')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    src = generate(int(args.size * 1024 * 1024))
+    mb = len(src.encode()) / (1024 * 1024)
+    print(f'source: {mb:.2f} MB')
+
+    results = {}
+    for name, scanner in [('char', Scanner), ('regex', RegexScanner)]:
+        elapsed, tokens = measure(scanner, src, args.repeat)
+        results[name] = (elapsed, tokens)
+        print(f'{name:>6}: {elapsed:8.3f} s  {mb / elapsed:8.2f} MB/s  {len(tokens)} tokens')
+
+    char_tokens = [(t.type_, t.lexme, t.literal, t.line) for t in results['char'][1]]
+    regex_tokens = [(t.type_, t.lexme, t.literal, t.line) for t in results['regex'][1]]
+    print(f'identical token stream: {char_tokens == regex_tokens}')
+    print(f'speedup: {results["char"][0] / results["regex"][0]:.1f}x')
+
@@ -0,0 +1,112 @@
+'''
+作用域合并测试：比较 Resolver 合并块作用域（flatten）前后 tree 和 closure 引擎的运行时间和创建的 Env 个数
+（vm 和 python 引擎不使用 Env 保存局部变量，不受影响）
+
+python bench/bench_scopes.py [--engine=tree --engine=closure] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import Env, GlobalEnv
+from my_native import native_table
+
+workloads = {
+    'blocks': '''
+fun clamp(x, lo, hi) {
+  if (x < lo) { var r = lo; return r; }
+  if (x > hi) { var r = hi; return r; }
+  { var r = x; return r; }
+}
+var total = 0;
+for (var i = 0; i < 100000; i = i + 1) {
+  total = total + clamp(i - 50000, -100, 100);
+}
+print total;
+''',
+    'nested': '''
+fun work(n) {
+  var s = 0;
+  for (var i = 0; i < n; i = i + 1) {
+    var a = i * 2;
+    for (var j = 0; j < 10; j = j + 1) {
+      var b = a + j;
+      if (b > 5) { var c = b - 5; s = s + c; } else { s = s + b; }
+    }
+  }
+  return s;
+}
+print work(20000);
+''',
+    'calls': '''
+fun add(a, b) { var c = a + b; return c; }
+var total = 0;
+var i = 0;
+while (i < 100000) {
+  total = add(total, i);
+  i = i + 1;
+}
+print total;
+''',
+}
+
+def prepare(source, flatten):
+    env = GlobalEnv()
+    env.values.update(native_table)
+    statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+    return my_lox.resolve(statements, Resolver(flatten), True), env
+
+def measure(source, engine, flatten, repeat):
+    best = None
+    for _ in range(repeat):
+        statements, env = prepare(source, flatten)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            my_lox.engines[engine](statements, env)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def allocations(source, engine, flatten):
+    '''
+    单独运行一次，统计创建的 Env 个数（计数会拖慢执行，不与计时一起做）
+    '''
+    statements, env = prepare(source, flatten)
+    count = 0
+    init = Env.__init__
+    def counting_init(self, enclosing, values):
+        nonlocal count
+        count += 1
+        init(self, enclosing, values)
+    Env.__init__ = counting_init
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            my_lox.engines[engine](statements, env)
+    finally:
+        Env.__init__ = init
+    return count
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=['tree', 'closure'],
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or ['tree', 'closure']
+
+    print(f'{"":>16}' + ''.join(f'{e:>10}{"Env":>10}' for e in engines))
+    for name, source in workloads.items():
+        for flatten in [False, True]:
+            label = f'{name} {"flatten" if flatten else "scopes"}'
+            cells = [f'{measure(source, e, flatten, args.repeat):9.3f}s{allocations(source, e, flatten):>10}' for e in engines]
+            print(f'{label:>16}' + ''.join(cells))
@@ -0,0 +1,124 @@
+
+'''
+实例字段测试：craftinginterpreters 的 binary_trees 和 properties 基准（缩小了规模），以及每个实例占用的内存
+
+python bench/bench_shapes.py [--engine=tree --engine=vm ...] [--depth=N] [--n=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import GlobalEnv
+from my_native import native_table
+from bench_engine import measure
+
+binary_trees = '''
+class Tree {{
+  init(item, depth) {{
+    this.item = item;
+    this.depth = depth;
+    if (depth > 0) {{
+      var item2 = item + item;
+      depth = depth - 1;
+      this.left = Tree(item2 - 1, depth);
+      this.right = Tree(item2, depth);
+    }} else {{
+      this.left = nil;
+      this.right = nil;
+    }}
+  }}
+  check() {{
+    if (this.left == nil) return this.item;
+    return this.item + this.left.check() - this.right.check();
+  }}
+}}
+var minDepth = 4;
+var maxDepth = {depth};
+var stretchDepth = maxDepth + 1;
+print Tree(0, stretchDepth).check();
+var longLivedTree = Tree(0, maxDepth);
+var iterations = 1;
+var d = 0;
+while (d < maxDepth) {{
+  iterations = iterations * 2;
+  d = d + 1;
+}}
+d = minDepth;
+while (d < stretchDepth) {{
+  var check = 0;
+  for (var i = 1; i <= iterations; i = i + 1) {{
+    check = check + Tree(i, d).check() + Tree(-i, d).check();
+  }}
+  print check;
+  iterations = iterations / 4;
+  d = d + 2;
+}}
+print longLivedTree.check();
+'''
+
+properties = '''
+class Foo {{
+  init() {{
+''' + ''.join(f'    this.field{i} = {i};\n' for i in range(10)) + '''  }}
+''' + ''.join(f'  method{i}() {{{{ return this.field{i}; }}}}\n' for i in range(10)) + '''}}
+var foo = Foo();
+var i = 0;
+var total = 0;
+while (i < {n}) {{
+''' + ''.join(f'  total = total + foo.method{i}();\n' for i in range(10)) + '''  i = i + 1;
+}}
+print total;
+'''
+
+workloads = {
+    'binary_trees': binary_trees,
+    'properties': properties,
+}
+
+chain = '''
+class Node {{ init(next) {{ this.next = next; this.a = 1; this.b = 2; }} }}
+var head = nil;
+for (var i = 0; i < {n}; i = i + 1) head = Node(head);
+'''
+
+def bytes_per_instance(n):
+    '''
+    树遍历引擎执行后全局变量 head 持有 n 个各有 3 个字段的实例，用 2n 和 n 个实例时内存的差除以 n
+    '''
+    def traced(count):
+        env = GlobalEnv()
+        env.values.update(native_table)
+        source = chain.format(n=count)
+        statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+        statements = my_lox.resolve(statements, Resolver(), True)
+        tracemalloc.start()
+        my_lox.engines['tree'](statements, env)
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return current
+    return (traced(2 * n) - traced(n)) / n
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--depth', type=int, default=10, help='binary_trees 的 maxDepth')
+    arg_parser.add_argument('--n', type=int, default=20000, help='properties 的循环次数')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>12}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        times = [measure(source.format(depth=args.depth, n=args.n), e, args.repeat) for e in engines]
+        print(f'{name:>12}' + ''.join(f'{t:9.3f}s' for t in times))
+    print(f'每个实例（3 个字段）占用 {bytes_per_instance(10000):.0f} 字节')
@@ -0,0 +1,76 @@
+
+'''
+流式执行内存测试：生成一个大脚本，分别用整体读入和 --stream 方式运行，比较 tracemalloc 峰值
+
+python bench/bench_stream.py [--size=MB]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+header = '''
+var total = 0;
+fun add(a, b) {
+  return a + b * 2 - 1;
+}
+'''
+
+# 每段都只读写同一批全局变量，脚本运行时真正需要保留的数据量不随脚本变大
+snippet = '''
+total = add(total, {i});
+if (total > 100 and total != 7) print "big {i}"; else print total;
+{{ var local = "block {i}"; print local; }}
+'''
+
+def generate(path, size):
+    total = 0
+    i = 0
+    with open(path, 'w') as f:
+        f.write(header)
+        while total < size:
+            part = snippet.format(i=i)
+            f.write(part)
+            total += len(part)
+            i += 1
+
+def measure(path, stream):
+    import tracemalloc
+    import my_lox
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        my_lox.run_file(path, stream=stream)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(f'{elapsed} {peak}')
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=float, default=1, help='脚本大小（MB）')
+    arg_parser.add_argument('--measure', choices=['file', 'stream'], help=argparse.SUPPRESS)
+    arg_parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.path, args.measure == 'stream')
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'big.lox')
+        generate(path, int(args.size * 1024 * 1024))
+        print(f'source: {os.path.getsize(path) / (1024 * 1024):.2f} MB')
+        for mode in ['file', 'stream']:
+            # 每种模式在独立进程里运行，互不影响峰值统计
+            out = subprocess.run([sys.executable, __file__, f'--measure={mode}', f'--path={path}'],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            elapsed, peak = float(out[0]), int(out[1])
+            print(f'{mode:>6}: {elapsed:8.2f} s  peak {peak / (1024 * 1024):8.1f} MB')
+
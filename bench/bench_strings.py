@@ -0,0 +1,51 @@
+
+'''
+字符串拼接测试：在循环中逐行拼接出一个大字符串（默认 10 MB，每行 100 个字符）后打印
+append 在末尾追加，prepend 在开头插入
+
+python bench/bench_strings.py [--engine=tree --engine=vm ...] [--size=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+line = '0123456789' * 10
+
+workloads = {
+    'append': '''
+var s = "";
+for (var i = 0; i < {n}; i = i + 1) {{
+  s = s + "{line}";
+}}
+print s;
+''',
+    'prepend': '''
+var s = "";
+for (var i = 0; i < {n}; i = i + 1) {{
+  s = "{line}" + s;
+}}
+print s;
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--size', type=int, default=10 * 1000 * 1000, help='拼接出的字符串长度')
+    arg_parser.add_argument('--repeat', type=int, default=1, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        source = source.format(n=args.size // 100, line=line)
+        times = [measure(source, e, args.repeat) for e in engines]
+        print(f'{name:>8}' + ''.join(f'{t:9.3f}s' for t in times))
@@ -0,0 +1,66 @@
+
+'''
+尾调用测试：各引擎执行远超调用深度上限的尾递归（默认一百万层），尾调用不加深调用栈时才能执行完
+python 引擎只消除自身的尾调用，相互递归超过上限时报告 Stack overflow.
+
+python bench/bench_tail.py [--engine=tree --engine=vm ...] [--depth=N] [--repeat=N]
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+from bench_engine import measure
+
+workloads = {
+    'self': '''
+fun count(n, acc) {{
+  if (n == 0) return acc;
+  return count(n - 1, acc + 1);
+}}
+print count({depth}, 0);
+''',
+    'mutual': '''
+fun even(n) {{
+  if (n == 0) return true;
+  return odd(n - 1);
+}}
+fun odd(n) {{
+  if (n == 0) return false;
+  return even(n - 1);
+}}
+print even({depth});
+''',
+    'method': '''
+class Counter {{
+  run(n) {{
+    if (n == 0) return "done";
+    return this.run(n - 1);
+  }}
+}}
+print Counter().run({depth});
+''',
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=my_lox.engines.keys(),
+                            help='要测试的引擎，默认测试全部')
+    arg_parser.add_argument('--depth', type=int, default=1000000, help='尾递归深度')
+    arg_parser.add_argument('--repeat', type=int, default=1, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    print(f'{"":>8}' + ''.join(f'{e:>10}' for e in engines))
+    for name, source in workloads.items():
+        cells = []
+        for engine in engines:
+            try:
+                cells.append(f'{measure(source.format(depth=args.depth), engine, args.repeat):9.3f}s')
+            except RuntimeError: # 错误信息已经打印到被丢弃的输出中
+                cells.append(f'{"overflow":>10}')
+        print(f'{name:>8}' + ''.join(cells))
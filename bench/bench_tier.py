@@ -0,0 +1,102 @@
+'''
+分层执行测试：比较 tree 引擎和 tiered 引擎（在主线程或后台线程中翻译热函数）的运行时间，以及翻译了几个函数
+tiered 引擎的时间包括统计、翻译和退回树遍历解释器的开销
+
+python bench/bench_tier.py [--threshold=N] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+import functools
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+import my_tier
+from my_parser import Parser
+from my_resolver import Resolver
+from my_scanner import RegexScanner
+from my_env import GlobalEnv
+from my_native import native_table
+
+workloads = {
+    'fib': '''
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+print fib(22);
+''',
+    'loops': '''
+fun work(n) {
+  var s = 0;
+  for (var i = 0; i < n; i = i + 1) {
+    if (i / 2 > 10) s = s + i; else s = s - 1;
+  }
+  return s;
+}
+var total = 0;
+for (var k = 0; k < 20; k = k + 1) total = total + work(10000);
+print total;
+''',
+    'methods': '''
+class Vec {
+  init(x, y) { this.x = x; this.y = y; }
+  add(other) { return Vec(this.x + other.x, this.y + other.y); }
+  dot(other) { return this.x * other.x + this.y * other.y; }
+}
+fun run(n) {
+  var p = Vec(0, 0);
+  var d = Vec(1, 2);
+  var s = 0;
+  for (var i = 0; i < n; i = i + 1) { p = p.add(d); s = s + p.dot(d); }
+  return s;
+}
+print run(30000);
+''',
+    'deopt': '''
+fun one() { return 1; }
+fun two() { return 2; }
+fun use() { return one() + 1; }
+var s = 0;
+for (var i = 0; i < 60000; i = i + 1) {
+  s = s + use();
+  if (i == 20000) one = two;
+}
+print s;
+''',
+}
+
+def measure(source, engine, repeat):
+    best = None
+    for _ in range(repeat):
+        env = GlobalEnv()
+        env.values.update(native_table)
+        statements = Parser(RegexScanner(source, env).scan_tokens(), env).parse()
+        statements = my_lox.resolve(statements, Resolver(), True)
+        my_tier.hot.clear()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            engine(statements, env)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--threshold', type=int, default=my_tier.THRESHOLD, help='tiered 引擎的阈值')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+    engines = {
+        'tree': my_lox.exec_tree,
+        'sync': functools.partial(my_lox.exec_tiered, threshold=args.threshold, background=False),
+        'background': functools.partial(my_lox.exec_tiered, threshold=args.threshold, background=True),
+    }
+
+    print(f'{"":>8}' + ''.join(f'{e:>11}' for e in engines) + f'{"compiled":>10}{"deopts":>8}')
+    for name, source in workloads.items():
+        times = [measure(source, engine, args.repeat) for engine in engines.values()]
+        compiled = sum(body.code is not None for body in my_tier.hot)
+        deopts = sum(body.deopts for body in my_tier.hot)
+        print(f'{name:>8}' + ''.join(f'{t:10.3f}s' for t in times) + f'{compiled:>10}{deopts:>8}')
@@ -0,0 +1,49 @@
+
+'''
+Token 内存测试：用 tracemalloc 统计 Token 列表（RegexScanner）和 TokenBuffer（CompactScanner）的每个 Token 字节数
+
+python bench/bench_tokens.py [--size=MB]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from my_scanner import RegexScanner, CompactScanner
+from my_parser import Parser
+from my_env import GlobalEnv
+from bench_scanner import generate
+
+def measure(scanner, src):
+    start = time.perf_counter()
+    tokens = scanner(src, GlobalEnv()).scan_tokens()
+    scan_time = time.perf_counter() - start
+    del tokens
+    # tracemalloc 会明显拖慢扫描，内存单独再扫描一次统计
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tokens = scanner(src, GlobalEnv()).scan_tokens()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    start = time.perf_counter()
+    statements = Parser(tokens, GlobalEnv()).parse()
+    parse_time = time.perf_counter() - start
+    return len(tokens), size, scan_time, parse_time, len(statements)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=float, default=4, help='脚本大小（MB）')
+    args = arg_parser.parse_args()
+
+    src = generate(int(args.size * 1024 * 1024))
+    print(f'source: {len(src.encode()) / (1024 * 1024):.2f} MB')
+    for name, scanner in [('list', RegexScanner), ('buffer', CompactScanner)]:
+        count, size, scan_time, parse_time, statements = measure(scanner, src)
+        print(f'{name:>6}: {count} tokens  {size / (1024 * 1024):8.1f} MB  {size / count:6.1f} bytes/token'
+              f'  scan {scan_time:.2f} s  parse {parse_time:.2f} s  {statements} statements')
+
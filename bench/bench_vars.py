@@ -0,0 +1,99 @@
+
+'''
+变量访问性能测试：局部变量读写密集的循环，分别访问当前作用域和外层若干层的变量
+
+python bench/bench_vars.py [--engine=tree] [--repeat=N]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import my_lox
+
+workloads = {
+    # 变量都在同一层作用域
+    'local': '''
+fun work() {
+  var a = 0;
+  var b = 1;
+  var i = 0;
+  while (i < 100000) {
+    a = a + b;
+    b = a - b;
+    i = i + 1;
+  }
+  return a;
+}
+print work();
+''',
+    # 循环体是新的块作用域，读写的变量在外面三层
+    'nested': '''
+fun work() {
+  var a = 0;
+  var i = 0;
+  {
+    var b = 2;
+    {
+      var c = 3;
+      while (i < 100000) {
+        var t = a + b + c;
+        a = t - b - c + 1;
+        i = i + 1;
+      }
+    }
+  }
+  return a;
+}
+print work();
+''',
+    # 闭包读写外层函数的变量
+    'closure': '''
+fun make() {
+  var n = 0;
+  var step = 1;
+  fun inc() {
+    n = n + step;
+    return n;
+  }
+  return inc;
+}
+var inc = make();
+var i = 0;
+while (i < 50000) {
+  inc();
+  i = i + 1;
+}
+print inc();
+''',
+}
+
+def measure(path, engine, repeat):
+    kwargs = {} if engine is None else {'engine': my_lox.engines[engine]}
+    best = None
+    for _ in range(repeat):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.process_time()
+            my_lox.run_file(path, **kwargs)
+            elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', help='执行引擎，默认使用 my_lox.py 的默认引擎')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快的一次')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, source in workloads.items():
+            path = os.path.join(tmp, f'{name}.lox')
+            with open(path, 'w') as f:
+                f.write(source)
+            print(f'{name:>8}: {measure(path, args.engine, args.repeat):8.3f} s')
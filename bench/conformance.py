@@ -0,0 +1,59 @@
+
+'''
+一致性测试：用各个执行引擎运行 test.lox 和 bench/corpus 下的脚本，输出必须与不做常量折叠的树遍历解释器完全相同
+流式运行时出错前执行的声明可能更多，另外检查报告的错误与整体解析时相同
+基准运行不做折叠；折叠后第一个引擎运行时写入编译缓存（临时目录），其它引擎从缓存加载，同时检查缓存的语法树与现场解析的一致
+
+python bench/conformance.py [--engine=vm ...] [--stream]
+'''
+
+import io
+import os
+import sys
+import glob
+import argparse
+import tempfile
+import contextlib
+from unittest import mock
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import my_lox
+
+def output(path, engine, stream, cache_dir, optimize=True):
+    buffer = io.StringIO()
+    # clock 的返回值每次都不同，固定下来才能逐字比较
+    with contextlib.redirect_stdout(buffer), mock.patch('time.time', return_value=0.0):
+        try:
+            my_lox.run_file(path, stream=stream, engine=my_lox.engines[engine], cache_dir=cache_dir,
+                              optimize=optimize)
+        except RuntimeError: # 错误信息已经打印，比较到出错为止的输出
+            pass
+    return buffer.getvalue()
+
+def errors(text):
+    return [line for line in text.splitlines() if ' error' in line]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--engine', action='append', choices=list(my_lox.engines),
+                            help='要检查的引擎，默认检查全部')
+    arg_parser.add_argument('--stream', action='store_true', help='以流式方式运行')
+    args = arg_parser.parse_args()
+    engines = args.engine or list(my_lox.engines)
+
+    paths = [os.path.join(root, 'test.lox')] + sorted(glob.glob(os.path.join(root, 'bench', 'corpus', '*.lox')))
+    failed = 0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for path in paths:
+            expected = output(path, 'tree', args.stream, cache_dir, False)
+            if args.stream and errors(expected) != errors(output(path, 'tree', False, cache_dir, False)):
+                print(f'FAIL   stream: {os.path.relpath(path, root)}')
+                failed += 1
+            for engine in engines:
+                if output(path, engine, args.stream, cache_dir) != expected:
+                    print(f'FAIL {engine:>8}: {os.path.relpath(path, root)}')
+                    failed += 1
+    print(f'{len(paths)} scripts, {len(engines)} engines, {failed} failed')
+    sys.exit(1 if failed else 0)
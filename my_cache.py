@@ -0,0 +1,90 @@
+
+import gc
+import os
+import sys
+import pickle
+import hashlib
+
+from my_env import recursion_limit, safe_frames
+
+'''
+编译缓存：扫描、解析、变量解析之后的语句列表用 pickle 保存，默认放在脚本所在目录的 __loxcache__ 下
+缓存文件 = MAGIC + 解释器版本摘要 + 优化开关 + 源码摘要 + pickle 数据，加载时只比较文件头，不一致就当作没有缓存
+缓存文件按 pickle 加载，只应指向自己可信的目录
+'''
+
+MAGIC = b'LOXC'
+CACHE_DIR = '__loxcache__'
+
+# 语法树和运行时对象的定义都在这些模块中，任何一个改动都会让旧缓存失效
+ast_modules = ['my_token', 'my_scanner', 'my_parser', 'my_expr', 'my_stmt', 'my_resolver', 'my_optimizer', 'my_infer', 'my_type', 'my_env']
+
+version = None
+
+def interpreter_version():
+    global version
+    if version is None:
+        digest = hashlib.sha1(f'{sys.version_info[:2]}'.encode())
+        for name in ast_modules:
+            module = sys.modules.get(name) or __import__(name)
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        version = digest.digest()
+    return version
+
+def source_hash(src):
+    return hashlib.sha256(src.encode('utf-8', 'surrogatepass')).digest()
+
+def cache_path(path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    return os.path.join(cache_dir, os.path.basename(path) + '.cache')
+
+def header(src, optimize):
+    # 折叠前后的语法树不同，开关也是文件头的一部分
+    return MAGIC + interpreter_version() + bytes([optimize]) + source_hash(src)
+
+def load(path, src, cache_dir=None, optimize=True):
+    '''
+    返回缓存的语句列表，没有有效缓存时返回 None
+    '''
+    try:
+        with open(cache_path(path, cache_dir), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    expected = header(src, optimize)
+    if data[:len(expected)] != expected:
+        return None
+    # 反序列化会一次性创建大量对象，暂停 GC 避免反复触发无用的回收
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(data[len(expected):])
+    except Exception: # 缓存文件损坏
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+
+def store(path, src, statements, cache_dir=None, optimize=True):
+    '''
+    写入缓存；目录不可写或语法树嵌套过深无法 pickle 时直接放弃
+    pickle 每层节点要递归四次左右，默认的递归限制下几百项的 a + a + ... 或几百个 else if 就会失败，
+    所以按栈大小放宽限制；pickle 的递归占用 C 栈，3.11 起 recursion_limit 不再封顶，这里自己算出不超过 safe_frames() 的放宽层数
+    （加载不递归，不需要放宽）
+    '''
+    out = cache_path(path, cache_dir)
+    try:
+        with recursion_limit(max(0, safe_frames() - sys.getrecursionlimit())):
+            data = header(src, optimize) + pickle.dumps(statements, pickle.HIGHEST_PROTOCOL)
+    except (RecursionError, pickle.PicklingError):
+        return
+    try:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        tmp = f'{out}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, out) # 先写临时文件再替换，并发运行同一脚本时不会读到写了一半的缓存
+    except OSError:
+        pass
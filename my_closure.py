@@ -0,0 +1,668 @@
+
+from my_type import Func, Cls, Instance, Cell, ReturnValue, TailCall, BREAK, CONTINUE, strings, concat
+from my_env import Env, UNDEFINED
+import my_expr
+import my_stmt
+
+class CompiledFunc(Func):
+    '''
+    函数体是 ClosureCompiler 生成的 Python 闭包，其余行为与 Func 相同
+    '''
+    __slots__ = ()
+
+    def call(self, arguments):
+        function = self
+        while True:
+            for slot in function.boxed:
+                arguments[slot] = Cell(arguments[slot])
+            arguments += function.padding
+            env = Env(function.env, arguments)
+            result = function.body(env)
+            if function.is_init:
+                return function.env.values[0]
+            if result is None:
+                return None
+            if type(result) is ReturnValue:
+                return result.value
+            function = result.function
+            arguments = result.arguments
+            if type(function) is not CompiledFunc:
+                return function.call(arguments)
+
+    def invoke(self, instance, arguments):
+        for slot in self.boxed:
+            arguments[slot] = Cell(arguments[slot])
+        arguments += self.padding
+        env = Env(Env(self.env, [instance]), arguments)
+        result = self.body(env)
+        if self.is_init:
+            return instance
+        if result is None:
+            return None
+        if type(result) is ReturnValue:
+            return result.value
+        return result.function.call(result.arguments)
+
+    def bind(self, instance):
+        env = Env(self.env, [instance])
+        return CompiledFunc(self.name, self.parameters, self.body, env, self.is_init, self.boxed, self.padding)
+
+class ClosureCompiler:
+    '''
+    把经过 Resolver 处理的语法树一次性翻译成嵌套的 Python 闭包，每个闭包接收 env 参数
+    语句闭包的返回值与 Stmt.exec 相同：None、ReturnValue、TailCall、BREAK 或 CONTINUE
+    运算符、变量的距离和槽位、字面量都在翻译时确定并绑定到闭包中，执行时不再按节点类型或运算符分派
+    '''
+    def __init__(self):
+        self.invariants = {} # Invariant 节点 -> 缓存它的值的列表，所在循环开始时清空
+        self.stmt_table = {
+            my_stmt.Expression: self.expression_stmt,
+            my_stmt.Print: self.print_stmt,
+            my_stmt.Var: self.var_stmt,
+            my_stmt.Block: self.block_stmt,
+            my_stmt.If: self.if_stmt,
+            my_stmt.While: self.while_stmt,
+            my_stmt.For: self.for_stmt,
+            my_stmt.Function: self.function_stmt,
+            my_stmt.Return: self.return_stmt,
+            my_stmt.Break: self.break_stmt,
+            my_stmt.Continue: self.continue_stmt,
+            my_stmt.Class: self.class_stmt,
+        }
+        self.expr_table = {
+            my_expr.Literal: self.literal,
+            my_expr.Unary: self.unary,
+            my_expr.Binary: self.binary,
+            my_expr.Logical: self.logical,
+            my_expr.Grouping: self.grouping,
+            my_expr.Invariant: self.invariant,
+            my_expr.Variable: self.variable,
+            my_expr.Assign: self.assign,
+            my_expr.This: self.variable,
+            my_expr.Super: self.super,
+            my_expr.Call: self.call,
+            my_expr.Get: self.get,
+            my_expr.Set: self.set,
+        }
+
+    def compile(self, statements):
+        '''
+        返回执行整个程序的函数：最后一条语句是表达式语句时返回它的值（命令行模式会打印）
+        '''
+        compiled = [self.stmt(statement) for statement in statements]
+        if len(statements) > 0 and isinstance(statements[-1], my_stmt.Expression):
+            compiled[-1] = self.expr(statements[-1].expr)
+        def program(env):
+            value = None
+            for statement in compiled:
+                value = statement(env)
+            return value
+        return program
+
+    # ---------------- 语句 ----------------
+
+    def stmt(self, stmt):
+        return self.stmt_table[type(stmt)](stmt)
+
+    def expression_stmt(self, stmt):
+        expr = self.expr(stmt.expr)
+        def expression(env):
+            expr(env)
+        return expression
+
+    def print_stmt(self, stmt):
+        expr = self.expr(stmt.expr)
+        def print_(env):
+            print(f'{expr(env)}')
+        return print_
+
+    def declare(self, name, slot, value, cell=False):
+        '''
+        把 value(env) 的结果存入新声明的变量：顶层声明存入全局表，否则存入当前作用域的槽位
+        cell 为 True 时变量被内层函数捕获，先在槽位中放入 Cell（函数和类引用自己时捕获的是它）再求值
+        '''
+        if slot is None:
+            def define(env):
+                env.define(name, value(env))
+        elif cell:
+            def define(env):
+                box = env.values[slot] = Cell(None)
+                box.value = value(env)
+        else:
+            def define(env):
+                env.values[slot] = value(env)
+        return define
+
+    def var_stmt(self, stmt):
+        if stmt.initializer is None:
+            return self.declare(stmt.name, stmt.slot, lambda env: None, stmt.cell)
+        return self.declare(stmt.name, stmt.slot, self.expr(stmt.initializer), stmt.cell)
+
+    def block_stmt(self, stmt):
+        statements = [self.stmt(statement) for statement in stmt.statements]
+        size = stmt.size
+        if size is None: # 变量合并到外层的 Env 中
+            def block(env):
+                for statement in statements:
+                    result = statement(env)
+                    if result is not None:
+                        return result
+            return block
+        def block(env):
+            env = Env(env, [None] * size)
+            for statement in statements:
+                result = statement(env)
+                if result is not None:
+                    return result
+        return block
+
+    def if_stmt(self, stmt):
+        condition = self.expr(stmt.condition)
+        then_branch = self.stmt(stmt.then_branch)
+        if stmt.else_branch is None:
+            def if_(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    return then_branch(env)
+        else:
+            else_branch = self.stmt(stmt.else_branch)
+            def if_(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    return then_branch(env)
+                return else_branch(env)
+        return if_
+
+    def loop_body(self, stmt):
+        '''
+        返回 (循环体, 进入循环时调用的函数)：后者清空不变表达式的缓存，返回执行循环体的 Env
+        循环体是 Block 时，整个循环复用同一个 Env，循环体的变量合并到外层的 Env 中时直接使用外层的 Env
+        '''
+        if stmt.reuse:
+            statements = [self.stmt(statement) for statement in stmt.body.statements]
+            size = stmt.body.size
+            def body(env):
+                for statement in statements:
+                    result = statement(env)
+                    if result is not None:
+                        return result
+        else:
+            body = self.stmt(stmt.body)
+            size = None
+        caches = [self.invariants[invariant] for invariant in stmt.invariants]
+        def enter(env):
+            for cache in caches:
+                cache.clear()
+            if size is None:
+                return env
+            return Env(env, [None] * size)
+        return body, enter
+
+    def while_stmt(self, stmt):
+        condition = self.expr(stmt.condition)
+        body, enter = self.loop_body(stmt)
+        def while_(env):
+            body_env = enter(env)
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    break
+                result = body(body_env)
+                if result is not None and result is not CONTINUE:
+                    if result is BREAK:
+                        break
+                    return result
+        return while_
+
+    def for_stmt(self, stmt):
+        initializer = None if stmt.initializer is None else self.stmt(stmt.initializer)
+        condition = (lambda env: True) if stmt.condition is None else self.expr(stmt.condition)
+        increment = (lambda env: None) if stmt.increment is None else self.expr(stmt.increment)
+        body, enter = self.loop_body(stmt)
+        size = stmt.size
+        def for_(env):
+            if size is not None:
+                env = Env(env, [None] * size)
+            if initializer is not None:
+                initializer(env)
+            body_env = enter(env)
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    break
+                result = body(body_env)
+                if result is not None and result is not CONTINUE:
+                    if result is BREAK:
+                        break
+                    return result
+                increment(env)
+        return for_
+
+    def function(self, stmt, is_init=False):
+        '''
+        返回创建函数对象的闭包，参数是函数捕获的 Cell 组成的 Env
+        '''
+        name = stmt.name
+        parameters = stmt.parameters
+        body = self.stmt(stmt.body)
+        boxed = stmt.boxed
+        padding = stmt.padding
+        return lambda upvalues: CompiledFunc(name, parameters, body, upvalues, is_init, boxed, padding)
+
+    def function_stmt(self, stmt):
+        function = self.function(stmt)
+        upvalues = stmt.upvalues
+        return self.declare(stmt.name, stmt.slot, lambda env: function(env.capture(upvalues)), stmt.cell)
+
+    def return_stmt(self, stmt):
+        if stmt.expr is None:
+            def return_(env):
+                return ReturnValue(None)
+        elif stmt.tail:
+            return self.tail_call(stmt.expr)
+        else:
+            expr = self.expr(stmt.expr)
+            def return_(env):
+                return ReturnValue(expr(env))
+        return return_
+
+    def break_stmt(self, stmt):
+        return lambda env: BREAK
+
+    def continue_stmt(self, stmt):
+        return lambda env: CONTINUE
+
+    def class_stmt(self, stmt):
+        name = stmt.name
+        methods = [(method.name.lexme, self.function(method, method.name.lexme == 'init')) for method in stmt.methods]
+        upvalues = stmt.upvalues
+        if stmt.sp is None:
+            def cls(env):
+                captured = env.capture(upvalues)
+                return Cls(name, None, {k: method(captured) for k, method in methods})
+        else:
+            sp_name = stmt.sp.name
+            superclass = self.expr(stmt.sp)
+            def cls(env):
+                sp = superclass(env)
+                if not isinstance(sp, Cls):
+                    env.runtime_error(sp_name, 'Superclass must be a class.')
+                captured = Env(env, [sp]).capture(upvalues)
+                return Cls(name, sp, {k: method(captured) for k, method in methods})
+        return self.declare(name, stmt.slot, cls, stmt.cell)
+
+    # ---------------- 表达式 ----------------
+
+    def expr(self, expr):
+        return self.expr_table[type(expr)](expr)
+
+    def literal(self, expr):
+        value = expr.value
+        return lambda env: value
+
+    def grouping(self, expr):
+        return self.expr(expr.expr)
+
+    def invariant(self, expr):
+        value = self.expr(expr.expr)
+        cache = self.invariants[expr] = []
+        def invariant(env):
+            if cache:
+                return cache[0]
+            v = value(env)
+            cache.append(v)
+            return v
+        return invariant
+
+    def unary(self, expr):
+        right = self.expr(expr.right)
+        operator = expr.operator
+        if operator.lexme == '-' and expr.proven is float:
+            return lambda env: -right(env)
+        if operator.lexme == '-':
+            def negate(env):
+                value = right(env)
+                if type(value) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return -value
+            return negate
+        def not_(env):
+            value = right(env)
+            return value is None or value is False
+        return not_
+
+    def binary(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        operator = expr.operator
+        op = operator.lexme
+        if expr.proven is not None:
+            return self.unchecked(op, expr.proven, left, right)
+        if op == '+':
+            def add(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a + b
+                if type(a) in strings and type(b) in strings:
+                    return concat(a, b)
+                env.runtime_error(operator, 'Operands must be two numbers or two strings.')
+            return add
+        if op == '-':
+            def subtract(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a - b
+            return subtract
+        if op == '*':
+            def multiply(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a * b
+            return multiply
+        if op == '/':
+            def divide(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a / b
+            return divide
+        if op == '>':
+            def greater(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a > b
+            return greater
+        if op == '>=':
+            def greater_equal(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a >= b
+            return greater_equal
+        if op == '<':
+            def less(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a < b
+            return less
+        if op == '<=':
+            def less_equal(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is not float or type(b) is not float:
+                    env.runtime_error(operator, 'Operand must be a number.')
+                return a <= b
+            return less_equal
+        if op == '!=':
+            return lambda env: left(env) != right(env)
+        return lambda env: left(env) == right(env)
+
+    def unchecked(self, op, proven, left, right):
+        '''
+        操作数类型已由 Inferrer 证明的运算
+        '''
+        if op == '+':
+            if proven is str:
+                return lambda env: concat(left(env), right(env))
+            return lambda env: left(env) + right(env)
+        if op == '-':
+            return lambda env: left(env) - right(env)
+        if op == '*':
+            return lambda env: left(env) * right(env)
+        if op == '/':
+            return lambda env: left(env) / right(env)
+        if op == '>':
+            return lambda env: left(env) > right(env)
+        if op == '>=':
+            return lambda env: left(env) >= right(env)
+        if op == '<':
+            return lambda env: left(env) < right(env)
+        return lambda env: left(env) <= right(env)
+
+    def logical(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        if expr.operator.lexme == 'or':
+            def or_(env):
+                value = left(env)
+                if value is None or value is False:
+                    return right(env)
+                return value
+            return or_
+        def and_(env):
+            value = left(env)
+            if value is None or value is False:
+                return value
+            return right(env)
+        return and_
+
+    def variable(self, expr):
+        '''
+        Variable 和 This：按 Resolver 给出的距离生成对应的取值闭包，被捕获的变量再从 Cell 中取值
+        '''
+        name = expr.name
+        distance = expr.distance
+        slot = expr.slot
+        if expr.cell:
+            if distance == 0:
+                return lambda env: env.values[slot].value
+            if distance == 1:
+                return lambda env: env.enclosing.values[slot].value
+            return lambda env: env.get_at(distance, slot).value
+        if distance is None:
+            k = name.lexme
+            cache = [None, None] # 与 Variable 的缓存相同：全局变量表和槽位
+            def get_global(env):
+                table = env.global_env.table
+                if table is not cache[0]:
+                    cache[1] = env.global_env.slot(k)
+                    cache[0] = table
+                v = table[cache[1]]
+                if v is UNDEFINED:
+                    env.runtime_error(name, f'Undefined variable {k}.')
+                return v
+            return get_global
+        if distance == 0:
+            return lambda env: env.values[slot]
+        if distance == 1:
+            return lambda env: env.enclosing.values[slot]
+        return lambda env: env.get_at(distance, slot)
+
+    def assign(self, expr):
+        value = self.expr(expr.expr)
+        name = expr.name
+        distance = expr.distance
+        slot = expr.slot
+        if distance is None:
+            k = name.lexme
+            cache = [None, None]
+            def assign_global(env):
+                v = value(env)
+                global_env = env.global_env
+                table = global_env.table
+                if table is not cache[0]:
+                    cache[1] = global_env.slot(k)
+                    cache[0] = table
+                if table[cache[1]] is UNDEFINED:
+                    env.runtime_error(name, f'Undefined variable {k}.')
+                table[cache[1]] = v
+                global_env.values[k] = v
+                return v
+            return assign_global
+        if expr.cell:
+            def assign_cell(env):
+                v = env.get_at(distance, slot).value = value(env)
+                return v
+            return assign_cell
+        if distance == 0:
+            def assign_local(env):
+                v = env.values[slot] = value(env)
+                return v
+            return assign_local
+        def assign_at(env):
+            v = value(env)
+            env.assign_at(distance, slot, v)
+            return v
+        return assign_at
+
+    def super(self, expr):
+        distance = expr.distance
+        slot = expr.slot
+        method_name = expr.method
+        get_this = self.variable(expr.this)
+        def super_(env):
+            sp = env.get_at(distance, slot)
+            this = get_this(env)
+            method = sp.get_method(method_name.lexme)
+            if method is None:
+                env.runtime_error(method_name, f'Undefined property {method_name}.')
+            return method.bind(this)
+        return super_
+
+    def call(self, expr):
+        if type(expr.callee) is my_expr.Get:
+            return self.invoke(expr)
+        callee = self.expr(expr.callee)
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        paren = expr.paren
+        n = len(arguments)
+        def call(env):
+            function = callee(env)
+            if not isinstance(function, (Func, Cls)):
+                env.runtime_error(paren, f'Can only call functions and classes.')
+            values = [argument(env) for argument in arguments]
+            if n != function.arity():
+                env.runtime_error(paren, f'Expected {function.arity()} arguments but got {n}.')
+            global_env = env.global_env
+            if global_env.depth >= global_env.max_depth:
+                env.runtime_error(paren, 'Stack overflow.')
+            global_env.depth += 1
+            try:
+                return function.call(values)
+            finally:
+                global_env.depth -= 1
+        return call
+
+    def invoke(self, expr):
+        '''
+        obj.name(...)：与 Call.invoke_method 相同，方法直接以 obj 为 this 调用，按接收者的 Shape 缓存找到的方法
+        '''
+        obj = self.expr(expr.callee.expr)
+        name = expr.callee.name
+        k = name.lexme
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        paren = expr.paren
+        n = len(arguments)
+        cache = [None, None] # 上次接收者的 Shape（没有同名字段）和找到的方法
+        def invoke(env):
+            instance = obj(env)
+            if not isinstance(instance, Instance):
+                env.runtime_error(name, 'Only instances have properties.')
+            method = None
+            if instance.shape is cache[0]:
+                function = method = cache[1]
+            else:
+                slot = instance.shape.slots.get(k)
+                if slot is not None:
+                    function = instance.values[slot]
+                    if not isinstance(function, (Func, Cls)):
+                        env.runtime_error(paren, f'Can only call functions and classes.')
+                else:
+                    function = method = instance.cls.get_method(k)
+                    if method is None:
+                        env.runtime_error(name, f'Undefined property {k}.')
+                    cache[0] = instance.shape
+                    cache[1] = method
+            values = [argument(env) for argument in arguments]
+            if n != function.arity():
+                env.runtime_error(paren, f'Expected {function.arity()} arguments but got {n}.')
+            global_env = env.global_env
+            if global_env.depth >= global_env.max_depth:
+                env.runtime_error(paren, 'Stack overflow.')
+            global_env.depth += 1
+            try:
+                if method is None:
+                    return function.call(values)
+                return method.invoke(instance, values)
+            finally:
+                global_env.depth -= 1
+        return invoke
+
+    def tail_call(self, expr):
+        '''
+        与 Call.tail_call 相同：检查后返回 TailCall，由当前的 CompiledFunc.call 接着执行
+        '''
+        callee = self.expr(expr.callee)
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        paren = expr.paren
+        n = len(arguments)
+        def tail_call(env):
+            function = callee(env)
+            if not isinstance(function, (Func, Cls)):
+                env.runtime_error(paren, f'Can only call functions and classes.')
+            values = [argument(env) for argument in arguments]
+            if n != function.arity():
+                env.runtime_error(paren, f'Expected {function.arity()} arguments but got {n}.')
+            return TailCall(function, values)
+        return tail_call
+
+    def get(self, expr):
+        obj = self.expr(expr.expr)
+        name = expr.name
+        k = name.lexme
+        cache = [None, None] # 与 Get 的内联缓存相同：Shape 和字段的下标
+        def get(env):
+            instance = obj(env)
+            if not isinstance(instance, Instance):
+                env.runtime_error(name, 'Only instances have properties.')
+            shape = instance.shape
+            if shape is cache[0]:
+                return instance.values[cache[1]]
+            slot = shape.slots.get(k)
+            if slot is None:
+                return instance.get(name, env)
+            cache[0] = shape
+            cache[1] = slot
+            return instance.values[slot]
+        return get
+
+    def set(self, expr):
+        obj = self.expr(expr.expr)
+        value = self.expr(expr.value)
+        name = expr.name
+        k = name.lexme
+        cache = [None, None, None, None] # 与 Set 的内联缓存相同：已有字段的 Shape 和下标，加入字段前后的 Shape
+        def set_(env):
+            instance = obj(env)
+            if not isinstance(instance, Instance):
+                env.runtime_error(name, 'Only instances have fields.')
+            v = value(env)
+            shape = instance.shape
+            if shape is cache[0]:
+                instance.values[cache[1]] = v
+            elif shape is cache[2]:
+                instance.shape = cache[3]
+                instance.values.append(v)
+            else:
+                slot = shape.slots.get(k)
+                if slot is None:
+                    cache[2] = shape
+                    cache[3] = instance.shape = shape.add(k)
+                    instance.values.append(v)
+                else:
+                    cache[0] = shape
+                    cache[1] = slot
+                    instance.values[slot] = v
+            return v
+        return set_
@@ -0,0 +1,665 @@
+
+import operator
+from enum import Enum, auto
+from my_token import Token
+import my_expr
+import my_stmt
+
+'''
+字节码：每条指令是一个 (op, arg) 元组，存放在 Function.code 中
+Function.tokens 与 code 一一对应，记录可能出错的指令对应的 Token，用于报告运行时错误
+跳转指令的 arg 是目标指令的下标；INVOKE 的 arg 是这个调用处的缓存 [方法名, 参数个数, 上次接收者的 Shape, 找到的方法]
+GET_PROPERTY 的 arg 是 [属性名, Shape, 字段下标]，SET_PROPERTY 的 arg 是 [属性名, Shape, 已有字段的下标, 加入字段前的 Shape, 加入后的 Shape]
+'''
+(
+    CONSTANT, NIL, TRUE, FALSE, POP, POP_N,
+    GET_LOCAL, SET_LOCAL, GET_CELL, SET_CELL, MAKE_CELL, GET_UPVALUE, SET_UPVALUE,
+    GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL,
+    GET_PROPERTY, SET_PROPERTY, CHECK_INSTANCE, GET_SUPER,
+    EQUAL, NOT_EQUAL, GREATER, GREATER_EQUAL, LESS, LESS_EQUAL,
+    ADD, SUBTRACT, MULTIPLY, DIVIDE, NOT, NEGATE,
+    PRINT, JUMP, POP_JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP,
+    CALL, TAIL_CALL, INVOKE, CHECK_CALLABLE, CLOSURE, RETURN, CLASS, INHERIT, METHOD,
+    NUMBER_OP,
+) = range(47)
+
+binary_ops = {
+    '==': EQUAL,
+    '!=': NOT_EQUAL,
+    '>': GREATER,
+    '>=': GREATER_EQUAL,
+    '<': LESS,
+    '<=': LESS_EQUAL,
+    '+': ADD,
+    '-': SUBTRACT,
+    '*': MULTIPLY,
+    '/': DIVIDE,
+}
+
+# 操作数已由 Inferrer 证明都是数的运算：NUMBER_OP 的 arg 是对应的函数，不检查类型
+number_ops = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+}
+
+class FuncType(Enum):
+    SCRIPT = auto()
+    FUNCTION = auto()
+    METHOD = auto()
+    INITIALIZER = auto()
+
+class Function:
+    def __init__(self, name, arity, type_):
+        self.name = name
+        self.arity = arity
+        self.is_init = type_ == FuncType.INITIALIZER
+        self.code = []
+        self.tokens = []
+        self.constants = []
+        self.constant_index = {}
+        self.upvalues = [] # (is_local, index)：is_local 时捕获外层函数的局部变量槽，否则捕获外层函数的 upvalue
+
+    def __repr__(self):
+        return f'(function {self.name})'
+
+class Local:
+    def __init__(self, name, depth, captured):
+        self.name = name
+        self.depth = depth
+        self.captured = captured # 被闭包捕获的局部变量在栈槽中存放 Cell
+
+class Capture:
+    '''
+    预扫描：找出所有被内层函数引用的局部变量
+    编译器在声明局部变量时就需要知道它是否被捕获（决定是否装箱成 Cell），
+    而引用它的闭包可能出现在声明之后，所以先完整走一遍作用域
+    作用域规则与 Resolver 保持一致；key 标识一次声明：声明用的 Token，this 用方法节点，super 用类节点
+    '''
+    def __init__(self):
+        self.scopes = [] # [(函数层级, {name: key})]
+        self.level = 0
+        self.captured = set()
+
+    def declare(self, name, key):
+        if len(self.scopes) > 0:
+            self.scopes[-1][1][name] = key
+
+    def use(self, name):
+        for level, scope in reversed(self.scopes):
+            if name in scope:
+                if level < self.level:
+                    self.captured.add(scope[name])
+                return
+
+    def begin_scope(self):
+        self.scopes.append((self.level, {}))
+
+    def end_scope(self):
+        self.scopes.pop()
+
+    def function(self, function, this):
+        self.level += 1
+        self.begin_scope()
+        if this:
+            self.declare('this', function)
+        for parameter in function.parameters:
+            self.declare(parameter.lexme, parameter)
+        self.stmt(function.body)
+        self.end_scope()
+        self.level -= 1
+
+    def stmt(self, stmt):
+        if isinstance(stmt, my_stmt.Block):
+            self.begin_scope()
+            for statement in stmt.statements:
+                self.stmt(statement)
+            self.end_scope()
+        elif isinstance(stmt, my_stmt.Var):
+            if stmt.initializer is not None:
+                self.expr(stmt.initializer)
+            self.declare(stmt.name.lexme, stmt.name)
+        elif isinstance(stmt, my_stmt.Function):
+            self.declare(stmt.name.lexme, stmt.name)
+            self.function(stmt, False)
+        elif isinstance(stmt, my_stmt.Class):
+            self.declare(stmt.name.lexme, stmt.name)
+            if stmt.sp is not None:
+                self.expr(stmt.sp)
+                self.begin_scope()
+                self.declare('super', stmt)
+            for method in stmt.methods:
+                self.function(method, True)
+            if stmt.sp is not None:
+                self.end_scope()
+        elif isinstance(stmt, (my_stmt.Expression, my_stmt.Print)):
+            self.expr(stmt.expr)
+        elif isinstance(stmt, my_stmt.Return):
+            if stmt.expr is not None:
+                self.expr(stmt.expr)
+        elif isinstance(stmt, my_stmt.If):
+            self.expr(stmt.condition)
+            self.stmt(stmt.then_branch)
+            if stmt.else_branch is not None:
+                self.stmt(stmt.else_branch)
+        elif isinstance(stmt, my_stmt.While):
+            self.expr(stmt.condition)
+            self.stmt(stmt.body)
+        elif isinstance(stmt, my_stmt.For):
+            self.begin_scope()
+            if stmt.initializer is not None:
+                self.stmt(stmt.initializer)
+            if stmt.condition is not None:
+                self.expr(stmt.condition)
+            self.stmt(stmt.body)
+            if stmt.increment is not None:
+                self.expr(stmt.increment)
+            self.end_scope()
+
+    def expr(self, expr):
+        if isinstance(expr, (my_expr.Variable, my_expr.Assign)):
+            if isinstance(expr, my_expr.Assign):
+                self.expr(expr.expr)
+            self.use(expr.name.lexme)
+        elif isinstance(expr, my_expr.This):
+            self.use('this')
+        elif isinstance(expr, my_expr.Super):
+            self.use('this')
+            self.use('super')
+        elif isinstance(expr, (my_expr.Binary, my_expr.Logical)):
+            self.expr(expr.left)
+            self.expr(expr.right)
+        elif isinstance(expr, my_expr.Unary):
+            self.expr(expr.right)
+        elif isinstance(expr, (my_expr.Grouping, my_expr.Invariant)):
+            self.expr(expr.expr)
+        elif isinstance(expr, my_expr.Call):
+            self.expr(expr.callee)
+            for argument in expr.arguments:
+                self.expr(argument)
+        elif isinstance(expr, my_expr.Get):
+            self.expr(expr.expr)
+        elif isinstance(expr, my_expr.Set):
+            self.expr(expr.expr)
+            self.expr(expr.value)
+
+class Loop:
+    def __init__(self, depth, start):
+        self.depth = depth # 循环体外的作用域深度，break/continue 跳出前弹出更深的局部变量
+        self.start = start # continue 的跳转目标；for 循环的递增表达式在循环体之后，先记下跳转指令再回填
+        self.continues = []
+        self.breaks = []
+
+class FunctionState:
+    def __init__(self, enclosing, function, type_):
+        self.enclosing = enclosing
+        self.function = function
+        self.type_ = type_
+        self.locals = []
+        self.scope_depth = 0
+        self.loops = []
+
+class Compiler:
+    '''
+    把经过 Resolver 检查的语法树编译成字节码，与 clox 的单遍编译器结构相同：
+    局部变量放在栈上（槽 0 是被调用的函数本身，方法中是 this），
+    被闭包捕获的局部变量在栈槽里装箱成 Cell，闭包直接持有这些 Cell
+    '''
+    def __init__(self):
+        self.state = None
+        self.captured = set()
+        self.stmt_table = {
+            my_stmt.Expression: self.expression_stmt,
+            my_stmt.Print: self.print_stmt,
+            my_stmt.Var: self.var_stmt,
+            my_stmt.Block: self.block_stmt,
+            my_stmt.If: self.if_stmt,
+            my_stmt.While: self.while_stmt,
+            my_stmt.For: self.for_stmt,
+            my_stmt.Function: self.function_stmt,
+            my_stmt.Return: self.return_stmt,
+            my_stmt.Break: self.break_stmt,
+            my_stmt.Continue: self.continue_stmt,
+            my_stmt.Class: self.class_stmt,
+        }
+        self.expr_table = {
+            my_expr.Literal: self.literal,
+            my_expr.Unary: self.unary,
+            my_expr.Binary: self.binary,
+            my_expr.Logical: self.logical,
+            my_expr.Grouping: self.grouping,
+            my_expr.Invariant: self.grouping, # 栈上的局部变量读取已经足够快，不变表达式照常计算
+            my_expr.Variable: self.variable,
+            my_expr.Assign: self.assign,
+            my_expr.This: self.this,
+            my_expr.Super: self.super,
+            my_expr.Call: self.call,
+            my_expr.Get: self.get,
+            my_expr.Set: self.set,
+        }
+
+    def compile(self, statements):
+        '''
+        编译顶层语句，返回 <script> 函数
+        与 Stmt.exec 的约定一致：最后一条语句是表达式语句时返回它的值（命令行模式会打印）
+        '''
+        capture = Capture()
+        for statement in statements:
+            capture.stmt(statement)
+        self.captured = capture.captured
+        self.state = FunctionState(None, Function('<script>', 0, FuncType.SCRIPT), FuncType.SCRIPT)
+        self.state.locals.append(Local('', 0, False))
+        for i, statement in enumerate(statements):
+            if i == len(statements) - 1 and isinstance(statement, my_stmt.Expression):
+                self.expr(statement.expr)
+                self.emit(RETURN)
+                return self.state.function
+            self.stmt(statement)
+        self.emit(NIL)
+        self.emit(RETURN)
+        return self.state.function
+
+    # ---------------- 指令生成 ----------------
+
+    def emit(self, op, arg=0, token=None):
+        self.state.function.code.append((op, arg))
+        self.state.function.tokens.append(token)
+        return len(self.state.function.code) - 1
+
+    def constant(self, value):
+        function = self.state.function
+        if isinstance(value, float):
+            key = (float, repr(value)) # 折叠可能产生 -0.0，它和 0.0 相等但打印结果不同
+        elif isinstance(value, str):
+            key = (str, value)
+        else:
+            key = id(value)
+        if key not in function.constant_index:
+            function.constant_index[key] = len(function.constants)
+            function.constants.append(value)
+        return function.constant_index[key]
+
+    def patch(self, index):
+        op, _ = self.state.function.code[index]
+        self.state.function.code[index] = (op, len(self.state.function.code))
+
+    # ---------------- 作用域 ----------------
+
+    def is_global(self):
+        return self.state.type_ == FuncType.SCRIPT and self.state.scope_depth == 0
+
+    def begin_scope(self):
+        self.state.scope_depth += 1
+
+    def end_scope(self):
+        self.state.scope_depth -= 1
+        locals_ = self.state.locals
+        n = 0
+        while len(locals_) > 0 and locals_[-1].depth > self.state.scope_depth:
+            locals_.pop()
+            n += 1
+        if n == 1:
+            self.emit(POP)
+        elif n > 1:
+            self.emit(POP_N, n)
+
+    def pop_locals(self, depth):
+        '''
+        弹出比 depth 更深的局部变量但不结束作用域，用于 break/continue 跳出循环体
+        '''
+        n = sum(1 for local in self.state.locals if local.depth > depth)
+        if n == 1:
+            self.emit(POP)
+        elif n > 1:
+            self.emit(POP_N, n)
+
+    def add_local(self, name, key):
+        local = Local(name, self.state.scope_depth, key in self.captured)
+        self.state.locals.append(local)
+        return len(self.state.locals) - 1
+
+    def resolve_local(self, state, name):
+        for i in range(len(state.locals)-1, -1, -1):
+            if state.locals[i].name == name:
+                return i
+        return -1
+
+    def add_upvalue(self, state, is_local, index):
+        upvalues = state.function.upvalues
+        if (is_local, index) in upvalues:
+            return upvalues.index((is_local, index))
+        upvalues.append((is_local, index))
+        return len(upvalues) - 1
+
+    def resolve_upvalue(self, state, name):
+        if state.enclosing is None:
+            return -1
+        local = self.resolve_local(state.enclosing, name)
+        if local != -1:
+            if not state.enclosing.locals[local].captured:
+                raise RuntimeError(f'local {name} captured but not boxed')
+            return self.add_upvalue(state, True, local)
+        upvalue = self.resolve_upvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self.add_upvalue(state, False, upvalue)
+        return -1
+
+    def load(self, name, token):
+        local = self.resolve_local(self.state, name)
+        if local != -1:
+            self.emit(GET_CELL if self.state.locals[local].captured else GET_LOCAL, local)
+            return
+        upvalue = self.resolve_upvalue(self.state, name)
+        if upvalue != -1:
+            self.emit(GET_UPVALUE, upvalue)
+        else:
+            self.emit(GET_GLOBAL, self.constant(name), token)
+
+    def store(self, name, token):
+        local = self.resolve_local(self.state, name)
+        if local != -1:
+            self.emit(SET_CELL if self.state.locals[local].captured else SET_LOCAL, local)
+            return
+        upvalue = self.resolve_upvalue(self.state, name)
+        if upvalue != -1:
+            self.emit(SET_UPVALUE, upvalue)
+        else:
+            self.emit(SET_GLOBAL, self.constant(name), token)
+
+    def define(self, name, key):
+        '''
+        栈顶的值成为新声明的变量：顶层作用域写入全局表，否则栈顶就是新局部变量的槽
+        '''
+        if self.is_global():
+            self.emit(DEFINE_GLOBAL, self.constant(name))
+        else:
+            slot = self.add_local(name, key)
+            if self.state.locals[slot].captured:
+                self.emit(MAKE_CELL, slot)
+
+    def is_simple(self, expr):
+        '''
+        求值不会有副作用也不会出错的表达式：Call/Set 在它之前的类型检查可以推迟到求值之后
+        '''
+        if isinstance(expr, my_expr.Literal):
+            return True
+        if isinstance(expr, (my_expr.Variable, my_expr.This)):
+            name = 'this' if isinstance(expr, my_expr.This) else expr.name.lexme
+            return self.resolve_local(self.state, name) != -1
+        return False
+
+    # ---------------- 语句 ----------------
+
+    def stmt(self, stmt):
+        self.stmt_table[type(stmt)](stmt)
+
+    def expression_stmt(self, stmt):
+        self.expr(stmt.expr)
+        self.emit(POP)
+
+    def print_stmt(self, stmt):
+        self.expr(stmt.expr)
+        self.emit(PRINT)
+
+    def var_stmt(self, stmt):
+        if stmt.initializer is None:
+            self.emit(NIL)
+        else:
+            self.expr(stmt.initializer)
+        self.define(stmt.name.lexme, stmt.name)
+
+    def block_stmt(self, stmt):
+        self.begin_scope()
+        for statement in stmt.statements:
+            self.stmt(statement)
+        self.end_scope()
+
+    def if_stmt(self, stmt):
+        self.expr(stmt.condition)
+        else_jump = self.emit(POP_JUMP_IF_FALSE)
+        self.stmt(stmt.then_branch)
+        if stmt.else_branch is None:
+            self.patch(else_jump)
+        else:
+            end_jump = self.emit(JUMP)
+            self.patch(else_jump)
+            self.stmt(stmt.else_branch)
+            self.patch(end_jump)
+
+    def while_stmt(self, stmt):
+        start = len(self.state.function.code)
+        self.expr(stmt.condition)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        loop = Loop(self.state.scope_depth, start)
+        self.state.loops.append(loop)
+        self.stmt(stmt.body)
+        self.state.loops.pop()
+        self.emit(JUMP, start)
+        self.patch(exit_jump)
+        for jump in loop.breaks:
+            self.patch(jump)
+
+    def for_stmt(self, stmt):
+        self.begin_scope()
+        if stmt.initializer is not None:
+            self.stmt(stmt.initializer)
+        start = len(self.state.function.code)
+        exit_jump = None
+        if stmt.condition is not None:
+            self.expr(stmt.condition)
+            exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        loop = Loop(self.state.scope_depth, None)
+        self.state.loops.append(loop)
+        self.stmt(stmt.body)
+        self.state.loops.pop()
+        for jump in loop.continues:
+            self.patch(jump)
+        if stmt.increment is not None:
+            self.expr(stmt.increment)
+            self.emit(POP)
+        self.emit(JUMP, start)
+        if exit_jump is not None:
+            self.patch(exit_jump)
+        for jump in loop.breaks:
+            self.patch(jump)
+        self.end_scope()
+
+    def break_stmt(self, stmt):
+        loop = self.state.loops[-1]
+        self.pop_locals(loop.depth)
+        loop.breaks.append(self.emit(JUMP))
+
+    def continue_stmt(self, stmt):
+        loop = self.state.loops[-1]
+        self.pop_locals(loop.depth)
+        if loop.start is None:
+            loop.continues.append(self.emit(JUMP))
+        else:
+            self.emit(JUMP, loop.start)
+
+    def function(self, stmt, type_, this_key=None):
+        function = Function(stmt.name.lexme, len(stmt.parameters), type_)
+        self.state = FunctionState(self.state, function, type_)
+        self.begin_scope()
+        if type_ in (FuncType.METHOD, FuncType.INITIALIZER):
+            self.add_local('this', this_key)
+        else:
+            self.add_local('', None)
+        for parameter in stmt.parameters:
+            self.add_local(parameter.lexme, parameter)
+        for slot, local in enumerate(self.state.locals):
+            if local.captured:
+                self.emit(MAKE_CELL, slot)
+        self.block_stmt(stmt.body)
+        self.emit_return(None)
+        self.state = self.state.enclosing
+        self.emit(CLOSURE, self.constant(function))
+
+    def emit_return(self, expr):
+        if self.state.type_ == FuncType.INITIALIZER:
+            self.emit(GET_CELL if self.state.locals[0].captured else GET_LOCAL, 0)
+        elif expr is None:
+            self.emit(NIL)
+        else:
+            self.expr(expr)
+        self.emit(RETURN)
+
+    def function_stmt(self, stmt):
+        name = stmt.name.lexme
+        if self.is_global():
+            self.function(stmt, FuncType.FUNCTION)
+            self.emit(DEFINE_GLOBAL, self.constant(name))
+            return
+        # 局部函数先声明再编译函数体，函数体才能递归引用自己
+        # 函数体引用自己时该变量一定被捕获，需要先放入 Cell 再创建闭包；否则闭包直接成为这个局部变量
+        slot = self.add_local(name, stmt.name)
+        if self.state.locals[slot].captured:
+            self.emit(NIL)
+            self.emit(MAKE_CELL, slot)
+            self.function(stmt, FuncType.FUNCTION)
+            self.emit(SET_CELL, slot)
+            self.emit(POP)
+        else:
+            self.function(stmt, FuncType.FUNCTION)
+
+    def return_stmt(self, stmt):
+        if stmt.tail:
+            # 被调用的是 Lox 函数时 TAIL_CALL 直接替换当前调用帧，不会执行到后面的 RETURN
+            self.call(stmt.expr, TAIL_CALL)
+            self.emit(RETURN)
+        else:
+            self.emit_return(stmt.expr)
+
+    def class_stmt(self, stmt):
+        name = stmt.name.lexme
+        is_global = self.is_global()
+        if not is_global:
+            self.emit(NIL)
+            slot = self.add_local(name, stmt.name)
+            if self.state.locals[slot].captured:
+                self.emit(MAKE_CELL, slot)
+        if stmt.sp is not None:
+            self.begin_scope()
+            self.variable(stmt.sp)
+            self.add_local('super', stmt)
+            if self.state.locals[-1].captured:
+                self.emit(MAKE_CELL, len(self.state.locals) - 1)
+        self.emit(CLASS, self.constant(stmt.name))
+        if stmt.sp is not None:
+            self.load('super', None)
+            self.emit(INHERIT, 0, stmt.sp.name)
+        for method in stmt.methods:
+            type_ = FuncType.INITIALIZER if method.name.lexme == 'init' else FuncType.METHOD
+            self.function(method, type_, method)
+            self.emit(METHOD, self.constant(method.name.lexme))
+        if stmt.sp is not None:
+            # 类对象还在栈顶，super 局部变量在它下面，不能用 end_scope 直接弹出
+            self.state.scope_depth -= 1
+            self.state.locals.pop()
+            self.emit(SET_LOCAL, len(self.state.locals))
+            self.emit(POP)
+        if is_global:
+            self.emit(DEFINE_GLOBAL, self.constant(name))
+        else:
+            self.emit(SET_CELL if self.state.locals[slot].captured else SET_LOCAL, slot)
+            self.emit(POP)
+
+    # ---------------- 表达式 ----------------
+
+    def expr(self, expr):
+        self.expr_table[type(expr)](expr)
+
+    def literal(self, expr):
+        if expr.value is None:
+            self.emit(NIL)
+        elif expr.value is True:
+            self.emit(TRUE)
+        elif expr.value is False:
+            self.emit(FALSE)
+        else:
+            self.emit(CONSTANT, self.constant(expr.value))
+
+    def unary(self, expr):
+        self.expr(expr.right)
+        if expr.operator.lexme == '-':
+            self.emit(NEGATE, 0, expr.operator)
+        else:
+            self.emit(NOT)
+
+    def binary(self, expr):
+        self.expr(expr.left)
+        self.expr(expr.right)
+        if expr.proven is float:
+            self.emit(NUMBER_OP, number_ops[expr.operator.lexme])
+        else:
+            self.emit(binary_ops[expr.operator.lexme], 0, expr.operator)
+
+    def logical(self, expr):
+        self.expr(expr.left)
+        if expr.operator.lexme == 'or':
+            jump = self.emit(JUMP_IF_TRUE_OR_POP)
+        else:
+            jump = self.emit(JUMP_IF_FALSE_OR_POP)
+        self.expr(expr.right)
+        self.patch(jump)
+
+    def grouping(self, expr):
+        self.expr(expr.expr)
+
+    def variable(self, expr):
+        self.load(expr.name.lexme, expr.name)
+
+    def assign(self, expr):
+        self.expr(expr.expr)
+        self.store(expr.name.lexme, expr.name)
+
+    def this(self, expr):
+        self.load('this', expr.name)
+
+    def super(self, expr):
+        self.load('this', expr.sp)
+        self.load('super', expr.sp)
+        self.emit(GET_SUPER, self.constant(expr.method.lexme), expr.method)
+
+    def call(self, expr, op=CALL):
+        simple = all(self.is_simple(argument) for argument in expr.arguments)
+        if op == CALL and simple and isinstance(expr.callee, my_expr.Get):
+            self.invoke(expr)
+            return
+        self.expr(expr.callee)
+        # Call.eval 在求值参数之前检查被调用者，参数有副作用时要保持这个顺序
+        if not simple:
+            self.emit(CHECK_CALLABLE, 0, expr.paren)
+        for argument in expr.arguments:
+            self.expr(argument)
+        self.emit(op, len(expr.arguments), expr.paren)
+
+    def invoke(self, expr):
+        '''
+        参数求值不会出错的 obj.name(...)：先求值 obj 和参数，再由 INVOKE 查找方法（Get 的检查推迟到参数之后不影响结果）
+        找到方法时 INVOKE 直接以 obj 为 this 调用并跳过后面的 CALL，不创建 BoundMethod；name 是字段时 INVOKE 把 obj 换成字段的值，由 CALL 调用
+        '''
+        get = expr.callee
+        self.expr(get.expr)
+        for argument in expr.arguments:
+            self.expr(argument)
+        self.emit(INVOKE, [get.name.lexme, len(expr.arguments), None, None], get.name)
+        self.emit(CALL, len(expr.arguments), expr.paren)
+
+    def get(self, expr):
+        self.expr(expr.expr)
+        self.emit(GET_PROPERTY, [expr.name.lexme, None, None], expr.name)
+
+    def set(self, expr):
+        self.expr(expr.expr)
+        # Set.eval 在求值右侧之前检查对象类型
+        if not self.is_simple(expr.value):
+            self.emit(CHECK_INSTANCE, 0, expr.name)
+        self.expr(expr.value)
+        self.emit(SET_PROPERTY, [expr.name.lexme, None, None, None, None], expr.name)
+
@@ -1,7 +1,49 @@
 
+import sys
+import contextlib
+
 from my_token import Token
 
+MAX_DEPTH = 10000 # Lox 调用深度的默认上限
+
+UNDEFINED = object() # 全局变量表中已经分配槽位但还没有定义的变量的值
+
+# 3.11 之前 Python 函数之间的调用也占用 C 栈，每层 Python 栈帧大约用掉几百字节，按这个估计从栈大小算出能安全放宽到的层数
+FRAME_BYTES = 512
+
+def safe_frames():
+    '''
+    3.11 之前递归限制最多放宽到的层数：超过它时可能在 RecursionError 之前就因为 C 栈溢出而崩溃
+    '''
+    try:
+        import resource
+        size = resource.getrlimit(resource.RLIMIT_STACK)[0]
+        if size == resource.RLIM_INFINITY:
+            size = 1 << 30
+    except (ImportError, ValueError): # 没有 resource 模块的平台按 1MB 的栈估计
+        size = 1 << 20
+    return size // FRAME_BYTES
+
+@contextlib.contextmanager
+def recursion_limit(frames):
+    '''
+    递归执行的引擎每层 Lox 调用要用掉若干层 Python 栈帧，执行期间把 Python 的递归限制放宽 frames 层
+    3.11 起 Python 函数之间的调用不占用 C 栈，放宽限制不会导致栈溢出崩溃；之前的版本最多放宽到 safe_frames() 层，
+    Lox 调用更深时出现 RecursionError，由引擎报告成 Stack overflow.
+    '''
+    limit = sys.getrecursionlimit()
+    raised = limit + frames
+    if sys.version_info < (3, 11):
+        raised = max(limit, min(raised, safe_frames()))
+    sys.setrecursionlimit(raised)
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
+
 class BaseEnv:
+    __slots__ = ()
+
     def scan_error(self, line, msg):
         print(f'[Line {line}] scan error: {msg}')
         raise
@@ -27,75 +69,88 @@ class BaseEnv:
             if not isinstance(o, type_):
                 self.runtime_error(operator, msg)
 
-class Env(BaseEnv):
-    def __init__(self, enclosing=None):
-        self.values = {}
-        self.enclosing = enclosing
-        if enclosing is None:
-            self.global_env = self
-        else:
-            self.global_env = enclosing.global_env
-
-    def define(self, name, value):
+    def get_global(self, name):
         if isinstance(name, Token):
             k = name.lexme
         else:
             k = name
-        self.values[k] = value
+        global_env = self.global_env
+        value = global_env.table[global_env.slot(k)]
+        if value is UNDEFINED:
+            self.runtime_error(name, f'Undefined variable {k}.')
+        return value
+
+    def capture(self, upvalues):
+        '''
+        创建函数时取出它捕获的 Cell：upvalues 是 Resolver 算出的 (距离, 槽位) 列表
+        '''
+        if len(upvalues) == 0:
+            return self.global_env
+        return Env(self.global_env, [self.get_at(distance, slot) for distance, slot in upvalues])
 
-    def get(self, name):
+    def assign_global(self, name, value):
         if isinstance(name, Token):
             k = name.lexme
         else:
             k = name
-        if k in self.values:
-            return self.values[k]
-        elif self.enclosing is not None:
-            return self.enclosing.get(name)
-        else:
-            super().runtime_error(name, f'Undefined variable {k}.')
+        global_env = self.global_env
+        slot = global_env.slot(k)
+        if global_env.table[slot] is UNDEFINED:
+            self.runtime_error(name, f'Undefined variable {k}.')
+        global_env.table[slot] = value
+        global_env.values[k] = value
+
+class GlobalEnv(BaseEnv):
+    '''
+    全局作用域：values 是变量名到值的字典，vm 和 python 引擎直接读写它，本地函数也在运行前放入其中
+    tree 和 closure 引擎按槽位读写 table：名字第一次被定义或引用时在 slots 中得到固定的槽位（初值取自 values，
+    没有时是 UNDEFINED），引用处缓存 table 和槽位，之后每次访问只是一次列表下标；通过 define/assign 写入时同时更新 values
+    depth 是当前的 Lox 调用深度，调用前超过 max_depth 时报告 Stack overflow.
+    '''
+    def __init__(self, max_depth=MAX_DEPTH):
+        self.values = {}
+        self.slots = {}
+        self.table = []
+        self.global_env = self
+        self.depth = 0
+        self.max_depth = max_depth
 
-    def assign(self, name, value):
+    def slot(self, k):
+        slot = self.slots.get(k)
+        if slot is None:
+            slot = self.slots[k] = len(self.table)
+            self.table.append(self.values.get(k, UNDEFINED))
+        return slot
+
+    def define(self, name, value):
         if isinstance(name, Token):
             k = name.lexme
         else:
             k = name
-        if k in self.values:
-            self.values[k] = value
-        elif self.enclosing is not None:
-            self.enclosing.assign(name, value)
-        else:
-            super().runtime_error(name, f'Undefined variable {k}.')
+        self.values[k] = value
+        self.table[self.slot(k)] = value
+
+class Env(BaseEnv):
+    '''
+    局部作用域：变量按 Resolver 分配的槽位存放在定长列表中
+    '''
+    __slots__ = ('values', 'enclosing', 'global_env')
+
+    def __init__(self, enclosing, values):
+        self.values = values
+        self.enclosing = enclosing
+        self.global_env = enclosing.global_env
 
-    def get_at(self, distance, name):
+    def get_at(self, distance, slot):
         env = self
-        for _ in range(distance):
+        while distance > 0:
             env = env.enclosing
-        return env.get(name)
+            distance -= 1
+        return env.values[slot]
 
-    def assign_at(self, distance, name, value):
+    def assign_at(self, distance, slot, value):
         env = self
-        for _ in range(distance):
+        while distance > 0:
             env = env.enclosing
-        return env.assign(name, value)
-
-    def get_global(self, name):
-        if isinstance(name, Token):
-            k = name.lexme
-        else:
-            k = name
-        if k in self.global_env.values:
-            return self.global_env.values[k]
-        else:
-            super().runtime_error(name, f'Undefined variable {k}.')
-
-    def assign_global(self, name, value):
-        if isinstance(name, Token):
-            k = name.lexme
-        else:
-            k = name
-        if k in self.global_env.values:
-            self.global_env.values[k] = value
-        else:
-            super().runtime_error(name, f'Undefined variable {k}.')
-
+            distance -= 1
+        env.values[slot] = value
@@ -1,12 +1,24 @@
 
-from my_token import TokenType
-from my_type import Func, Cls, Instance
+from collections import Counter
+from my_token import Token, TokenType
+from my_type import Func, Cls, Instance, TailCall, strings, concat
+from my_env import UNDEFINED
 from my_resolver import ClsType
 
 class Expr:
-    pass
+    '''
+    语法树节点用 __slots__ 声明所有属性（包括之后由 Resolver、Optimizer、Inferrer 和缓存填写的），没有 __dict__；
+    特化的子类不增加属性，布局相同，quickening 可以直接替换 __class__
+    '''
+    __slots__ = ()
+
+# 树遍历解释器中特化过的表达式节点个数（按特化后的类名）和特化后又遇到其他类型而退回通用实现的个数
+specialized = Counter()
+despecialized = Counter()
 
 class Literal(Expr):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -20,9 +32,15 @@ class Literal(Expr):
         return self.value
 
 class Unary(Expr):
+    '''
+    第一次求值成功后按运算符把节点的类换成特化的子类（quickening），见 Binary
+    '''
+    __slots__ = ('operator', 'right', 'proven')
+
     def __init__(self, operator, right):
         self.operator = operator
         self.right = right
+        self.proven = None # 由 Inferrer 填写：操作数一定是数时为 float，不用检查
 
     def __repr__(self):
         return f'({self.operator} {self.right})'
@@ -32,17 +50,67 @@ class Unary(Expr):
 
     def eval(self, env):
         right = self.right.eval(env)
+        value = self.operate(env, right)
+        if type(self) is Unary: # 递归调用中的求值可能已经特化过
+            if self.operator.type_ != TokenType.MINUS:
+                self.__class__ = Not
+            else:
+                self.__class__ = Negate if self.proven is None else UncheckedNegate
+            specialized[self.__class__.__name__] += 1
+        return value
+
+    def operate(self, env, right):
         if self.operator.type_ == TokenType.MINUS:
             env.check_operands(self.operator, [right], float, 'Operand must be a number.')
             return -right
         else: # TokenType.BANG
             return not env.is_truthy(right)
 
+class GenericUnary(Unary):
+    '''
+    特化后遇到其他类型的操作数：不再特化
+    '''
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.operate(env, self.right.eval(env))
+
+class Negate(Unary):
+    __slots__ = ()
+
+    def eval(self, env):
+        right = self.right.eval(env)
+        if type(right) is float:
+            return -right
+        self.__class__ = GenericUnary
+        despecialized['Negate'] += 1
+        return self.operate(env, right)
+
+class UncheckedNegate(Unary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return -self.right.eval(env)
+
+class Not(Unary):
+    __slots__ = ()
+
+    def eval(self, env):
+        right = self.right.eval(env)
+        return right is None or right is False
+
 class Binary(Expr):
+    '''
+    第一次求值成功后按运算符和操作数的类型把节点的类换成特化的子类（quickening），之后只检查操作数类型是否相同，
+    不再逐个比较运算符；类型不同时换成 GenericBinary，按原来的方式求值，不再特化
+    '''
+    __slots__ = ('left', 'operator', 'right', 'proven')
+
     def __init__(self, left, operator, right):
         self.left = left
         self.operator = operator
         self.right = right
+        self.proven = None # 由 Inferrer 填写：操作数一定都是数（或者 + 的操作数一定都是字符串）时为 float（str），不用检查
 
     def __repr__(self):
         return f'({self.operator} {self.left} {self.right})'
@@ -54,9 +122,26 @@ class Binary(Expr):
     def eval(self, env):
         left = self.left.eval(env)
         right = self.right.eval(env)
+        value = self.operate(env, left, right)
+        if type(self) is Binary: # 求值操作数时的递归调用可能已经特化过
+            if self.proven is str:
+                cls = UncheckedConcat
+            elif self.proven is float:
+                cls = unchecked_binary[self.operator.type_]
+            else:
+                cls = quick_binary[self.operator.type_]
+            if cls is AddNumbers and type(left) is not float: # 出错时不会到这里，所以这时两个都是字符串
+                cls = AddStrings
+            self.__class__ = cls
+            specialized[cls.__name__] += 1
+        return value
+
+    def operate(self, env, left, right):
         if self.operator.type_ == TokenType.PLUS:
-            if isinstance(left, float) and isinstance(right, float) or isinstance(left, str) and isinstance(right, str):
+            if isinstance(left, float) and isinstance(right, float):
                 return left + right
+            elif type(left) in strings and type(right) in strings:
+                return concat(left, right)
             else:
                 env.runtime_error(self.operator, 'Operands must be two numbers or two strings.')
         elif self.operator.type_ == TokenType.MINUS:
@@ -85,7 +170,202 @@ class Binary(Expr):
         else: # TokenType.EQUAL_EQUAL
             return left == right
 
+    def despecialize(self, env, left, right):
+        despecialized[self.__class__.__name__] += 1
+        self.__class__ = GenericBinary
+        return self.operate(env, left, right)
+
+class GenericBinary(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.operate(env, self.left.eval(env), self.right.eval(env))
+
+class AddNumbers(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left + right
+        return self.despecialize(env, left, right)
+
+class AddStrings(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) in strings and type(right) in strings:
+            return concat(left, right)
+        return self.despecialize(env, left, right)
+
+class Subtract(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left - right
+        return self.despecialize(env, left, right)
+
+class Multiply(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left * right
+        return self.despecialize(env, left, right)
+
+class Divide(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left / right
+        return self.despecialize(env, left, right)
+
+class Greater(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left > right
+        return self.despecialize(env, left, right)
+
+class GreaterEqual(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left >= right
+        return self.despecialize(env, left, right)
+
+class Less(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left < right
+        return self.despecialize(env, left, right)
+
+class LessEqual(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        left = self.left.eval(env)
+        right = self.right.eval(env)
+        if type(left) is float and type(right) is float:
+            return left <= right
+        return self.despecialize(env, left, right)
+
+class Equal(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) == self.right.eval(env)
+
+class NotEqual(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) != self.right.eval(env)
+
+# 操作数类型已由 Inferrer 证明的运算，不需要退回通用实现
+
+class UncheckedAdd(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) + self.right.eval(env)
+
+class UncheckedConcat(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return concat(self.left.eval(env), self.right.eval(env))
+
+class UncheckedSubtract(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) - self.right.eval(env)
+
+class UncheckedMultiply(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) * self.right.eval(env)
+
+class UncheckedDivide(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) / self.right.eval(env)
+
+class UncheckedGreater(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) > self.right.eval(env)
+
+class UncheckedGreaterEqual(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) >= self.right.eval(env)
+
+class UncheckedLess(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) < self.right.eval(env)
+
+class UncheckedLessEqual(Binary):
+    __slots__ = ()
+
+    def eval(self, env):
+        return self.left.eval(env) <= self.right.eval(env)
+
+unchecked_binary = {
+    TokenType.PLUS: UncheckedAdd,
+    TokenType.MINUS: UncheckedSubtract,
+    TokenType.STAR: UncheckedMultiply,
+    TokenType.SLASH: UncheckedDivide,
+    TokenType.GREATER: UncheckedGreater,
+    TokenType.GREATER_EQUAL: UncheckedGreaterEqual,
+    TokenType.LESS: UncheckedLess,
+    TokenType.LESS_EQUAL: UncheckedLessEqual,
+}
+
+quick_binary = {
+    TokenType.PLUS: AddNumbers,
+    TokenType.MINUS: Subtract,
+    TokenType.STAR: Multiply,
+    TokenType.SLASH: Divide,
+    TokenType.GREATER: Greater,
+    TokenType.GREATER_EQUAL: GreaterEqual,
+    TokenType.LESS: Less,
+    TokenType.LESS_EQUAL: LessEqual,
+    TokenType.EQUAL_EQUAL: Equal,
+    TokenType.BANG_EQUAL: NotEqual,
+}
+
 class Logical(Expr):
+    __slots__ = ('left', 'operator', 'right')
+
     def __init__(self, left, operator, right):
         self.left = left
         self.operator = operator
@@ -109,6 +389,8 @@ class Logical(Expr):
         return self.right.eval(env)
 
 class Grouping(Expr):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -121,98 +403,172 @@ class Grouping(Expr):
     def eval(self, env):
         return self.expr.eval(env)
 
+class Invariant(Expr):
+    '''
+    循环不变表达式，由 Optimizer 生成：同一次循环执行中第一次求值后缓存结果，所在循环每次开始时清空缓存
+    第一次求值出错时和原表达式一样报错
+    '''
+    __slots__ = ('expr', 'ready', 'value')
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.ready = False
+        self.value = None
+
+    def __repr__(self):
+        return f'(invariant {self.expr})'
+
+    def resolve(self, resolver):
+        self.expr.resolve(resolver)
+
+    def eval(self, env):
+        if not self.ready:
+            self.value = self.expr.eval(env)
+            self.ready = True
+        return self.value
+
 class Variable(Expr):
+    '''
+    全局变量第一次求值时在 slot 中缓存它在全局变量表中的槽位，table 记录缓存对应的表（全局作用域不同时重新查找）
+    '''
+    __slots__ = ('name', 'distance', 'slot', 'cell', 'table')
+
     def __init__(self, name):
         self.name = name
+        self.distance = None # 由 Resolver 填写，None 表示全局变量
+        self.slot = None
+        self.cell = False # 由 Resolver 填写：变量被内层函数捕获，槽位中是它的 Cell
+        self.table = None
 
     def __repr__(self):
         return f'(id {self.name})'
 
     def resolve(self, resolver):
-        self.resolver = resolver
         if resolver.check(self.name, False):
             resolver.resolve_error(self.name, f'Can not read local variable in its own initializer.')
         else:
-            resolver.resolve_local(self, self.name)
+            self.distance, self.slot = resolver.resolve_local(self.name, self)
 
     def eval(self, env):
-        if self in self.resolver.locals:
-            return env.get_at(self.resolver.locals[self], self.name)
-        else:
-            return env.get_global(self.name)
+        if self.distance is None:
+            table = env.global_env.table
+            if self.table is not table:
+                self.slot = env.global_env.slot(self.name.lexme)
+                self.table = table
+            value = table[self.slot]
+            if value is UNDEFINED:
+                env.runtime_error(self.name, f'Undefined variable {self.name.lexme}.')
+            return value
+        if self.cell:
+            return env.get_at(self.distance, self.slot).value
+        return env.get_at(self.distance, self.slot)
 
 class Assign(Expr):
+    '''
+    全局变量的槽位与 Variable 相同地缓存
+    '''
+    __slots__ = ('name', 'expr', 'distance', 'slot', 'cell', 'table')
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
+        self.distance = None
+        self.slot = None
+        self.cell = False
+        self.table = None
 
     def __repr__(self):
         return f'(= {self.name} {self.expr})'
 
     def resolve(self, resolver):
-        self.resolver = resolver
         self.expr.resolve(resolver)
-        resolver.resolve_local(self, self.name)
+        self.distance, self.slot = resolver.resolve_local(self.name, self)
 
     def eval(self, env):
         value = self.expr.eval(env)
-        if self in self.resolver.locals:
-            env.assign_at(self.resolver.locals[self], self.name, value)
+        if self.distance is None:
+            global_env = env.global_env
+            table = global_env.table
+            if self.table is not table:
+                self.slot = global_env.slot(self.name.lexme)
+                self.table = table
+            if table[self.slot] is UNDEFINED:
+                env.runtime_error(self.name, f'Undefined variable {self.name.lexme}.')
+            table[self.slot] = value
+            global_env.values[self.name.lexme] = value
+        elif self.cell:
+            env.get_at(self.distance, self.slot).value = value
         else:
-            env.assign_global(self.name, value)
+            env.assign_at(self.distance, self.slot, value)
         return value
 
 class This(Expr):
+    __slots__ = ('name', 'distance', 'slot', 'cell')
+
     def __init__(self, name):
         self.name = name
+        self.distance = None
+        self.slot = None
+        self.cell = False # this 不能被赋值，被捕获时直接复制值，总是 False
 
     def __repr__(self):
         return f'this'
 
     def resolve(self, resolver):
-        self.resolver = resolver
         if resolver.current_class == ClsType.NONE:
             resolver.resolve_error(self.name, f'Can not use this outside of a class.')
         else:
-            resolver.resolve_local(self, self.name)
+            self.distance, self.slot = resolver.resolve_local(self.name, self)
 
     def eval(self, env):
-        if self in self.resolver.locals:
-            return env.get_at(self.resolver.locals[self], self.name)
-        else:
+        if self.distance is None:
             return env.get_global(self.name)
+        return env.get_at(self.distance, self.slot)
 
 class Super(Expr):
+    '''
+    super 和 this 在不同的作用域中，在方法中的函数里二者可能分别是局部变量和捕获的变量，所以 this 单独解析
+    '''
+    __slots__ = ('sp', 'method', 'distance', 'slot', 'cell', 'this')
+
     def __init__(self, sp, method):
         self.sp = sp
         self.method = method
+        self.distance = None
+        self.slot = None
+        self.cell = False # super 不能被赋值，总是 False
+        self.this = This(Token(TokenType.THIS, 'this', None, sp.line))
 
     def __repr__(self):
         return f'(super {self.method})'
 
     def resolve(self, resolver):
-        self.resolver = resolver
         if resolver.current_class == ClsType.NONE:
             resolver.resolve_error(self.sp, f'Can not use super outside of a class.')
         elif resolver.current_class != ClsType.SUBCLASS:
             resolver.resolve_error(self.sp, f'Can not use super in a class with no superclass.')
         else:
-            resolver.resolve_local(self, self.sp)
+            self.distance, self.slot = resolver.resolve_local(self.sp, self)
+            self.this.resolve(resolver)
 
     def eval(self, env):
-        distance = self.resolver.locals[self]
-        sp = env.get_at(distance, self.sp)
-        this = env.get_at(distance-1, 'this')
-        method = sp.get_method(self.method)
+        sp = env.get_at(self.distance, self.slot)
+        this = self.this.eval(env)
+        method = sp.get_method(self.method.lexme)
         if method is None:
             env.runtime_error(self.method, f'Undefined property {self.method}.')
         return method.bind(this)
 
 class Call(Expr):
+    __slots__ = ('callee', 'arguments', 'paren', 'invoke', 'shape', 'method')
+
     def __init__(self, callee, arguments, paren):
         self.callee = callee
         self.arguments = arguments
         self.paren = paren
+        self.invoke = False # 由 Resolver 填写：callee 是 Get，即 obj.name(...) 形式的方法调用
+        self.shape = None # 方法调用的缓存：上次接收者的 Shape（没有同名字段）和在它的类中找到的方法
+        self.method = None
 
     def __repr__(self):
         return f'(call {self.callee} {self.arguments})'
@@ -221,8 +577,11 @@ class Call(Expr):
         self.callee.resolve(resolver)
         for argument in self.arguments:
             argument.resolve(resolver)
+        self.invoke = type(self.callee) is Get
 
     def eval(self, env):
+        if self.invoke:
+            return self.invoke_method(env)
         callee = self.callee.eval(env)
         if not isinstance(callee, (Func, Cls)):
             env.runtime_error(self.paren, f'Can only call functions and classes.')
@@ -231,12 +590,78 @@ class Call(Expr):
             arguments.append(argument.eval(env))
         if len(arguments) != callee.arity():
             env.runtime_error(self.paren, f'Expected {callee.arity()} arguments but got {len(arguments)}.')
-        return callee.call(arguments)
+        global_env = env.global_env
+        if global_env.depth >= global_env.max_depth:
+            env.runtime_error(self.paren, 'Stack overflow.')
+        global_env.depth += 1
+        try:
+            return callee.call(arguments)
+        finally:
+            global_env.depth -= 1
+
+    def invoke_method(self, env):
+        '''
+        obj.name(...)：检查和出错的顺序与先求值 Get 再调用相同，但找到的方法直接以 obj 为 this 调用，不创建绑定后的 Func
+        Shape 决定了类和字段，接收者的 Shape 与上次相同时直接使用上次找到的方法
+        '''
+        get = self.callee
+        instance = get.expr.eval(env)
+        if not isinstance(instance, Instance):
+            env.runtime_error(get.name, 'Only instances have properties.')
+        method = None
+        if instance.shape is self.shape:
+            callee = method = self.method
+        else:
+            k = get.name.lexme
+            slot = instance.shape.slots.get(k)
+            if slot is not None: # 字段遮蔽同名方法
+                callee = instance.values[slot]
+                if not isinstance(callee, (Func, Cls)):
+                    env.runtime_error(self.paren, f'Can only call functions and classes.')
+            else:
+                callee = method = instance.cls.get_method(k)
+                if method is None:
+                    env.runtime_error(get.name, f'Undefined property {k}.')
+                self.shape = instance.shape
+                self.method = method
+        arguments = []
+        for argument in self.arguments:
+            arguments.append(argument.eval(env))
+        if len(arguments) != callee.arity():
+            env.runtime_error(self.paren, f'Expected {callee.arity()} arguments but got {len(arguments)}.')
+        global_env = env.global_env
+        if global_env.depth >= global_env.max_depth:
+            env.runtime_error(self.paren, 'Stack overflow.')
+        global_env.depth += 1
+        try:
+            if method is None:
+                return callee.call(arguments)
+            return method.invoke(instance, arguments)
+        finally:
+            global_env.depth -= 1
+
+    def tail_call(self, env):
+        '''
+        return 语句中的调用：检查与 eval 相同，但不在这里调用，交给当前的 Func.call 接着执行，调用深度不变
+        '''
+        callee = self.callee.eval(env)
+        if not isinstance(callee, (Func, Cls)):
+            env.runtime_error(self.paren, f'Can only call functions and classes.')
+        arguments = []
+        for argument in self.arguments:
+            arguments.append(argument.eval(env))
+        if len(arguments) != callee.arity():
+            env.runtime_error(self.paren, f'Expected {callee.arity()} arguments but got {len(arguments)}.')
+        return TailCall(callee, arguments)
 
 class Get(Expr):
+    __slots__ = ('expr', 'name', 'shape', 'slot')
+
     def __init__(self, expr, name):
         self.expr = expr
         self.name = name
+        self.shape = None # 内联缓存：上次读到字段的实例的 Shape 和字段的下标
+        self.slot = None
 
     def __repr__(self):
         return f'(get {self.expr} {self.name})'
@@ -248,13 +673,27 @@ class Get(Expr):
         expr = self.expr.eval(env)
         if not isinstance(expr, Instance):
             env.runtime_error(self.name, 'Only instances have properties.')
-        return expr.get(self.name, env)
+        shape = expr.shape
+        if shape is self.shape:
+            return expr.values[self.slot]
+        slot = shape.slots.get(self.name.lexme)
+        if slot is None: # 方法
+            return expr.get(self.name, env)
+        self.shape = shape
+        self.slot = slot
+        return expr.values[slot]
 
 class Set(Expr):
+    __slots__ = ('expr', 'name', 'value', 'shape', 'slot', 'before', 'after')
+
     def __init__(self, expr, name, value):
         self.expr = expr
         self.name = name
         self.value = value
+        self.shape = None # 内联缓存：给已有字段赋值时实例的 Shape 和字段的下标
+        self.slot = None
+        self.before = None # 内联缓存：加入这个字段前后的 Shape
+        self.after = None
 
     def __repr__(self):
         return f'(set {self.expr} {self.name} {self.value})'
@@ -268,6 +707,21 @@ class Set(Expr):
         if not isinstance(expr, Instance):
             env.runtime_error(self.name, 'Only instances have fields.')
         value = self.value.eval(env)
-        expr.set(self.name, value)
+        shape = expr.shape
+        if shape is self.shape:
+            expr.values[self.slot] = value
+        elif shape is self.before:
+            expr.shape = self.after
+            expr.values.append(value)
+        else:
+            slot = shape.slots.get(self.name.lexme)
+            if slot is None:
+                self.before = shape
+                self.after = expr.shape = shape.add(self.name.lexme)
+                expr.values.append(value)
+            else:
+                self.shape = shape
+                self.slot = slot
+                expr.values[slot] = value
         return value
 
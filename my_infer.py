@@ -0,0 +1,203 @@
+
+from collections import Counter
+import my_expr
+import my_stmt
+
+'''
+类型推导：在 Resolver 和 Optimizer 之后运行，证明哪些运算的操作数一定是数（+ 也可以是两个字符串），
+在这些 Unary/Binary 节点上记下 proven = float 或 str，各引擎对它们不再检查操作数类型
+'''
+
+NOTHING = 'nothing' # 还没有见到可能的值，迭代的初值
+
+# 所有经过 Inferrer 的运算中需要检查操作数类型的个数和去掉检查的个数（按运算符）
+checks = Counter()
+removed = Counter()
+
+def join(a, b):
+    if a is NOTHING:
+        return b
+    if b is NOTHING:
+        return a
+    return a if a is b else None
+
+class Inferrer:
+    '''
+    与流程无关的推导：局部变量的类型是它所有可能的值（声明时的初值和每一处赋值）的类型的并，None 表示未知
+    全局变量、参数、字段、调用结果都当作未知：流式执行和命令行模式中后面的语句还可能给全局变量赋任何值
+    从所有变量都是 NOTHING 开始反复计算直到不再变化；运算出错时不产生值，所以 - * / 的结果总是数
+    作用域规则与 Resolver 保持一致；key 标识一次声明，与 Capture 相同用声明的 Token
+    '''
+    def __init__(self):
+        self.scopes = [] # [{name: key}]
+        self.bindings = {} # Variable/Assign 节点 -> 它引用的局部变量的 key
+        self.sources = {} # key -> [值的表达式]，表达式为 None 表示未知（参数、没有初值的 var 等）
+        self.ops = [] # 需要检查操作数类型的 Unary/Binary 节点
+        self.types = {}
+
+    def infer(self, statements):
+        for statement in statements:
+            self.stmt(statement)
+        self.types = {key: NOTHING for key in self.sources}
+        changed = True
+        while changed:
+            changed = False
+            for key, exprs in self.sources.items():
+                t = NOTHING
+                for expr in exprs:
+                    t = join(t, None if expr is None else self.type_of(expr))
+                if t is not self.types[key]:
+                    self.types[key] = t
+                    changed = True
+        for expr in self.ops:
+            op = expr.operator.lexme
+            checks[op] += 1
+            if isinstance(expr, my_expr.Unary):
+                proven = float if self.type_of(expr.right) is float else None
+            else:
+                left = self.type_of(expr.left)
+                proven = left if left is self.type_of(expr.right) and left in (float, str) else None
+                if proven is str and op != '+':
+                    proven = None
+            if proven is not None:
+                expr.proven = proven
+                removed[op] += 1
+        return statements
+
+    # ---------------- 作用域 ----------------
+
+    def declare(self, name, value):
+        '''
+        value 是初值的表达式，None 表示未知
+        '''
+        if len(self.scopes) > 0:
+            self.scopes[-1][name.lexme] = name
+            self.sources[name] = [value]
+
+    def lookup(self, expr):
+        for scope in reversed(self.scopes):
+            if expr.name.lexme in scope:
+                self.bindings[expr] = scope[expr.name.lexme]
+                return scope[expr.name.lexme]
+        return None
+
+    def function(self, function):
+        self.scopes.append({})
+        for parameter in function.parameters:
+            self.declare(parameter, None)
+        self.stmt(function.body)
+        self.scopes.pop()
+
+    # ---------------- 收集 ----------------
+
+    def stmt(self, stmt):
+        if isinstance(stmt, my_stmt.Block):
+            self.scopes.append({})
+            for statement in stmt.statements:
+                self.stmt(statement)
+            self.scopes.pop()
+        elif isinstance(stmt, my_stmt.Var):
+            # Resolver 在求值初值之前声明变量（初值中读它是静态错误），这里顺序无关
+            if stmt.initializer is not None:
+                self.expr(stmt.initializer)
+            self.declare(stmt.name, stmt.initializer)
+        elif isinstance(stmt, my_stmt.Function):
+            self.declare(stmt.name, None)
+            self.function(stmt)
+        elif isinstance(stmt, my_stmt.Class):
+            self.declare(stmt.name, None)
+            if stmt.sp is not None:
+                self.expr(stmt.sp)
+            for method in stmt.methods:
+                self.function(method)
+        elif isinstance(stmt, (my_stmt.Expression, my_stmt.Print)):
+            self.expr(stmt.expr)
+        elif isinstance(stmt, my_stmt.Return):
+            if stmt.expr is not None:
+                self.expr(stmt.expr)
+        elif isinstance(stmt, my_stmt.If):
+            self.expr(stmt.condition)
+            self.stmt(stmt.then_branch)
+            if stmt.else_branch is not None:
+                self.stmt(stmt.else_branch)
+        elif isinstance(stmt, my_stmt.While):
+            self.expr(stmt.condition)
+            self.stmt(stmt.body)
+        elif isinstance(stmt, my_stmt.For):
+            self.scopes.append({})
+            if stmt.initializer is not None:
+                self.stmt(stmt.initializer)
+            if stmt.condition is not None:
+                self.expr(stmt.condition)
+            self.stmt(stmt.body)
+            if stmt.increment is not None:
+                self.expr(stmt.increment)
+            self.scopes.pop()
+
+    def expr(self, expr):
+        if isinstance(expr, my_expr.Variable):
+            self.lookup(expr)
+        elif isinstance(expr, my_expr.Assign):
+            self.expr(expr.expr)
+            key = self.lookup(expr)
+            if key is not None:
+                self.sources[key].append(expr.expr)
+        elif isinstance(expr, my_expr.Binary):
+            if expr.operator.lexme not in ('==', '!='):
+                self.ops.append(expr)
+            self.expr(expr.left)
+            self.expr(expr.right)
+        elif isinstance(expr, my_expr.Logical):
+            self.expr(expr.left)
+            self.expr(expr.right)
+        elif isinstance(expr, my_expr.Unary):
+            if expr.operator.lexme == '-':
+                self.ops.append(expr)
+            self.expr(expr.right)
+        elif isinstance(expr, (my_expr.Grouping, my_expr.Invariant)):
+            self.expr(expr.expr)
+        elif isinstance(expr, my_expr.Call):
+            self.expr(expr.callee)
+            for argument in expr.arguments:
+                self.expr(argument)
+        elif isinstance(expr, my_expr.Get):
+            self.expr(expr.expr)
+        elif isinstance(expr, my_expr.Set):
+            self.expr(expr.expr)
+            self.expr(expr.value)
+
+    # ---------------- 推导 ----------------
+
+    def type_of(self, expr):
+        '''
+        表达式的值的类型：float、str（包括 Rope）、bool，NOTHING 或未知（None）
+        '''
+        t = type(expr)
+        if t is my_expr.Literal:
+            value = expr.value
+            return type(value) if type(value) in (float, str, bool) else None
+        if t is my_expr.Variable:
+            key = self.bindings.get(expr)
+            return None if key is None else self.types[key]
+        if t is my_expr.Assign:
+            return self.type_of(expr.expr)
+        if t is my_expr.Grouping or t is my_expr.Invariant:
+            return self.type_of(expr.expr)
+        if t is my_expr.Unary:
+            return float if expr.operator.lexme == '-' else bool
+        if t is my_expr.Binary:
+            op = expr.operator.lexme
+            if op == '+':
+                left = self.type_of(expr.left)
+                right = self.type_of(expr.right)
+                if left is NOTHING or right is NOTHING:
+                    return NOTHING
+                return left if left is right and left in (float, str) else None
+            if op in ('-', '*', '/'):
+                return float
+            return bool
+        if t is my_expr.Logical:
+            return join(self.type_of(expr.left), self.type_of(expr.right))
+        if t is my_expr.Set:
+            return self.type_of(expr.value)
+        return None
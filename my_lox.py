@@ -1,37 +1,223 @@
 
+import os
 import sys
+import mmap
+import argparse
+import functools
+import py_compile
 
-from my_scanner import Scanner
-from my_parser import Parser
+from my_scanner import Scanner, RegexScanner, StreamScanner, CompactScanner, ScanError
+from my_parser import Parser, TokenStream
 from my_resolver import Resolver
-from my_env import Env
+from my_optimizer import Optimizer
+from my_infer import Inferrer
+from my_env import GlobalEnv, MAX_DEPTH, recursion_limit
+from my_token import Token, TokenType
 from my_native import native_table
+from my_vm import VM
+from my_closure import ClosureCompiler
+from my_transpiler import Transpiler, run_main
+import my_cache
+import my_tier
+import my_stmt
+import my_expr
+import my_infer
 
-def run(src, resolver, env):
-    value = None
-    statements = Parser(Scanner(src, env).scan_tokens(), env).parse()
+scanners = {
+    'char': Scanner,
+    'regex': RegexScanner,
+    'compact': CompactScanner,
+}
+
+# tree 和 closure 引擎每层 Lox 调用占用的 Python 栈帧数的上限估计（语句和表达式嵌套越深用得越多）
+FRAMES_PER_CALL = 40
+
+def stack_overflow(e, env):
+    '''
+    Python 3.11 之前递归限制不能放宽到 max_depth 层 Lox 调用需要的栈帧数（见 recursion_limit），更浅处就会出现 RecursionError：
+    报告成 Lox 的 Stack overflow.，位置取调用栈中最内层的 Lox 调用（tree 引擎的 Call 节点，closure 引擎调用闭包中的 paren）
+    '''
+    paren = Token(TokenType.RIGHT_PAREN, ')', None, 0)
+    tb = e.__traceback__
+    while tb is not None:
+        frame_locals = tb.tb_frame.f_locals
+        if isinstance(frame_locals.get('self'), my_expr.Call):
+            paren = frame_locals['self'].paren
+        elif isinstance(frame_locals.get('paren'), Token):
+            paren = frame_locals['paren']
+        tb = tb.tb_next
+    env.runtime_error(paren, 'Stack overflow.')
+
+def walk(statements, env):
+    for statement in statements[:-1]:
+        statement.exec(env)
+    if len(statements) > 0:
+        last = statements[-1]
+        if isinstance(last, my_stmt.Expression):
+            return last.expr.eval(env)
+        last.exec(env)
+    return None
+
+def exec_tree(statements, env):
+    '''
+    最后一条语句是表达式语句时返回它的值（命令行模式会打印）
+    '''
+    with recursion_limit(env.max_depth * FRAMES_PER_CALL):
+        try:
+            return walk(statements, env)
+        except RecursionError as e:
+            overflow = e
+    stack_overflow(overflow, env) # 在 except 之外报告，runtime_error 重新抛出的是 RuntimeError
+
+def exec_tiered(statements, env, threshold=my_tier.THRESHOLD, background=True):
+    '''
+    由树遍历解释器执行，热函数的函数体翻译成闭包后执行（见 my_tier）；background 为 False 时在主线程中翻译
+    '''
+    my_tier.instrument(statements, threshold, background)
+    return exec_tree(statements, env)
+
+def exec_vm(statements, env):
+    return VM(env).interpret(statements)
+
+def exec_closure(statements, env):
+    program = ClosureCompiler().compile(statements)
+    with recursion_limit(env.max_depth * FRAMES_PER_CALL):
+        try:
+            return program(env)
+        except RecursionError as e:
+            overflow = e
+    stack_overflow(overflow, env)
+
+def exec_python(statements, env):
+    source = Transpiler().transpile(statements)
+    namespace = {'__lox_lines__': source.splitlines()} # 报告 Stack overflow. 时用来查找 Lox 行号
+    exec(compile(source, '<lox>', 'exec'), namespace)
+    return run_main(namespace['main'], env)
+
+engines = {
+    'tree': exec_tree,
+    'tiered': exec_tiered,
+    'vm': exec_vm,
+    'closure': exec_closure,
+    'python': exec_python,
+}
+
+def resolve(statements, resolver, optimize=True):
+    '''
+    变量解析，然后按需做常量折叠、死分支消除和类型推导
+    '''
     for statement in statements:
         statement.resolve(resolver)
-    for statement in statements:
-        value = statement.exec(env)
-    return value
+    if optimize:
+        statements = Optimizer().optimize(statements)
+        statements = Inferrer().infer(statements)
+    return statements
 
-def run_file(path):
-    print('='*16 + f' run: {path} ' + '='*16)
+def run(src, resolver, env, scanner=Scanner, engine=exec_tree, optimize=True):
+    statements = Parser(scanner(src, env).scan_tokens(), env).parse()
+    return engine(resolve(statements, resolver, optimize), env)
+
+def run_stream(source, resolver, env, engine=exec_tree, optimize=True):
+    '''
+    流式执行：Token 按需从 StreamScanner 拉取，每条顶层声明解析完就立即解析变量并执行，
+    Token 占用的内存与脚本大小无关；扫描出错时停在出错的块之前，已经执行的声明不撤销
+    '''
+    try:
+        parser = Parser(TokenStream(StreamScanner(source, env).scan_iter()), env)
+        for statement in parser.parse_iter():
+            engine(resolve([statement], resolver, optimize), env)
+    except ScanError: # 错误已经由 scan_error 报告
+        pass
+
+def load_file(path, env, scanner=Scanner, cache=True, cache_dir=None, optimize=True):
+    '''
+    读入脚本并完成扫描、解析和变量解析，返回可以执行的语句列表
+    源码和解释器都没有变化时直接使用编译缓存；有错误的脚本不写缓存，下次运行仍会报告错误
+    '''
     with open(path, 'r') as f:
-        resolver = Resolver()
-        env = Env()
-        env.values.update(native_table)
-        run(f.read(), resolver, env)
-
-def run_prompt():
-    resolver = Resolver()
-    env = Env()
+        src = f.read()
+    if cache:
+        statements = my_cache.load(path, src, cache_dir, optimize)
+        if statements is not None:
+            return statements
+    s = scanner(src, env)
+    parser = Parser(s.scan_tokens(), env)
+    statements = parser.parse()
+    statements = resolve(statements, Resolver(optimize), optimize)
+    if cache and s.ok and parser.ok:
+        my_cache.store(path, src, statements, cache_dir, optimize)
+    return statements
+
+def run_file(path, scanner=Scanner, stream=False, engine=exec_tree, cache=True, cache_dir=None, optimize=True,
+             max_depth=MAX_DEPTH):
+    print('='*16 + f' run: {path} ' + '='*16)
+    env = GlobalEnv(max_depth)
+    env.values.update(native_table)
+    if stream:
+        with open(path, 'rb') as f:
+            try:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError): # 空文件、管道等无法映射
+                source = open(path, 'r')
+            with source:
+                run_stream(source, Resolver(optimize), env, engine, optimize)
+    else:
+        engine(load_file(path, env, scanner, cache, cache_dir, optimize), env)
+
+def emit_file(path, out_dir, scanner=Scanner, optimize=True):
+    '''
+    把脚本翻译成 Python 模块写入 out_dir 并预先编译出 .pyc，
+    生成的模块可以直接运行（python out_dir/name.py，需要能导入 my_transpiler）
+    '''
+    statements = load_file(path, GlobalEnv(), scanner, optimize=optimize)
+    name = os.path.splitext(os.path.basename(path))[0]
+    out = os.path.join(out_dir, f'{name}.py')
+    os.makedirs(out_dir, exist_ok=True)
+    with open(out, 'w') as f:
+        f.write(Transpiler().transpile(statements, path))
+    py_compile.compile(out, doraise=True)
+    print(f'{path} -> {out}')
+
+def print_quicken_stats():
+    '''
+    树遍历引擎特化的表达式个数，写到标准错误输出，不影响程序的输出
+    '''
+    total = sum(my_expr.specialized.values())
+    print(f'specialized {total} sites, despecialized {sum(my_expr.despecialized.values())}', file=sys.stderr)
+    for name, n in my_expr.specialized.most_common():
+        print(f'  {name:<14}{n:>6}{my_expr.despecialized[name]:>6}', file=sys.stderr)
+
+def print_infer_stats():
+    '''
+    类型推导去掉的操作数类型检查个数（从编译缓存加载的脚本不经过类型推导，不计入）
+    '''
+    print(f'type inference removed {sum(my_infer.removed.values())} of {sum(my_infer.checks.values())} operand checks',
+          file=sys.stderr)
+    for op, n in my_infer.checks.most_common():
+        print(f'  {op:<4}{my_infer.removed[op]:>6}{n:>6}', file=sys.stderr)
+
+def print_tier_stats():
+    '''
+    tiered 引擎中达到阈值的函数和它们现在所在的层，写到标准错误输出
+    '''
+    compiled = sum(body.code is not None for body in my_tier.hot)
+    print(f'tiered up {len(my_tier.hot)} functions, {compiled} running compiled, '
+          f'deoptimized {sum(body.deopts for body in my_tier.hot)} times', file=sys.stderr)
+    for body in my_tier.hot:
+        state = 'compiled' if body.code is not None else 'interpreted'
+        line = f'  {body.name.lexme:<14}line {body.name.line:<6}{state:<12}deopts {body.deopts}'
+        if body.reason is not None:
+            line += f' ({body.reason})'
+        print(line, file=sys.stderr)
+
+def run_prompt(scanner=Scanner, engine=exec_tree, optimize=True, max_depth=MAX_DEPTH):
+    resolver = Resolver(optimize)
+    env = GlobalEnv(max_depth)
     env.values.update(native_table)
     while True:
         print('> ', end='')
         try:
-            value = run(input(), resolver, env)
+            value = run(input(), resolver, env, scanner, engine, optimize)
             if value is not None:
                 print(f'{value}')
         except KeyboardInterrupt:
@@ -41,9 +227,56 @@ def run_prompt():
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 1:
-        run_prompt()
+    arg_parser = argparse.ArgumentParser(description='lox interpreter')
+    arg_parser.add_argument('--scanner', choices=scanners.keys(), default='char',
+                            help='词法分析器：char 逐字符扫描，regex 单次正则扫描，compact 正则扫描并紧凑存储 Token')
+    arg_parser.add_argument('--stream', action='store_true',
+                            help='流式读取脚本，边解析边执行（总是使用正则扫描）')
+    arg_parser.add_argument('--engine', choices=engines.keys(), default='tree',
+                            help='执行引擎：tree 遍历语法树，tiered 遍历语法树并把热函数翻译成 Python 闭包，vm 编译成字节码后在栈式虚拟机上执行，closure 把语法树翻译成 Python 闭包后执行，python 翻译成 Python 源码后由 CPython 执行')
+    arg_parser.add_argument('--no-cache', action='store_true',
+                            help='不读写编译缓存')
+    arg_parser.add_argument('--cache-dir', metavar='DIR',
+                            help='编译缓存目录，默认是脚本所在目录下的 __loxcache__')
+    arg_parser.add_argument('--no-optimize', action='store_true',
+                            help='关闭常量折叠、死分支消除、类型推导和作用域合并')
+    arg_parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, metavar='N',
+                            help=f'Lox 函数调用深度上限，超过时报告 Stack overflow.（默认 {MAX_DEPTH}）；'
+                                 'python 引擎不逐层计数，由 CPython 的递归限制约束，实际上限在 N 和 2N 之间')
+    arg_parser.add_argument('--emit-python', metavar='DIR',
+                            help='不运行脚本，把它们翻译成 Python 模块写入 DIR')
+    arg_parser.add_argument('--quicken-stats', action='store_true',
+                            help='运行结束后在标准错误输出中显示 tree 引擎特化的表达式个数（按特化后的类型）和退回通用实现的个数')
+    arg_parser.add_argument('--infer-stats', action='store_true',
+                            help='运行结束后在标准错误输出中显示类型推导去掉的操作数类型检查个数（按运算符；从编译缓存加载的脚本不计入）')
+    arg_parser.add_argument('--tier-threshold', type=int, default=my_tier.THRESHOLD, metavar='N',
+                            help=f'tiered 引擎中函数的调用次数加循环迭代次数达到 N 时翻译它的函数体（默认 {my_tier.THRESHOLD}）')
+    arg_parser.add_argument('--tier-sync', action='store_true',
+                            help='tiered 引擎在主线程中翻译热函数，默认在后台线程中翻译，翻译期间继续遍历语法树执行')
+    arg_parser.add_argument('--tier-stats', action='store_true',
+                            help='运行结束后在标准错误输出中显示 tiered 引擎翻译了哪些函数、退回树遍历解释器的次数和原因')
+    arg_parser.add_argument('scripts', nargs='*', help='要运行的 lox 脚本，不指定则进入命令行模式')
+    args = arg_parser.parse_args()
+    scanner = scanners[args.scanner]
+    engine = engines[args.engine]
+    if engine is exec_tiered:
+        engine = functools.partial(exec_tiered, threshold=args.tier_threshold, background=not args.tier_sync)
+    optimize = not args.no_optimize
+    if args.emit_python is not None:
+        for script in args.scripts:
+            emit_file(script, args.emit_python, scanner, optimize)
+    elif len(args.scripts) == 0:
+        run_prompt(scanner, engine, optimize, args.max_depth)
     else:
-        for i in range(1, len(sys.argv)):
-            run_file(sys.argv[i])
+        try:
+            for script in args.scripts:
+                run_file(script, scanner, args.stream, engine, not args.no_cache, args.cache_dir, optimize,
+                         args.max_depth)
+        finally: # 出错时也显示
+            if args.quicken_stats:
+                print_quicken_stats()
+            if args.infer_stats:
+                print_infer_stats()
+            if args.tier_stats:
+                print_tier_stats()
 
@@ -1,8 +1,10 @@
 
 import time
-from my_type import Func
+from my_type import Func, flatten
 
 class ClockNativeFunc(Func):
+    __slots__ = ('arity_',)
+
     def __init__(self, arity):
         self.arity_ = arity
 
@@ -16,6 +18,8 @@ class ClockNativeFunc(Func):
         return time.time()
 
 class OpenNativeFunc(Func):
+    __slots__ = ('arity_',)
+
     def __init__(self, arity):
         self.arity_ = arity
 
@@ -26,9 +30,11 @@ class OpenNativeFunc(Func):
         return self.arity_
 
     def call(self, arguments):
-        return open(arguments[0])
+        return open(flatten(arguments[0]))
 
 class ReadNativeFunc(Func):
+    __slots__ = ('arity_',)
+
     def __init__(self, arity):
         self.arity_ = arity
 
@@ -42,6 +48,8 @@ class ReadNativeFunc(Func):
         return arguments[0].read()
 
 class CloseNativeFunc(Func):
+    __slots__ = ('arity_',)
+
     def __init__(self, arity):
         self.arity_ = arity
 
@@ -0,0 +1,338 @@
+
+import my_expr
+import my_stmt
+
+class Optimizer:
+    '''
+    常量折叠和死分支消除：
+    字面量之间的运算在这里算好，Grouping 直接去掉，条件为常量的 Logical/If/While/For 只保留会执行的部分
+    循环中的不变表达式换成 Invariant，每次进入循环只求值一次
+    只折叠一定不会出错的运算（类型不对、除以 0 都留到运行时，错误信息和行号不变）
+    在 Resolver 之后运行，死代码中的静态错误照常报告；被删掉的分支不含当前作用域的声明，Resolver 算出的槽位仍然有效
+    '''
+    def __init__(self):
+        self.stmt_table = {
+            my_stmt.Expression: self.expression_stmt,
+            my_stmt.Print: self.expression_stmt,
+            my_stmt.Var: self.var_stmt,
+            my_stmt.Block: self.block_stmt,
+            my_stmt.If: self.if_stmt,
+            my_stmt.While: self.while_stmt,
+            my_stmt.For: self.for_stmt,
+            my_stmt.Function: self.function_stmt,
+            my_stmt.Return: self.return_stmt,
+            my_stmt.Break: self.control_stmt,
+            my_stmt.Continue: self.control_stmt,
+            my_stmt.Class: self.class_stmt,
+        }
+        self.expr_table = {
+            my_expr.Literal: self.literal,
+            my_expr.Unary: self.unary,
+            my_expr.Binary: self.binary,
+            my_expr.Logical: self.logical,
+            my_expr.Grouping: self.grouping,
+            my_expr.Invariant: self.literal,
+            my_expr.Variable: self.literal,
+            my_expr.Assign: self.assign,
+            my_expr.This: self.literal,
+            my_expr.Super: self.literal,
+            my_expr.Call: self.call,
+            my_expr.Get: self.get,
+            my_expr.Set: self.set,
+        }
+
+    def optimize(self, statements):
+        return self.stmts(statements)
+
+    def is_truthy(self, value):
+        return value is not None and value is not False
+
+    # ---------------- 语句 ----------------
+
+    def stmt(self, stmt):
+        '''
+        返回优化后的语句，整条语句不会执行时返回 None
+        '''
+        return self.stmt_table[type(stmt)](stmt)
+
+    def stmts(self, statements):
+        result = []
+        for statement in statements:
+            statement = self.stmt(statement)
+            if statement is not None:
+                result.append(statement)
+        return result
+
+    def body(self, stmt):
+        '''
+        if/while 的子语句不能是 None
+        '''
+        stmt = self.stmt(stmt)
+        if stmt is None:
+            stmt = my_stmt.Block([])
+        return stmt
+
+    def expression_stmt(self, stmt):
+        stmt.expr = self.expr(stmt.expr)
+        return stmt
+
+    def var_stmt(self, stmt):
+        if stmt.initializer is not None:
+            stmt.initializer = self.expr(stmt.initializer)
+        return stmt
+
+    def block_stmt(self, stmt):
+        stmt.statements = self.stmts(stmt.statements)
+        return stmt
+
+    def if_stmt(self, stmt):
+        condition = self.expr(stmt.condition)
+        if isinstance(condition, my_expr.Literal):
+            if self.is_truthy(condition.value):
+                return self.stmt(stmt.then_branch)
+            if stmt.else_branch is not None:
+                return self.stmt(stmt.else_branch)
+            return None
+        stmt.condition = condition
+        stmt.then_branch = self.body(stmt.then_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = self.stmt(stmt.else_branch)
+        return stmt
+
+    def while_stmt(self, stmt):
+        condition = self.expr(stmt.condition)
+        if isinstance(condition, my_expr.Literal) and not self.is_truthy(condition.value):
+            return None
+        stmt.condition = condition
+        stmt.body = self.body(stmt.body)
+        self.hoist(stmt)
+        return stmt
+
+    def for_stmt(self, stmt):
+        if stmt.initializer is not None:
+            stmt.initializer = self.stmt(stmt.initializer)
+        if stmt.condition is not None:
+            condition = self.expr(stmt.condition)
+            stmt.condition = condition
+            if isinstance(condition, my_expr.Literal):
+                if self.is_truthy(condition.value):
+                    stmt.condition = None
+                elif isinstance(stmt.initializer, my_stmt.Var): # 循环体不会执行，初始化语句还在自己的作用域中执行
+                    block = my_stmt.Block([stmt.initializer])
+                    block.size = stmt.size
+                    return block
+                else:
+                    return stmt.initializer
+        if stmt.increment is not None:
+            stmt.increment = self.expr(stmt.increment)
+        stmt.body = self.body(stmt.body)
+        self.hoist(stmt)
+        return stmt
+
+    def function_stmt(self, stmt):
+        self.block_stmt(stmt.body)
+        return stmt
+
+    def return_stmt(self, stmt):
+        if stmt.expr is not None:
+            stmt.expr = self.expr(stmt.expr)
+            stmt.tail = type(stmt.expr) is my_expr.Call # 折叠后成为调用的返回值，例如 return true and f(x);
+        return stmt
+
+    def control_stmt(self, stmt):
+        return stmt
+
+    def class_stmt(self, stmt):
+        for method in stmt.methods:
+            self.function_stmt(method)
+        return stmt
+
+    # ---------------- 表达式 ----------------
+
+    def expr(self, expr):
+        return self.expr_table[type(expr)](expr)
+
+    def literal(self, expr):
+        return expr
+
+    def grouping(self, expr):
+        return self.expr(expr.expr)
+
+    def unary(self, expr):
+        right = self.expr(expr.right)
+        if isinstance(right, my_expr.Literal):
+            if expr.operator.lexme == '!':
+                return my_expr.Literal(not self.is_truthy(right.value))
+            if isinstance(right.value, float):
+                return my_expr.Literal(-right.value)
+        expr.right = right
+        return expr
+
+    def binary(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        expr.left = left
+        expr.right = right
+        if not isinstance(left, my_expr.Literal) or not isinstance(right, my_expr.Literal):
+            return expr
+        a = left.value
+        b = right.value
+        op = expr.operator.lexme
+        if op == '==':
+            return my_expr.Literal(a == b)
+        if op == '!=':
+            return my_expr.Literal(a != b)
+        if op == '+' and isinstance(a, str) and isinstance(b, str):
+            return my_expr.Literal(a + b)
+        if not isinstance(a, float) or not isinstance(b, float):
+            return expr
+        if op == '+':
+            return my_expr.Literal(a + b)
+        if op == '-':
+            return my_expr.Literal(a - b)
+        if op == '*':
+            return my_expr.Literal(a * b)
+        if op == '/':
+            if b == 0: # ZeroDivisionError 留到运行时
+                return expr
+            return my_expr.Literal(a / b)
+        if op == '>':
+            return my_expr.Literal(a > b)
+        if op == '>=':
+            return my_expr.Literal(a >= b)
+        if op == '<':
+            return my_expr.Literal(a < b)
+        if op == '<=':
+            return my_expr.Literal(a <= b)
+        return expr
+
+    def logical(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        if isinstance(left, my_expr.Literal):
+            if self.is_truthy(left.value) == (expr.operator.lexme == 'or'):
+                return left
+            return right
+        expr.left = left
+        expr.right = right
+        return expr
+
+    def assign(self, expr):
+        expr.expr = self.expr(expr.expr)
+        return expr
+
+    def call(self, expr):
+        expr.callee = self.expr(expr.callee)
+        expr.arguments = [self.expr(argument) for argument in expr.arguments]
+        expr.invoke = type(expr.callee) is my_expr.Get # (obj.name)(...) 去掉括号后也是方法调用
+        return expr
+
+    def get(self, expr):
+        expr.expr = self.expr(expr.expr)
+        return expr
+
+    def set(self, expr):
+        expr.expr = self.expr(expr.expr)
+        expr.value = self.expr(expr.value)
+        return expr
+
+    # ---------------- 循环不变量 ----------------
+
+    # 表达式中子表达式所在的属性；Call 不在其中，含有调用的循环不做外提
+    expr_fields = {
+        my_expr.Unary: ('right',),
+        my_expr.Binary: ('left', 'right'),
+        my_expr.Logical: ('left', 'right'),
+        my_expr.Assign: ('expr',),
+        my_expr.Get: ('expr',),
+        my_expr.Set: ('expr', 'value'),
+        my_expr.Invariant: ('expr',),
+    }
+
+    def loop_slots(self, stmt, slots, declared):
+        '''
+        收集循环体中每次迭代会求值的表达式位置 (节点, 属性) 和声明的变量名
+        函数体和方法体不在循环中执行，不收集
+        '''
+        t = type(stmt)
+        if t is my_stmt.Block:
+            for statement in stmt.statements:
+                self.loop_slots(statement, slots, declared)
+        elif t is my_stmt.If:
+            slots.append((stmt, 'condition'))
+            self.loop_slots(stmt.then_branch, slots, declared)
+            if stmt.else_branch is not None:
+                self.loop_slots(stmt.else_branch, slots, declared)
+        elif t is my_stmt.While:
+            slots.append((stmt, 'condition'))
+            self.loop_slots(stmt.body, slots, declared)
+        elif t is my_stmt.For:
+            if stmt.initializer is not None:
+                self.loop_slots(stmt.initializer, slots, declared)
+            slots.append((stmt, 'condition'))
+            slots.append((stmt, 'increment'))
+            self.loop_slots(stmt.body, slots, declared)
+        elif t is my_stmt.Var:
+            declared.add(stmt.name.lexme)
+            slots.append((stmt, 'initializer'))
+        elif t is my_stmt.Function or t is my_stmt.Class:
+            declared.add(stmt.name.lexme)
+        elif t is my_stmt.Break or t is my_stmt.Continue:
+            pass
+        else: # Expression、Print、Return
+            slots.append((stmt, 'expr'))
+
+    def scan(self, expr, assigned):
+        '''
+        记录表达式中被赋值的变量名，表达式中有调用时返回 False
+        '''
+        t = type(expr)
+        if t is my_expr.Call:
+            return False
+        if t is my_expr.Assign:
+            assigned.add(expr.name.lexme)
+        for k in self.expr_fields.get(t, ()):
+            if not self.scan(getattr(expr, k), assigned):
+                return False
+        return True
+
+    def is_invariant(self, expr, changed):
+        t = type(expr)
+        if t is my_expr.Literal or t is my_expr.This:
+            return True
+        if t is my_expr.Variable:
+            return expr.name.lexme not in changed
+        if t is my_expr.Unary or t is my_expr.Binary or t is my_expr.Logical or t is my_expr.Invariant:
+            return all(self.is_invariant(getattr(expr, k), changed) for k in self.expr_fields[t])
+        return False
+
+    def replace_invariants(self, expr, changed, loop):
+        t = type(expr)
+        if (t is my_expr.Unary or t is my_expr.Binary or t is my_expr.Logical) and self.is_invariant(expr, changed):
+            invariant = my_expr.Invariant(expr)
+            loop.invariants.append(invariant)
+            return invariant
+        if t is not my_expr.Invariant:
+            for k in self.expr_fields.get(t, ()):
+                setattr(expr, k, self.replace_invariants(getattr(expr, k), changed, loop))
+        return expr
+
+    def hoist(self, loop):
+        '''
+        循环中没有函数调用时，变量只会被循环中的赋值和声明改变；
+        由字面量、this 和循环中没有赋值或声明过的变量组成的运算每次迭代的结果都相同，
+        换成 Invariant 后只在第一次用到时求值（出错的时机也不变），循环每次开始时清空
+        '''
+        slots = [(loop, 'condition')]
+        if isinstance(loop, my_stmt.For):
+            slots.append((loop, 'increment'))
+        changed = set()
+        self.loop_slots(loop.body, slots, changed)
+        for node, k in slots:
+            expr = getattr(node, k)
+            if expr is not None and not self.scan(expr, changed):
+                return
+        for node, k in slots:
+            expr = getattr(node, k)
+            if expr is not None:
+                setattr(node, k, self.replace_invariants(expr, changed, loop))
@@ -1,36 +1,67 @@
 
 from my_token import TokenType
+from my_scanner import ScanError
 import my_expr
 import my_stmt
 
+class TokenStream:
+    '''
+    把 Token 迭代器包装成 Parser 使用的下标访问
+    Parser 按顺序逐个读取 tokens[current]，所以不保留已经读过的 Token，按需从迭代器拉取
+    '''
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.index = -1
+        self.cur = None
+
+    def __getitem__(self, index):
+        if index < self.index:
+            raise IndexError(f'token {index} already discarded')
+        while self.index < index:
+            self.cur = next(self.tokens, self.cur) # EOF 之后一直返回 EOF
+            self.index += 1
+        return self.cur
+
 class Parser:
+    '''
+    tokens 可以是 list、TokenBuffer 或 TokenStream，Parser 只按顺序读取 tokens[current]，
+    当前和前一个 Token 保存在 cur/prev 中，不重复下标访问
+    '''
     def __init__(self, tokens, env):
         self.tokens = tokens
         self.env = env
         self.current = 0
+        self.cur = tokens[0]
+        self.prev = None
+        self.ok = True
+
+    def advance(self):
+        self.prev = self.cur
+        self.current += 1
+        self.cur = self.tokens[self.current]
 
     def peek(self):
-        return self.tokens[self.current]
+        return self.cur
 
     def check(self, type_):
-        return self.peek().type_ == type_
+        return self.cur.type_ == type_
 
     def match(self, *types):
-        if self.peek().type_ in types:
-            self.current += 1
+        if self.cur.type_ in types:
+            self.advance()
             return True
         else:
             return False
 
     def consume(self, type_, msg):
-        if self.check(type_):
-            self.current += 1
-            return self.tokens[self.current-1]
+        if self.cur.type_ == type_:
+            self.advance()
+            return self.prev
         else:
-            self.env.parse_error(self.tokens[self.current], msg)
+            self.env.parse_error(self.cur, msg)
 
     def previous(self):
-        return self.tokens[self.current-1]
+        return self.prev
 
     '''
     expression      ->      assignment
@@ -72,7 +103,7 @@ class Parser:
                 return my_expr.Assign(expr.name, value)
             elif isinstance(expr, my_expr.Get):
                 return my_expr.Set(expr.expr, expr.name, value)
-            self.env.parse_error(self.tokens[self.current], f'Invalid assignment target.')
+            self.env.parse_error(self.cur, f'Invalid assignment target.')
         return expr
 
     def logic_or(self):
@@ -148,7 +179,7 @@ class Parser:
             arguments.append(self.expression())
             while self.match(TokenType.COMMA):
                 if len(arguments) >= 255:
-                    self.env.parse_error(self.tokens[self.current], f'Can not have more than 255 arguments.')
+                    self.env.parse_error(self.cur, f'Can not have more than 255 arguments.')
                 arguments.append(self.expression())
         paren = self.consume(TokenType.RIGHT_PAREN, f'Expect ) after arguments.')
         return my_expr.Call(expr, arguments, paren)
@@ -175,7 +206,7 @@ class Parser:
             expr = self.expression()
             self.consume(TokenType.RIGHT_PAREN, f'Expect ) after expression.')
             return my_expr.Grouping(expr)
-        self.env.parse_error(self.tokens[self.current], f'Expect expression.')
+        self.env.parse_error(self.cur, f'Expect expression.')
 
     '''
     statement               ->      print_statement
@@ -184,6 +215,8 @@ class Parser:
                                 |   while_statement
                                 |   for_statement
                                 |   return_statement
+                                |   break_statement
+                                |   continue_statement
                                 |   expression_statement
 
     print_statement         ->      'print' expression ';'
@@ -200,6 +233,10 @@ class Parser:
 
     return_statement        ->      'return' expression? ';'
 
+    break_statement         ->      'break' ';'
+
+    continue_statement      ->      'continue' ';'
+
     expression_statement    ->      expression ';'
     '''
 
@@ -216,6 +253,10 @@ class Parser:
             return self.for_statement()
         elif self.match(TokenType.RETURN):
             return self.return_statement()
+        elif self.match(TokenType.BREAK):
+            return self.break_statement()
+        elif self.match(TokenType.CONTINUE):
+            return self.continue_statement()
         else:
             return self.expression_statement()
 
@@ -270,14 +311,7 @@ class Parser:
             increment = self.expression()
         self.consume(TokenType.RIGHT_PAREN, f'Expect ) after for clauses.')
         body = self.statement()
-        if increment is not None:
-            body = my_stmt.Block([body, my_stmt.Expression(increment)])
-        if condition is None:
-            condition = my_expr.Literal(True)
-        body = my_stmt.While(condition, body)
-        if initializer is not None:
-            body = my_stmt.Block([initializer, body])
-        return body
+        return my_stmt.For(initializer, condition, increment, body)
 
     def return_statement(self):
         ret = self.previous()
@@ -287,6 +321,16 @@ class Parser:
         self.consume(TokenType.SEMICOLON, f'Expect ; after return expression.')
         return my_stmt.Return(ret, expr)
 
+    def break_statement(self):
+        keyword = self.previous()
+        self.consume(TokenType.SEMICOLON, f'Expect ; after break.')
+        return my_stmt.Break(keyword)
+
+    def continue_statement(self):
+        keyword = self.previous()
+        self.consume(TokenType.SEMICOLON, f'Expect ; after continue.')
+        return my_stmt.Continue(keyword)
+
     '''
     declaration             ->      var_declaration
                                 |   fun_declaration
@@ -330,7 +374,7 @@ class Parser:
             parameters.append(self.consume(TokenType.IDENTIFIER, f'Expect parameter name.'))
             while self.match(TokenType.COMMA):
                 if len(parameters) >= 255:
-                    self.env.parse_error(self.tokens[self.current], f'Can not have more than 255 parameters.')
+                    self.env.parse_error(self.cur, f'Can not have more than 255 parameters.')
                 parameters.append(self.consume(TokenType.IDENTIFIER, f'Expect parameter name.'))
         self.consume(TokenType.RIGHT_PAREN, f'Expect ) after parameters.')
         self.consume(TokenType.LEFT_BRACE, f'Expect {{ before {type_} body.')
@@ -351,23 +395,33 @@ class Parser:
         return my_stmt.Class(name, sp, methods)
 
     def parse(self):
-        ok = True
-        statements = []
+        statements = list(self.parse_iter())
+        if not self.ok:
+            return []
+        return statements
+
+    def parse_iter(self):
+        '''
+        逐条产出顶层声明，配合 TokenStream 可以边解析边执行
+        出现语法错误后继续同步并报告后面的错误，但不再产出声明；Token 流的 ScanError 原样抛出
+        '''
         while not self.check(TokenType.EOF):
             try:
-                statements.append(self.declaration())
+                statement = self.declaration()
+            except ScanError:
+                raise
             except:
-                ok = False
+                self.ok = False
                 self.synchronize()
-        if not ok:
-            return []
-        return statements
+                continue
+            if self.ok:
+                yield statement
 
     def synchronize(self):
         while not self.check(TokenType.EOF):
-            if self.peek().type_ in [TokenType.CLASS, TokenType.FUN, TokenType.VAR, TokenType.FOR, TokenType.IF, TokenType.WHILE, TokenType.PRINT, TokenType.RETURN]:
+            if self.peek().type_ in [TokenType.CLASS, TokenType.FUN, TokenType.VAR, TokenType.FOR, TokenType.IF, TokenType.WHILE, TokenType.PRINT, TokenType.RETURN, TokenType.BREAK, TokenType.CONTINUE]:
                 return
-            self.current += 1
+            self.advance()
             if self.previous().type_ in [TokenType.SEMICOLON, TokenType.RIGHT_BRACE]:
                 return
 
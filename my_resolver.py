@@ -13,12 +13,38 @@ class ClsType(Enum):
     CLASS = auto()
     SUBCLASS = auto()
 
+IMMUTABLE = ('this', 'super') # 不能被赋值，捕获时直接复制值，不装箱
+
+class Frame:
+    '''
+    正在解析的函数（或顶层代码）：base 是它最外层的作用域（参数，方法是 this）在 scopes 中的下标
+    upvalues 是它捕获的外层函数中的变量，按下标依次是函数声明处到这个变量的 Cell 的 (距离, 槽位)，创建函数时按这个顺序取出
+    '''
+    def __init__(self, base):
+        self.base = base
+        self.upvalues = []
+        self.index = {} # (作用域下标, 变量名) -> upvalues 中的下标
+
 class Resolver:
-    def __init__(self):
+    '''
+    变量解析：局部变量按 (距离, 槽位) 访问；被内层函数捕获的局部变量装箱成 Cell，引用它的节点的 cell 为 True
+    函数只持有它捕获的 Cell（放在参数作用域外面的一层 Env 中），不持有定义处的整条作用域链
+    flatten 为 True 时块和 for 的作用域不创建自己的 Env：闭包不会持有它们的 Env（被捕获的变量在 Cell 中），
+    所以它们的变量直接放在外层参数、this、super 或顶层作用域的 Env 中，依次在后面分配槽位，作用域结束后槽位留给后面的块
+    '''
+    def __init__(self, flatten=True):
+        self.flatten = flatten
         self.scopes = []
-        self.locals = {}
+        self.slots = [] # 与 scopes 一一对应，记录每个局部变量在它所在的 Env 中的槽位
+        self.levels = [] # 与 scopes 一一对应，从最外层作用域到这个作用域（包括它）共创建几层 Env，相减得到距离
+        self.tops = [] # 与 scopes 一一对应，作用域中下一个变量的槽位
+        self.owners = [] # 创建 Env 的作用域在 scopes 中的下标和这个 Env 的大小
+        self.uses = [] # 与 scopes 一一对应，变量名 -> 引用它的节点（包括声明），变量被捕获时把这些节点的 cell 设为 True
+        self.captured = [] # 与 scopes 一一对应，被内层函数捕获的变量名
+        self.frames = [Frame(0)]
         self.current_function = FuncType.NONE
         self.current_class = ClsType.NONE
+        self.loop_depth = 0 # 当前函数中包围当前语句的循环层数，break/continue 只能出现在循环中
 
     def resolve_error(self, token, msg):
         print(f'[Line {token.line}] resolve error at {token.lexme}, {msg}')
@@ -35,11 +61,85 @@ class Resolver:
             return False
         return self.scopes[-1][k] == value
 
-    def begin_scope(self):
+    def begin_scope(self, own=False):
+        '''
+        own 为 True 表示运行时一定为这个作用域创建 Env（参数、this、super）
+        '''
+        own = own or not self.flatten or len(self.scopes) == 0
+        level = self.levels[-1] if self.levels else 0
+        if own:
+            self.owners.append([len(self.scopes), 0])
+            self.levels.append(level + 1)
+            self.tops.append(0)
+        else:
+            self.levels.append(level)
+            self.tops.append(self.tops[-1])
         self.scopes.append({})
+        self.slots.append({})
+        self.uses.append({})
+        self.captured.append(set())
 
     def end_scope(self):
+        '''
+        返回运行时 Env 的大小；作用域合并到外层的 Env 中时返回 None
+        '''
         self.scopes.pop()
+        uses = self.uses.pop()
+        for k in self.captured.pop():
+            for node in uses.get(k, ()):
+                node.cell = True
+        self.slots.pop()
+        self.levels.pop()
+        self.tops.pop()
+        if self.owners[-1][0] == len(self.scopes):
+            return self.owners.pop()[1]
+        return None
+
+    def captured_slots(self):
+        '''
+        当前作用域中被捕获的变量的槽位
+        '''
+        return sorted(self.slots[-1][k] for k in self.captured[-1])
+
+    def begin_function(self):
+        '''
+        在函数最外层的作用域开始之前调用；一个类的所有方法共用一个 Frame，最外层的作用域是 this
+        '''
+        self.frames.append(Frame(len(self.scopes)))
+
+    def end_function(self):
+        '''
+        返回函数捕获的变量在声明处的 (距离, 槽位) 列表
+        '''
+        return self.frames.pop().upvalues
+
+    def upvalue(self, f, i, k):
+        '''
+        第 f 层函数捕获作用域 i 中的变量 k，返回它在这个函数的 upvalues 中的下标；
+        变量不在直接外层的函数中时，外层函数也要先捕获它
+        '''
+        frame = self.frames[f]
+        key = (i, k)
+        if key not in frame.index:
+            enclosing = self.frames[f-1]
+            site = self.levels[frame.base - 1] # 函数声明所在的作用域
+            if i >= enclosing.base:
+                if k not in IMMUTABLE:
+                    self.captured[i].add(k)
+                frame.upvalues.append((site - self.levels[i], self.slots[i][k]))
+            else:
+                frame.upvalues.append((site - self.levels[enclosing.base] + 1, self.upvalue(f - 1, i, k)))
+            frame.index[key] = len(frame.upvalues) - 1
+        return frame.index[key]
+
+    def slot(self, k):
+        slots = self.slots[-1]
+        if k not in slots:
+            slots[k] = self.tops[-1]
+            self.tops[-1] += 1
+            owner = self.owners[-1]
+            owner[1] = max(owner[1], self.tops[-1])
+        return slots[k]
 
     def declare(self, name):
         if len(self.scopes) == 0:
@@ -47,19 +147,41 @@ class Resolver:
         if name.lexme in self.scopes[-1]:
             self.resolve_error(name, 'Already a variable with this name in this scope.')
         self.scopes[-1][name.lexme] = False
+        self.slot(name.lexme)
 
-    def define(self, name):
+    def define(self, name, node=None):
+        '''
+        返回变量的槽位，全局变量返回 None
+        node 是声明语句，变量被捕获时它的 cell 设为 True，执行时把值装箱成 Cell
+        '''
         if isinstance(name, Token):
             k = name.lexme
         else:
             k = name
         if len(self.scopes) == 0:
-            return
+            return None
         self.scopes[-1][k] = True
+        if node is not None:
+            self.uses[-1].setdefault(k, []).append(node)
+        return self.slot(k)
 
-    def resolve_local(self, expr, name):
+    def resolve_local(self, name, node):
+        '''
+        返回局部变量的 (距离, 槽位)，全局变量返回 (None, None)
+        当前函数中的变量按作用域计算距离；外层函数中的变量由当前函数捕获，
+        距离指向参数作用域外面存放 Cell 的那层 Env，槽位是它在 upvalues 中的下标
+        '''
+        if isinstance(name, Token):
+            k = name.lexme
+        else:
+            k = name
         for i in range(len(self.scopes)-1, -1, -1):
-            if name.lexme in self.scopes[i]:
-                self.locals[expr] = len(self.scopes) - 1 - i
-                return
+            if k in self.scopes[i]:
+                frame = self.frames[-1]
+                if i >= frame.base:
+                    self.uses[i].setdefault(k, []).append(node)
+                    return self.levels[-1] - self.levels[i], self.slots[i][k]
+                node.cell = k not in IMMUTABLE
+                return self.levels[-1] - self.levels[frame.base] + 1, self.upvalue(len(self.frames) - 1, i, k)
+        return None, None
 
@@ -1,5 +1,16 @@
 
-from my_token import TokenType, Token
+import re
+import gc
+import io
+import mmap
+import codecs
+import locale
+from my_token import TokenType, Token, TokenBuffer
+
+class ScanError(Exception):
+    '''
+    流式扫描出现过错误：扫描完剩余部分后结束 Token 流，错误已经由 scan_error 报告
+    '''
 
 class Scanner:
     def __init__(self, source, env):
@@ -36,7 +47,9 @@ class Scanner:
 
         self.key_map = {
             'and': lambda: self.add_token(TokenType.AND),
+            'break': lambda: self.add_token(TokenType.BREAK),
             'class': lambda: self.add_token(TokenType.CLASS),
+            'continue': lambda: self.add_token(TokenType.CONTINUE),
             'else': lambda: self.add_token(TokenType.ELSE),
             'false': lambda: self.add_token(TokenType.FALSE),
             'for': lambda: self.add_token(TokenType.FOR),
@@ -141,15 +154,241 @@ class Scanner:
             self.env.scan_error(self.line, f'Unexpected character {c}.')
 
     def scan_tokens(self):
-        ok = True
+        self.ok = True
         while not self.is_end():
             self.start = self.current
             try:
                 self.scan_token()
             except:
-                ok = False
+                self.ok = False
+        self.tokens.append(Token(TokenType.EOF, 'EOF', None, self.line))
+        if not self.ok:
+            return [Token(TokenType.EOF, 'EOF', None, 0)]
+        return self.tokens
+
+# 所有词法规则合并成一个主正则，每次匹配先吞掉行内空白，再按分组顺序（即优先级）匹配一个词素：
+# 注释必须排在运算符之前，否则 // 会被切成两个 /
+# 未闭合的字符串只可能出现在源码末尾（有闭合引号时 STRING 分组已先匹配）
+# 最后的 ERROR 分组兜底任意单个非空白字符，保证除末尾空白外不会跳过任何字符（末尾空白处没有匹配，finditer 直接跳过；
+# ERROR 不能匹配空白，否则回溯后会把末尾空白报告成 Unexpected character；不用 Python 3.11 才支持的独占量词 *+）
+token_pattern = re.compile(r'''[ \t\r]*(?:
+    (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<comment>//[^\n]*)
+  | (?P<operator>!=|==|>=|<=|[-(){}.,;+*/!=<>])
+  | (?P<newline>\n)
+  | (?P<number>[0-9]+(?:\.[0-9]+)?)
+  | (?P<string>"[^"]*")
+  | (?P<unterminated>"[^"]*)
+  | (?P<error>[^ \t\r])
+)''', re.VERBOSE | re.DOTALL)
+
+# token_pattern 的分组编号，配合 match.lastindex 使用
+IDENTIFIER, COMMENT, OPERATOR, NEWLINE, NUMBER, STRING, UNTERMINATED, ERROR = range(1, 9)
+
+operator_map = {
+    '(': TokenType.LEFT_PAREN,
+    ')': TokenType.RIGHT_PAREN,
+    '{': TokenType.LEFT_BRACE,
+    '}': TokenType.RIGHT_BRACE,
+    '.': TokenType.DOT,
+    ',': TokenType.COMMA,
+    ';': TokenType.SEMICOLON,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.STAR,
+    '/': TokenType.SLASH,
+    '!': TokenType.BANG,
+    '!=': TokenType.BANG_EQUAL,
+    '=': TokenType.EQUAL,
+    '==': TokenType.EQUAL_EQUAL,
+    '>': TokenType.GREATER,
+    '>=': TokenType.GREATER_EQUAL,
+    '<': TokenType.LESS,
+    '<=': TokenType.LESS_EQUAL,
+}
+
+keyword_map = {
+    'and': TokenType.AND,
+    'break': TokenType.BREAK,
+    'class': TokenType.CLASS,
+    'continue': TokenType.CONTINUE,
+    'else': TokenType.ELSE,
+    'false': TokenType.FALSE,
+    'for': TokenType.FOR,
+    'fun': TokenType.FUN,
+    'if': TokenType.IF,
+    'nil': TokenType.NIL,
+    'or': TokenType.OR,
+    'print': TokenType.PRINT,
+    'return': TokenType.RETURN,
+    'super': TokenType.SUPER,
+    'this': TokenType.THIS,
+    'true': TokenType.TRUE,
+    'var': TokenType.VAR,
+    'while': TokenType.WHILE,
+}
+
+class RegexScanner:
+    '''
+    与 Scanner 输出完全相同的 Token 序列（包括行号和 scan_error 的行为），
+    但用 token_pattern 一次切分整个源码，不再逐字符调用 advance/peek
+    '''
+    def __init__(self, source, env):
+        self.source = source
+        self.env = env
+        self.tokens = []
+        self.line = 1
+        self.ok = True
+
+    def scan_chunk(self, text, final, append):
+        '''
+        扫描 text 并把 Token 交给 append，返回扫描停止的位置
+        final 为 False 时 text 只是源码的一段：结尾处的词素可能被截断（标识符、数字、//、!= 等），
+        所以离结尾不足两个字符的匹配留给下一段，数字 1.5 的小数部分也因此不会被切开
+        '''
+        line = self.line
+        limit = len(text) + 1 if final else len(text) - 2
+        stop = len(text)
+        for m in token_pattern.finditer(text):
+            if m.end() > limit:
+                stop = m.start()
+                break
+            kind = m.lastindex
+            lexme = m[kind]
+            if kind == IDENTIFIER:
+                append(Token(keyword_map.get(lexme, TokenType.IDENTIFIER), lexme, None, line))
+            elif kind == OPERATOR:
+                append(Token(operator_map[lexme], lexme, None, line))
+            elif kind == NEWLINE:
+                line += 1
+            elif kind == NUMBER:
+                append(Token(TokenType.NUMBER, lexme, float(lexme), line))
+            elif kind == COMMENT:
+                pass
+            elif kind == STRING:
+                line += lexme.count('\n')
+                append(Token(TokenType.STRING, lexme, lexme[1:-1], line))
+            else:
+                if kind == UNTERMINATED:
+                    line += lexme.count('\n')
+                    msg = f'Unterminated string.'
+                else:
+                    msg = f'Unexpected character {lexme}.'
+                try:
+                    self.env.scan_error(line, msg)
+                except:
+                    self.ok = False
+        self.line = line
+        return stop
+
+    def scan_tokens(self):
+        # Token 对象之间没有循环引用，扫描期间关闭 gc，避免百万级对象反复触发分代回收
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.scan_chunk(self.source, True, self.tokens.append)
+        finally:
+            if gc_enabled:
+                gc.enable()
         self.tokens.append(Token(TokenType.EOF, 'EOF', None, self.line))
-        if not ok:
+        if not self.ok:
             return [Token(TokenType.EOF, 'EOF', None, 0)]
         return self.tokens
 
+class StreamScanner(RegexScanner):
+    '''
+    流式扫描：source 可以是文本文件对象（read(n) 返回 str），也可以是 mmap/bytes 这类字节缓冲区，
+    按块读取并逐个产出 Token，内存里只保留当前块
+    字节缓冲区按 open(path, 'r') 的方式解码（本地编码 + 通用换行），保证与 run_file 读到的源码一致
+    出现扫描错误后不再产出 Token，继续扫描剩余部分以报告所有错误，最后抛出 ScanError 而不是产出 EOF，
+    Parser 不会在已经产出的半条声明之后读到 EOF 而多报一个语法错误
+    '''
+    def __init__(self, source, env, chunk_size=1 << 16):
+        super().__init__(source, env)
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        if hasattr(self.source, 'read') and not isinstance(self.source, mmap.mmap):
+            yield from iter(lambda: self.source.read(self.chunk_size), '')
+            return
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+        decoder = io.IncrementalNewlineDecoder(decoder, translate=True)
+        # 直接切片复制出每块字节，不持有 memoryview：执行出错时生成器还挂在调用栈上，mmap 仍需能正常关闭
+        for pos in range(0, len(self.source), self.chunk_size):
+            yield decoder.decode(self.source[pos:pos+self.chunk_size])
+        yield decoder.decode(b'', final=True)
+
+    def scan_iter(self):
+        text = ''
+        tokens = []
+        for chunk in self.chunks():
+            text += chunk
+            stop = self.scan_chunk(text, False, tokens.append)
+            text = text[stop:]
+            if self.ok:
+                yield from tokens
+            tokens.clear()
+        self.scan_chunk(text, True, tokens.append)
+        if not self.ok:
+            raise ScanError()
+        yield from tokens
+        yield Token(TokenType.EOF, 'EOF', None, self.line)
+
+keyword_codes = {k: t.value for k, t in keyword_map.items()}
+operator_codes = {k: t.value for k, t in operator_map.items()}
+
+class CompactScanner(RegexScanner):
+    '''
+    与 RegexScanner 相同的切分规则，但结果存入 TokenBuffer：只记录类型、起止偏移和行号，
+    不为每个 Token 创建对象和词素字符串
+    '''
+    def scan_tokens(self):
+        source = self.source
+        buffer = TokenBuffer(source)
+        types = buffer.types.append
+        starts = buffer.starts.append
+        ends = buffer.ends.append
+        lines = buffer.lines.append
+        identifier = TokenType.IDENTIFIER.value
+        number = TokenType.NUMBER.value
+        string = TokenType.STRING.value
+        line = 1
+        for m in token_pattern.finditer(source):
+            kind = m.lastindex
+            if kind == NEWLINE:
+                line += 1
+                continue
+            elif kind == COMMENT:
+                continue
+            start, end = m.span(kind)
+            if kind == IDENTIFIER:
+                type_ = keyword_codes.get(source[start:end], identifier)
+            elif kind == OPERATOR:
+                type_ = operator_codes[source[start:end]]
+            elif kind == NUMBER:
+                type_ = number
+            elif kind == STRING:
+                line += source.count('\n', start, end)
+                type_ = string
+            else:
+                if kind == UNTERMINATED:
+                    line += source.count('\n', start, end)
+                    msg = f'Unterminated string.'
+                else:
+                    msg = f'Unexpected character {source[start:end]}.'
+                try:
+                    self.env.scan_error(line, msg)
+                except:
+                    self.ok = False
+                continue
+            types(type_)
+            starts(start)
+            ends(end)
+            lines(line)
+        self.line = line
+        if not self.ok:
+            buffer = TokenBuffer(source)
+            line = 0
+        buffer.append(TokenType.EOF.value, len(source), len(source), line)
+        return buffer
+
@@ -1,12 +1,15 @@
 
-from my_type import Func, ReturnValue, Cls
+from my_type import Func, ReturnValue, Cls, Cell, BREAK, CONTINUE
+from my_expr import Call, Grouping
 from my_resolver import FuncType, ClsType
 from my_env import Env
 
 class Stmt:
-    pass
+    __slots__ = ()
 
 class Expression(Stmt):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -17,9 +20,11 @@ class Expression(Stmt):
         self.expr.resolve(resolver)
 
     def exec(self, env):
-        return self.expr.eval(env)
+        self.expr.eval(env)
 
 class Print(Stmt):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -33,9 +38,13 @@ class Print(Stmt):
         print(f'{self.expr.eval(env)}')
 
 class Var(Stmt):
+    __slots__ = ('name', 'initializer', 'slot', 'cell')
+
     def __init__(self, name, initializer):
         self.name = name
         self.initializer = initializer
+        self.slot = None # 由 Resolver 填写：局部变量的槽位，None 表示全局变量
+        self.cell = False # 由 Resolver 填写：变量被内层函数捕获，声明时装箱成 Cell
 
     def __repr__(self):
         return f'[var {self.name} {self.initializer}]'
@@ -44,17 +53,25 @@ class Var(Stmt):
         resolver.declare(self.name)
         if self.initializer is not None:
             self.initializer.resolve(resolver)
-        resolver.define(self.name)
+        self.slot = resolver.define(self.name, self)
 
     def exec(self, env):
-        if self.initializer is None:
-            env.define(self.name, None)
+        value = None
+        if self.initializer is not None:
+            value = self.initializer.eval(env)
+        if self.slot is None:
+            env.define(self.name, value)
+        elif self.cell:
+            env.values[self.slot] = Cell(value)
         else:
-            env.define(self.name, self.initializer.eval(env))
+            env.values[self.slot] = value
 
 class Block(Stmt):
+    __slots__ = ('statements', 'size')
+
     def __init__(self, statements):
         self.statements = statements
+        self.size = None # 由 Resolver 填写：运行时 Env 的大小，None 表示变量合并到外层的 Env 中
 
     def __repr__(self):
         return f'[block {[statement for statement in self.statements]}]'
@@ -63,14 +80,19 @@ class Block(Stmt):
         resolver.begin_scope()
         for statement in self.statements:
             statement.resolve(resolver)
-        resolver.end_scope()
+        self.size = resolver.end_scope()
 
     def exec(self, env):
-        env = Env(env)
+        if self.size is not None:
+            env = Env(env, [None] * self.size)
         for statement in self.statements:
-            statement.exec(env)
+            result = statement.exec(env)
+            if result is not None:
+                return result
 
 class If(Stmt):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+
     def __init__(self, condition, then_branch, else_branch):
         self.condition = condition
         self.then_branch = then_branch
@@ -87,55 +109,171 @@ class If(Stmt):
 
     def exec(self, env):
         if env.is_truthy(self.condition.eval(env)):
-            self.then_branch.exec(env)
+            return self.then_branch.exec(env)
         elif self.else_branch is not None:
-            self.else_branch.exec(env)
+            return self.else_branch.exec(env)
+
+def loop_body(loop, env):
+    '''
+    返回循环体的语句列表和执行它们的 Env
+    循环体是 Block 时，整个循环复用同一个 Env（每次迭代中变量都先声明再使用，旧值不会被读到；
+    闭包只持有被捕获变量的 Cell，每次迭代声明时都创建新的 Cell，不会看到之后迭代的值），
+    循环体的变量合并到外层的 Env 中时直接使用外层的 Env
+    '''
+    for invariant in loop.invariants:
+        invariant.ready = False
+    if loop.reuse:
+        if loop.body.size is None:
+            return loop.body.statements, env
+        return loop.body.statements, Env(env, [None] * loop.body.size)
+    return [loop.body], env
 
 class While(Stmt):
+    __slots__ = ('condition', 'body', 'reuse', 'invariants')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
+        self.reuse = False
+        self.invariants = [] # 由 Optimizer 填写：循环中的不变表达式，每次进入循环时清空它们的缓存
 
     def __repr__(self):
         return f'[While {self.condition} {self.body}]'
 
     def resolve(self, resolver):
         self.condition.resolve(resolver)
+        resolver.loop_depth += 1
         self.body.resolve(resolver)
+        resolver.loop_depth -= 1
+        self.reuse = isinstance(self.body, Block)
 
     def exec(self, env):
+        statements, body_env = loop_body(self, env)
         while env.is_truthy(self.condition.eval(env)):
-            self.body.exec(env)
+            result = None
+            for statement in statements:
+                result = statement.exec(body_env)
+                if result is not None:
+                    break
+            if result is not None and result is not CONTINUE:
+                if result is BREAK:
+                    break
+                return result
+
+class For(Stmt):
+    '''
+    for 循环：初始化语句有自己的作用域，整个循环共用一个 Env；条件、循环体和递增表达式都直接在这个作用域中执行
+    condition 为 None 表示无限循环；size 为 None 表示没有初始化语句或者它的变量合并到外层的 Env 中
+    '''
+    __slots__ = ('initializer', 'condition', 'increment', 'body', 'size', 'reuse', 'invariants')
+
+    def __init__(self, initializer, condition, increment, body):
+        self.initializer = initializer
+        self.condition = condition
+        self.increment = increment
+        self.body = body
+        self.size = None
+        self.reuse = False
+        self.invariants = []
+
+    def __repr__(self):
+        return f'[for {self.initializer} {self.condition} {self.increment} {self.body}]'
+
+    def resolve(self, resolver):
+        if self.initializer is not None:
+            resolver.begin_scope()
+            self.initializer.resolve(resolver)
+        if self.condition is not None:
+            self.condition.resolve(resolver)
+        resolver.loop_depth += 1
+        self.body.resolve(resolver)
+        resolver.loop_depth -= 1
+        self.reuse = isinstance(self.body, Block)
+        if self.increment is not None:
+            self.increment.resolve(resolver)
+        if self.initializer is not None:
+            self.size = resolver.end_scope()
+
+    def exec(self, env):
+        if self.size is not None:
+            env = Env(env, [None] * self.size)
+        if self.initializer is not None:
+            self.initializer.exec(env)
+        statements, body_env = loop_body(self, env)
+        condition = self.condition
+        increment = self.increment
+        while condition is None or env.is_truthy(condition.eval(env)):
+            result = None
+            for statement in statements:
+                result = statement.exec(body_env)
+                if result is not None:
+                    break
+            if result is not None and result is not CONTINUE:
+                if result is BREAK:
+                    break
+                return result
+            if increment is not None:
+                increment.eval(env)
 
 class Function(Stmt):
+    __slots__ = ('name', 'parameters', 'body', 'slot', 'cell', 'boxed', 'upvalues', 'padding')
+
     def __init__(self, name, parameters, body):
         self.name = name
         self.parameters = parameters
         self.body = body
+        self.slot = None
+        self.cell = False # 由 Resolver 填写：函数名被内层函数（包括它自己）捕获
+        self.boxed = () # 由 Resolver 填写：被捕获的参数的槽位
+        self.upvalues = [] # 由 Resolver 填写：函数捕获的 Cell 在声明处的 (距离, 槽位)
+        self.padding = () # 由 Resolver 填写：合并到参数 Env 中的局部变量的初值，调用时接在参数后面
 
     def __repr__(self):
         return f'[fun {self.name} {self.parameters} {self.body}]'
 
     def resolve(self, resolver):
         resolver.declare(self.name)
-        resolver.define(self.name)
+        self.slot = resolver.define(self.name, self)
         prev_func = resolver.current_function
+        prev_loop = resolver.loop_depth
         resolver.current_function = FuncType.FUNCTION
-        resolver.begin_scope()
+        resolver.loop_depth = 0
+        resolver.begin_function()
+        self.resolve_function(resolver)
+        self.upvalues = resolver.end_function()
+        resolver.current_function = prev_func
+        resolver.loop_depth = prev_loop
+
+    def resolve_function(self, resolver):
+        '''
+        解析参数和函数体，函数和方法共用
+        '''
+        resolver.begin_scope(True)
         for parameter in self.parameters:
             resolver.declare(parameter)
             resolver.define(parameter)
         self.body.resolve(resolver)
-        resolver.end_scope()
-        resolver.current_function = prev_func
+        self.boxed = resolver.captured_slots()
+        self.padding = (None,) * (resolver.end_scope() - len(self.parameters))
 
     def exec(self, env):
-        env.define(self.name, Func(self.name, self.parameters, self.body, env))
+        if self.cell: # 先放入 Cell，函数体中引用自己时捕获的是这个 Cell
+            cell = env.values[self.slot] = Cell(None)
+        func = Func(self.name, self.parameters, self.body, env.capture(self.upvalues), False, self.boxed, self.padding)
+        if self.slot is None:
+            env.define(self.name, func)
+        elif self.cell:
+            cell.value = func
+        else:
+            env.values[self.slot] = func
 
 class Return(Stmt):
+    __slots__ = ('ret', 'expr', 'tail')
+
     def __init__(self, ret, expr):
         self.ret = ret
         self.expr = expr
+        self.tail = False # 由 Resolver 填写：返回值是一次调用时它是尾调用
 
     def __repr__(self):
         return f'[return {self.expr}]'
@@ -147,18 +285,60 @@ class Return(Stmt):
             if resolver.current_function == FuncType.INITIALIZER:
                 resolver.resolve_error(self.ret, 'Can not return a value from an initializer.')
             self.expr.resolve(resolver)
+            while type(self.expr) is Grouping: # return (f(x)); 也是尾调用
+                self.expr = self.expr.expr
+            self.tail = type(self.expr) is Call
 
     def exec(self, env):
+        if self.tail:
+            return self.expr.tail_call(env)
         value = None
         if self.expr is not None:
             value = self.expr.eval(env)
-        raise ReturnValue(value)
+        return ReturnValue(value)
+
+class Break(Stmt):
+    __slots__ = ('keyword',)
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+
+    def __repr__(self):
+        return '[break]'
+
+    def resolve(self, resolver):
+        if resolver.loop_depth == 0:
+            resolver.resolve_error(self.keyword, 'Can not break outside of a loop.')
+
+    def exec(self, env):
+        return BREAK
+
+class Continue(Stmt):
+    __slots__ = ('keyword',)
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+
+    def __repr__(self):
+        return '[continue]'
+
+    def resolve(self, resolver):
+        if resolver.loop_depth == 0:
+            resolver.resolve_error(self.keyword, 'Can not continue outside of a loop.')
+
+    def exec(self, env):
+        return CONTINUE
 
 class Class(Stmt):
+    __slots__ = ('name', 'sp', 'methods', 'slot', 'cell', 'upvalues')
+
     def __init__(self, name, sp, methods):
         self.name = name
         self.sp = sp
         self.methods = methods
+        self.slot = None
+        self.cell = False # 由 Resolver 填写：类名被方法或内层函数捕获
+        self.upvalues = [] # 由 Resolver 填写：所有方法一起捕获的 Cell 在 super（没有超类时是类声明）所在作用域中的 (距离, 槽位)
 
     def __repr__(self):
         return f'[class {self.name} < {self.sp} {self.methods}]'
@@ -167,32 +347,32 @@ class Class(Stmt):
         prev_cls = resolver.current_class
         resolver.current_class = ClsType.CLASS
         resolver.declare(self.name)
-        resolver.define(self.name)
+        self.slot = resolver.define(self.name, self)
         if self.sp is not None:
             resolver.current_class = ClsType.SUBCLASS
             if self.name.lexme == self.sp.name.lexme:
                 resolver.resolve_error(self.sp.name, 'A class can not inherit from itself.')
             self.sp.resolve(resolver)
         if self.sp is not None:
-            resolver.begin_scope()
+            resolver.begin_scope(True)
             resolver.define('super')
-        resolver.begin_scope()
+        resolver.begin_function()
+        resolver.begin_scope(True)
         resolver.define('this')
+        prev_loop = resolver.loop_depth
+        resolver.loop_depth = 0
         for method in self.methods:
             prev_func = resolver.current_function
             resolver.current_function = FuncType.METHOD
             if method.name.lexme == 'init':
                 resolver.current_function = FuncType.INITIALIZER
-            resolver.begin_scope()
-            for parameter in method.parameters:
-                resolver.declare(parameter)
-                resolver.define(parameter)
-            method.body.resolve(resolver)
-            resolver.end_scope()
+            method.resolve_function(resolver)
             resolver.current_function = prev_func
         resolver.end_scope()
+        self.upvalues = resolver.end_function()
         if self.sp is not None:
             resolver.end_scope()
+        resolver.loop_depth = prev_loop
         resolver.current_class = prev_cls
 
     def exec(self, env):
@@ -201,14 +381,22 @@ class Class(Stmt):
             sp = self.sp.eval(env)
             if not isinstance(sp, Cls):
                 env.runtime_error(self.sp.name, 'Superclass must be a class.')
-        env.define(self.name, None)
         if self.sp is not None:
-            sp_env = Env(env)
-            sp_env.define('super', sp)
+            sp_env = Env(env, [sp])
         else:
             sp_env = env
+        if self.cell: # 先放入 Cell，方法中引用类名时捕获的是这个 Cell
+            cell = env.values[self.slot] = Cell(None)
+        upvalues = sp_env.capture(self.upvalues)
         methods = {}
         for method in self.methods:
-            methods[method.name.lexme] = Func(method.name, method.parameters, method.body, sp_env, method.name.lexme=='init')
-        env.assign(self.name, Cls(self.name, sp, methods))
+            methods[method.name.lexme] = Func(method.name, method.parameters, method.body, upvalues, method.name.lexme=='init',
+                                              method.boxed, method.padding)
+        cls = Cls(self.name, sp, methods)
+        if self.slot is None:
+            env.define(self.name, cls)
+        elif self.cell:
+            cell.value = cls
+        else:
+            env.values[self.slot] = cls
 
@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from my_type import Func, ReturnValue, TailCall
+from my_env import Env
+from my_closure import ClosureCompiler
+import my_expr
+import my_stmt
+
+'''
+分层执行：函数先由树遍历解释器执行（第 0 层），同时统计调用次数和函数体中循环的迭代次数（回边），
+两者之和达到阈值后把函数体交给 TierCompiler 翻译成闭包（第 1 层），之后的调用直接执行闭包
+翻译可以在后台线程中进行，翻译期间调用照常由树遍历解释器执行；翻译好的闭包依赖的假设不再成立时退回第 0 层（deoptimize）
+没有栈上替换：正在执行的调用不会切换层，长时间运行的循环在下一次调用时才执行翻译后的闭包
+'''
+
+THRESHOLD = 1000 # 默认的阈值：调用次数加回边次数
+MAX_DEOPTS = 3 # 退回第 0 层的次数达到这个值后不再翻译这个函数
+
+# 达到过阈值的函数体（按达到的先后顺序），用于 --tier-stats
+hot = []
+
+executor = None # 后台翻译使用的线程，第一次需要时创建
+
+class TierBody(my_stmt.Stmt):
+    '''
+    函数体的外层节点：body 是原来的函数体，name 是函数名，count 是调用次数加回边次数，code 是翻译后的闭包
+    deopts 是退回第 0 层的次数，每次退回后阈值加倍；reason 是最近一次退回或放弃翻译的原因
+    exec 不是方法而是按所处的层设置的属性：计数时是 profile，之后是原来函数体的 exec 或者翻译后的闭包，
+    Func.call 调用 body.exec(env) 时直接进入它们，不多经过一层 Python 调用（按层替换 __class__ 的做法每次调用多一层，
+    对 fib 这样调用密集的函数要慢三成以上）
+    '''
+    __slots__ = ('exec', 'body', 'name', 'count', 'threshold', 'background', 'code', 'deopts', 'reason')
+
+    def __init__(self, body, name, threshold, background):
+        self.body = body
+        self.name = name
+        self.reset(threshold, background)
+
+    def __repr__(self):
+        return f'{self.body}'
+
+    def reset(self, threshold, background):
+        '''
+        回到第 0 层的初始状态；同一棵语法树再次执行时也调用，翻译结果依赖上次执行的全局作用域，不能沿用
+        '''
+        self.exec = self.profile
+        self.count = 0
+        self.threshold = threshold
+        self.background = background
+        self.code = None
+        self.deopts = 0
+        self.reason = None
+
+    def profile(self, env):
+        self.count += 1
+        if self.count >= self.threshold:
+            self.tier_up(env)
+            return self.exec(env)
+        return self.body.exec(env)
+
+    def tier_up(self, env):
+        if self.deopts == 0: # 退回后再次达到阈值的不重复记录
+            hot.append(self)
+        self.exec = self.body.exec # 翻译完成前不再计数
+        global_env = env.global_env
+        if not self.background:
+            self.compile(global_env)
+            return
+        global executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lox-tier')
+        executor.submit(self.compile, global_env)
+
+    def compile(self, global_env):
+        '''
+        翻译函数体并切换到第 1 层；在后台线程中执行时，主线程在 exec 被替换之后的下一次调用才执行闭包
+        '''
+        try:
+            code = TierCompiler(self, global_env).stmt(self.body)
+        except RecursionError: # 函数体嵌套过深，继续由树遍历解释器执行
+            self.reason = 'nested too deeply'
+            return
+        self.code = code
+        self.exec = code
+
+    def deoptimize(self, reason):
+        '''
+        翻译时的假设不再成立：丢弃闭包，之后的调用回到第 0 层重新计数
+        正在执行的调用继续执行闭包，出错的位置按通用方式求值，结果不变
+        '''
+        if self.code is None:
+            return
+        self.code = None
+        self.deopts += 1
+        self.reason = reason
+        if self.deopts >= MAX_DEOPTS:
+            self.exec = self.body.exec
+        else:
+            self.count = 0
+            self.threshold *= 2
+            self.exec = self.profile
+
+class BackEdge(my_expr.Expr):
+    '''
+    函数体中循环的条件：每次求值把所在函数的计数加一
+    '''
+    __slots__ = ('expr', 'body')
+
+    def __init__(self, expr, body):
+        self.expr = expr
+        self.body = body
+
+    def __repr__(self):
+        return f'{self.expr}'
+
+    def eval(self, env):
+        self.body.count += 1
+        return self.expr.eval(env)
+
+def instrument(statements, threshold=THRESHOLD, background=True):
+    '''
+    把语句中（包括嵌套的）函数和方法的函数体换成 TierBody，函数体中循环的条件换成 BackEdge
+    '''
+    for statement in statements:
+        instrument_stmt(statement, None, threshold, background)
+
+def instrument_function(function, threshold, background):
+    if isinstance(function.body, TierBody):
+        function.body.reset(threshold, background)
+        body = function.body
+    else:
+        body = function.body = TierBody(function.body, function.name, threshold, background)
+    instrument_stmt(body.body, body, threshold, background)
+
+def instrument_stmt(stmt, body, threshold, background):
+    '''
+    body 是语句所在函数的 TierBody，顶层代码中为 None
+    '''
+    kind = type(stmt)
+    if kind is my_stmt.Function:
+        instrument_function(stmt, threshold, background)
+    elif kind is my_stmt.Class:
+        for method in stmt.methods:
+            instrument_function(method, threshold, background)
+    elif kind is my_stmt.Block:
+        for statement in stmt.statements:
+            instrument_stmt(statement, body, threshold, background)
+    elif kind is my_stmt.If:
+        instrument_stmt(stmt.then_branch, body, threshold, background)
+        if stmt.else_branch is not None:
+            instrument_stmt(stmt.else_branch, body, threshold, background)
+    elif kind is my_stmt.While or kind is my_stmt.For:
+        if body is not None:
+            condition = stmt.condition
+            if type(condition) is BackEdge:
+                condition.body = body
+            else:
+                if condition is None: # for (;;) 的条件总是成立
+                    condition = my_expr.Literal(True)
+                stmt.condition = BackEdge(condition, body)
+        instrument_stmt(stmt.body, body, threshold, background)
+
+class TierCompiler(ClosureCompiler):
+    '''
+    翻译一个热函数的函数体，与 ClosureCompiler 相同，另外按执行到现在的情况做一项推测：
+    调用的是全局函数、翻译时它是一个参数个数正确的 Func 时，调用处只检查全局变量是否还是这个 Func，
+    省去取值、类型和参数个数的检查，并直接执行它的函数体；全局变量被重新赋值或定义后检查失败，按通用方式调用并让函数体退回第 0 层
+    翻译在后台线程中进行时语法树可能正被主线程 quicken，特化的节点按它的基类翻译；只读取已有的全局变量槽位，不分配新槽位
+    '''
+    def __init__(self, body, global_env):
+        super().__init__()
+        self.body = body
+        self.global_env = global_env
+        self.stmt_table[TierBody] = lambda stmt: self.stmt(stmt.body)
+        self.expr_table[BackEdge] = lambda expr: self.expr(expr.expr)
+
+    def expr(self, expr):
+        compile = self.expr_table.get(type(expr))
+        if compile is None: # quickening 换过类的节点
+            compile = self.expr_table[type(expr).__mro__[1]]
+        return compile(expr)
+
+    def known(self, expr):
+        '''
+        调用的是全局函数，翻译时它是参数个数正确的 Func 时返回它的槽位和它，否则返回 None
+        '''
+        callee = expr.callee
+        if expr.invoke or type(callee) is not my_expr.Variable or callee.distance is not None:
+            return None
+        slot = self.global_env.slots.get(callee.name.lexme)
+        if slot is None:
+            return None
+        function = self.global_env.table[slot]
+        if type(function) is not Func or function.arity() != len(expr.arguments):
+            return None
+        return slot, function
+
+    def call(self, expr):
+        known = self.known(expr)
+        if known is None:
+            return super().call(expr)
+        slot, function = known
+        generic = super().call(expr)
+        table = self.global_env.table
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        paren = expr.paren
+        caller = self.body
+        reason = f'{expr.callee.name.lexme} changed'
+        if function.boxed or function.is_init:
+            def call(env):
+                if table[slot] is not function:
+                    caller.deoptimize(reason)
+                    return generic(env)
+                values = [argument(env) for argument in arguments]
+                global_env = env.global_env
+                if global_env.depth >= global_env.max_depth:
+                    env.runtime_error(paren, 'Stack overflow.')
+                global_env.depth += 1
+                try:
+                    return function.call(values)
+                finally:
+                    global_env.depth -= 1
+            return call
+        # 不是初始化方法、没有要装箱的参数时直接执行 Func.call 的第一轮：函数体的 exec 随它所在的层变化，每次调用时读取
+        closure = function.env
+        body = function.body
+        padding = function.padding
+        def call(env):
+            if table[slot] is not function:
+                caller.deoptimize(reason)
+                return generic(env)
+            values = [argument(env) for argument in arguments]
+            values += padding
+            global_env = env.global_env
+            if global_env.depth >= global_env.max_depth:
+                env.runtime_error(paren, 'Stack overflow.')
+            global_env.depth += 1
+            try:
+                result = body.exec(Env(closure, values))
+                if result is None:
+                    return None
+                if type(result) is ReturnValue:
+                    return result.value
+                return result.function.call(result.arguments) # 尾调用，由被调用的函数接着执行
+            finally:
+                global_env.depth -= 1
+        return call
+
+    def tail_call(self, expr):
+        known = self.known(expr)
+        if known is None:
+            return super().tail_call(expr)
+        slot, function = known
+        generic = super().tail_call(expr)
+        table = self.global_env.table
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        body = self.body
+        reason = f'{expr.callee.name.lexme} changed'
+        def tail_call(env):
+            if table[slot] is not function:
+                body.deoptimize(reason)
+                return generic(env)
+            return TailCall(function, [argument(env) for argument in arguments])
+        return tail_call
@@ -1,4 +1,6 @@
 
+import sys
+from array import array
 from enum import Enum, auto
 
 class TokenType(Enum):
@@ -26,7 +28,9 @@ class TokenType(Enum):
     IDENTIFIER = auto()     # 标识符
     # 关键字
     AND = auto()
+    BREAK = auto()
     CLASS = auto()
+    CONTINUE = auto()
     ELSE = auto()
     FALSE = auto()
     FOR = auto()
@@ -45,6 +49,8 @@ class TokenType(Enum):
     EOF = auto()
 
 class Token:
+    __slots__ = ('type_', 'lexme', 'literal', 'line')
+
     def __init__(self, type_, lexme, literal, line):
         self.type_ = type_
         self.lexme = lexme
@@ -57,3 +63,52 @@ class Token:
     def __str__(self):
         return f'{self.lexme}'
 
+# TokenBuffer 按 TokenType.value 存类型，这里反查回 TokenType
+token_types = [None] + list(TokenType)
+
+# 标识符和关键字的词素会被大量重复使用（this、i ...），取出时统一 intern
+interned_types = {TokenType.IDENTIFIER.value} | {t.value for t in TokenType if TokenType.AND.value <= t.value <= TokenType.WHILE.value}
+number_type = TokenType.NUMBER.value
+string_type = TokenType.STRING.value
+eof_type = TokenType.EOF.value
+
+class TokenBuffer:
+    '''
+    struct-of-arrays 形式的 Token 序列：类型、起止偏移、行号分别存放在 array 列里，每个 Token 只占 13 字节
+    下标访问时才按偏移从源码切出词素并构造 Token，Parser 可以像使用 list 一样使用它
+    '''
+    def __init__(self, source):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, type_, start, end, line):
+        self.types.append(type_)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def __getitem__(self, index):
+        type_ = self.types[index]
+        start = self.starts[index]
+        end = self.ends[index]
+        literal = None
+        if type_ in interned_types:
+            lexme = sys.intern(self.source[start:end])
+        elif type_ == number_type:
+            lexme = self.source[start:end]
+            literal = float(lexme)
+        elif type_ == string_type:
+            lexme = self.source[start:end]
+            literal = lexme[1:-1]
+        elif type_ == eof_type:
+            lexme = 'EOF'
+        else:
+            lexme = self.source[start:end]
+        return Token(token_types[type_], lexme, literal, self.lines[index])
+
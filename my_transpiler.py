@@ -0,0 +1,861 @@
+
+import re
+import math
+import linecache
+from types import FunctionType as function
+
+from my_token import Token
+from my_env import BaseEnv, GlobalEnv, recursion_limit
+from my_type import Func, Cls, Instance, TailCall, strings, concat
+from my_native import native_table
+from my_compiler import Capture
+import my_expr
+import my_stmt
+
+'''
+生成的 Python 模块在运行时使用的辅助函数和类型，模块通过 from my_transpiler import * 导入
+生成代码中的 Lox 变量名都带有 _数字 后缀，不会与这里的名字冲突
+'''
+
+runtime = BaseEnv()
+
+class Cell:
+    '''
+    被内层函数捕获的局部变量：每次执行声明都创建新的 Cell，内层函数通过仅限关键字参数的默认值持有它
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class BoundMethod:
+    __slots__ = ('receiver', 'function')
+
+    def __init__(self, receiver, function):
+        self.receiver = receiver
+        self.function = function
+
+    def __repr__(self):
+        return f'(function {self.function.__name__})'
+
+def error(line, lexme, msg):
+    runtime.runtime_error(Token(None, lexme, None, line), msg)
+
+def operand_error(line, lexme):
+    error(line, lexme, 'Operand must be a number.')
+
+def add(left, right, line):
+    '''
+    不是两个数的加法：两个字符串时拼接，否则报错
+    '''
+    if type(left) in strings and type(right) in strings:
+        return concat(left, right)
+    error(line, '+', 'Operands must be two numbers or two strings.')
+
+def undefined(line, name):
+    error(line, name, f'Undefined variable {name}.')
+
+def assign_global(G, name, value, line):
+    if name not in G:
+        undefined(line, name)
+    G[name] = value
+    return value
+
+def set_cell(cell, value):
+    cell.value = value
+    return value
+
+def stringify(value):
+    if type(value) is function:
+        return f'(function {value.__name__})'
+    return f'{value}'
+
+def lox_print(value):
+    print(stringify(value))
+
+def display(value):
+    '''
+    命令行模式显示最后一个表达式的值
+    '''
+    if value is None:
+        return None
+    return stringify(value)
+
+def callable_(callee, line):
+    if not isinstance(callee, (function, BoundMethod, Cls, Func)):
+        error(line, ')', 'Can only call functions and classes.')
+    return callee
+
+def arity_error(line, arity, n):
+    error(line, ')', f'Expected {arity} arguments but got {n}.')
+
+def arity(callee, line):
+    kind = type(callee)
+    if kind is function:
+        return callee.__code__.co_argcount
+    if kind is BoundMethod:
+        return callee.function.__code__.co_argcount - 1
+    if kind is Cls:
+        return 0 if callee.init is None else callee.init.__code__.co_argcount - 1
+    if isinstance(callee, Func):
+        return callee.arity()
+    error(line, ')', 'Can only call functions and classes.')
+
+def dispatch(callee, arguments):
+    '''
+    调用参数个数已经检查过的 callee
+    '''
+    kind = type(callee)
+    if kind is function:
+        return callee(*arguments)
+    if kind is BoundMethod:
+        return callee.function(callee.receiver, *arguments)
+    if kind is Cls:
+        instance = Instance(callee)
+        if callee.init is None:
+            return instance
+        return callee.init(instance, *arguments)
+    return callee.call(list(arguments))
+
+def resume(result):
+    '''
+    被调用的函数以 return g(...) 结束（g 不是它自己，或者在循环中）时返回 TailCall，
+    调用者在这里接着调用 g，与 Func.call 一样不加深 Python 调用栈
+    '''
+    while type(result) is TailCall:
+        result = dispatch(result.function, result.arguments)
+    return result
+
+def call(callee, line, *arguments):
+    n = arity(callee, line)
+    if n != len(arguments):
+        arity_error(line, n, len(arguments))
+    return resume(dispatch(callee, arguments))
+
+def tail_call(callee, line, *arguments):
+    '''
+    return g(...)：检查与 call 相同，但不在这里调用 g，交给调用者的 resume
+    '''
+    n = arity(callee, line)
+    if n != len(arguments):
+        arity_error(line, n, len(arguments))
+    return TailCall(callee, arguments)
+
+class InvokeCache:
+    '''
+    obj.name(...) 调用处的缓存：上次接收者的 Shape（没有同名字段）和在它的类中找到的方法（参数个数已经检查过）
+    '''
+    __slots__ = ('shape', 'method')
+
+    def __init__(self):
+        self.shape = None
+        self.method = None
+
+class GetCache:
+    '''
+    obj.name 读取处的缓存：上次读到字段的实例的 Shape 和字段的下标
+    '''
+    __slots__ = ('shape', 'slot')
+
+    def __init__(self):
+        self.shape = None
+        self.slot = None
+
+class SetCache:
+    '''
+    obj.name = value 赋值处的缓存：给已有字段赋值时实例的 Shape 和字段的下标，加入这个字段前后的 Shape
+    '''
+    __slots__ = ('shape', 'slot', 'before', 'after')
+
+    def __init__(self):
+        self.shape = None
+        self.slot = None
+        self.before = None
+        self.after = None
+
+def invoke(cache, instance, name, line, paren_line, *arguments):
+    '''
+    调用处缓存没有命中时的 obj.name(...)：方法直接以 instance 为 this 调用，不创建 BoundMethod
+    '''
+    if type(instance) is not Instance:
+        error(line, name, 'Only instances have properties.')
+    slot = instance.shape.slots.get(name)
+    if slot is not None:
+        return call(instance.values[slot], paren_line, *arguments)
+    method = instance.cls.get_method(name)
+    if method is None:
+        error(line, name, f'Undefined property {name}.')
+    if method.__code__.co_argcount - 1 != len(arguments):
+        arity_error(paren_line, method.__code__.co_argcount - 1, len(arguments))
+    cache.shape = instance.shape
+    cache.method = method
+    return resume(method(instance, *arguments))
+
+def get_property(cache, instance, name, line):
+    '''
+    读取处缓存没有命中时的 obj.name
+    '''
+    if type(instance) is not Instance:
+        error(line, name, 'Only instances have properties.')
+    slot = instance.shape.slots.get(name)
+    if slot is not None:
+        cache.shape = instance.shape
+        cache.slot = slot
+        return instance.values[slot]
+    method = instance.cls.get_method(name)
+    if method is None:
+        error(line, name, f'Undefined property {name}.')
+    return BoundMethod(instance, method)
+
+def instance_(instance, name, line):
+    if type(instance) is not Instance:
+        error(line, name, 'Only instances have fields.')
+    return instance
+
+def set_field(cache, instance, name, value):
+    '''
+    赋值处缓存没有命中时给字段赋值，instance 已经检查过
+    '''
+    shape = instance.shape
+    if shape is cache.shape:
+        instance.values[cache.slot] = value
+    elif shape is cache.before:
+        instance.shape = cache.after
+        instance.values.append(value)
+    else:
+        slot = shape.slots.get(name)
+        if slot is None:
+            cache.before = shape
+            cache.after = instance.shape = shape.add(name)
+            instance.values.append(value)
+        else:
+            cache.shape = shape
+            cache.slot = slot
+            instance.values[slot] = value
+
+def set_property(cache, instance, name, value, line):
+    if type(instance) is not Instance:
+        error(line, name, 'Only instances have fields.')
+    set_field(cache, instance, name, value)
+    return value
+
+def get_super(sp, this, name, line):
+    method = sp.get_method(name)
+    if method is None:
+        error(line, name, f'Undefined property {name}.')
+    return BoundMethod(this, method)
+
+def stack_overflow(e):
+    '''
+    把 CPython 的 RecursionError 报告成 Lox 的 Stack overflow.：
+    行号取调用栈最内层生成代码所在行（或它之前最近的一行）末尾注明的 Lox 行号
+    生成的模块在全局变量 __lox_lines__ 中保存自己的源码行（流式执行时每条语句是一个单独的模块）
+    '''
+    lines = None
+    lineno = 0
+    tb = e.__traceback__
+    while tb is not None:
+        if '__lox_lines__' in tb.tb_frame.f_globals:
+            lines = tb.tb_frame.f_globals['__lox_lines__']
+            lineno = tb.tb_lineno
+        tb = tb.tb_next
+    line = 0
+    while lineno > 0:
+        m = re.search(r'# line (\d+)$', lines[lineno-1].rstrip())
+        if m:
+            line = int(m.group(1))
+            break
+        lineno -= 1
+    error(line, ')', 'Stack overflow.')
+
+def run_main(main, env):
+    '''
+    执行生成的 main(G)
+    生成的 Lox 函数就是 Python 函数，每层 Lox 调用占用一到两层 Python 栈帧，调用深度由 CPython 的递归限制约束，
+    实际上限在 env.max_depth 和它的两倍之间
+    '''
+    main.__globals__.setdefault('__lox_lines__', linecache.getlines(main.__code__.co_filename))
+    with recursion_limit(2 * env.max_depth):
+        try:
+            return main(env.values)
+        except RecursionError as e:
+            overflow = e
+    stack_overflow(overflow) # 在 except 之外报告，runtime_error 重新抛出的是 RuntimeError
+
+def run_module(main):
+    '''
+    直接运行生成的模块：python out.py
+    '''
+    env = GlobalEnv()
+    env.values.update(native_table)
+    run_main(main, env)
+
+# ---------------- 翻译 ----------------
+
+TAIL_MARK = '<same cells>' # 自身尾调用检查中待补上的 Cell 比较
+
+class Var:
+    def __init__(self, py, captured):
+        self.py = py
+        self.captured = captured
+
+    def load(self):
+        return f'{self.py}.value' if self.captured else self.py
+
+class FunctionState:
+    def __init__(self, enclosing, indent, is_init=False):
+        self.enclosing = enclosing
+        self.lines = []
+        self.indent = indent
+        self.is_init = is_init
+        self.free = {} # 需要从外层函数捕获的 Cell，按出现顺序作为仅限关键字参数
+        self.loops = [] # 包围当前语句的循环的递增表达式（while 循环为 None），continue 之前要先执行它
+        self.py = None # def 名和参数（方法的第一个参数是 this），用于识别自身尾调用；初始化方法为 None
+        self.parameters = []
+        self.method = False
+        self.tails = [] # 自身尾调用检查所在的行，函数体生成完后补上被捕获的 Cell 的比较
+
+class Transpiler:
+    '''
+    把经过 Resolver 处理的语句列表翻译成 Python 模块源码，模块中的 main(G) 执行整个程序，G 是全局变量字典
+    局部变量翻译成 Python 局部变量（改名避免块作用域遮蔽），被内层函数捕获的放在 Cell 中；
+    类型检查直接生成在表达式里，出错时按 Lox 的行号和词素报告，所以输出与树遍历解释器相同
+    '''
+    def __init__(self):
+        self.captured = set()
+        self.caches = [] # [(变量名, 类名)]，属性读写和方法调用处的缓存，生成为模块级变量
+        self.scopes = [] # [(FunctionState, {name: Var})]
+        self.state = None
+        self.count = 0
+        self.stmt_table = {
+            my_stmt.Expression: self.expression_stmt,
+            my_stmt.Print: self.print_stmt,
+            my_stmt.Var: self.var_stmt,
+            my_stmt.Block: self.block_stmt,
+            my_stmt.If: self.if_stmt,
+            my_stmt.While: self.while_stmt,
+            my_stmt.For: self.for_stmt,
+            my_stmt.Function: self.function_stmt,
+            my_stmt.Return: self.return_stmt,
+            my_stmt.Break: self.break_stmt,
+            my_stmt.Continue: self.continue_stmt,
+            my_stmt.Class: self.class_stmt,
+        }
+        self.expr_table = {
+            my_expr.Literal: self.literal,
+            my_expr.Unary: self.unary,
+            my_expr.Binary: self.binary,
+            my_expr.Logical: self.logical,
+            my_expr.Grouping: self.grouping,
+            my_expr.Invariant: self.grouping,
+            my_expr.Variable: self.variable,
+            my_expr.Assign: self.assign,
+            my_expr.This: self.this,
+            my_expr.Super: self.super,
+            my_expr.Call: self.call,
+            my_expr.Get: self.get,
+            my_expr.Set: self.set,
+        }
+
+    def transpile(self, statements, source='<script>'):
+        capture = Capture()
+        for statement in statements:
+            capture.stmt(statement)
+        self.captured = capture.captured
+        self.state = FunctionState(None, 1)
+        for i, statement in enumerate(statements):
+            if i == len(statements) - 1 and isinstance(statement, my_stmt.Expression):
+                self.emit(f'return display({self.expr(statement.expr)})', statement.expr)
+            else:
+                self.stmt(statement)
+        lines = [
+            "'''",
+            f'由 my_transpiler 从 {source} 生成',
+            "'''",
+            'from my_transpiler import *',
+            '',
+        ]
+        if len(self.caches) > 0:
+            lines += [f'{cache} = {cls}()' for cache, cls in self.caches] + ['']
+        lines.append('def main(G):')
+        lines += self.state.lines or ['    pass']
+        lines += [
+            '',
+            "if __name__ == '__main__':",
+            '    run_module(main)',
+            '',
+        ]
+        return '\n'.join(lines)
+
+    # ---------------- 代码生成 ----------------
+
+    def emit(self, code, node=None):
+        '''
+        生成一行代码，node 给出时在行尾注明对应的 Lox 行号
+        '''
+        line = '    ' * self.state.indent + code
+        lox_line = self.line(node) if node is not None else None
+        if lox_line is not None:
+            line += f'  # line {lox_line}'
+        self.state.lines.append(line)
+
+    def line(self, node):
+        for k in ('name', 'operator', 'paren', 'ret', 'sp', 'method', 'keyword'):
+            token = getattr(node, k, None)
+            if isinstance(token, Token):
+                return token.line
+        for k in ('expr', 'left', 'callee', 'condition', 'initializer'):
+            child = getattr(node, k, None)
+            if child is not None:
+                return self.line(child)
+        return None
+
+    def fresh(self, name):
+        self.count += 1
+        return f'{name}_{self.count}'
+
+    def temp(self):
+        self.count += 1
+        return f'_t{self.count}'
+
+    def cache(self, name, cls):
+        '''
+        新的模块级缓存对象，cls 是它的类名
+        '''
+        cache = self.fresh(name)
+        self.caches.append((cache, cls))
+        return cache
+
+    # ---------------- 作用域 ----------------
+
+    def begin_scope(self):
+        self.scopes.append((self.state, {}))
+
+    def end_scope(self):
+        self.scopes.pop()
+
+    def declare(self, name, key):
+        '''
+        在当前作用域声明局部变量，顶层作用域返回 None（全局变量）
+        '''
+        if len(self.scopes) == 0:
+            return None
+        var = Var(self.fresh(name), key in self.captured)
+        self.scopes[-1][1][name] = var
+        return var
+
+    def lookup(self, name):
+        for state, scope in reversed(self.scopes):
+            if name in scope:
+                var = scope[name]
+                inner = self.state
+                while inner is not state:
+                    inner.free[var.py] = None
+                    inner = inner.enclosing
+                return var
+        return None
+
+    def store(self, var, name, value, node):
+        '''
+        生成给变量赋初值的语句
+        '''
+        if var is None:
+            self.emit(f'G[{name!r}] = {value}', node)
+        elif var.captured:
+            self.emit(f'{var.py} = Cell({value})', node)
+        else:
+            self.emit(f'{var.py} = {value}', node)
+
+    # ---------------- 语句 ----------------
+
+    def stmt(self, stmt):
+        self.stmt_table[type(stmt)](stmt)
+
+    def body(self, stmt):
+        '''
+        生成 if/while 的子语句，保证缩进块非空
+        '''
+        self.state.indent += 1
+        n = len(self.state.lines)
+        self.stmt(stmt)
+        if len(self.state.lines) == n:
+            self.emit('pass')
+        self.state.indent -= 1
+
+    def expression_stmt(self, stmt):
+        expr = stmt.expr
+        # 最常见的赋值语句直接生成 Python 赋值，不经过表达式形式
+        if isinstance(expr, my_expr.Assign):
+            var = self.lookup(expr.name.lexme)
+            value = self.expr(expr.expr)
+            if var is None:
+                name = expr.name.lexme
+                t = self.temp()
+                self.emit(f'{t} = {value}', expr)
+                self.emit(f'if {name!r} not in G: undefined({expr.name.line}, {name!r})')
+                self.emit(f'G[{name!r}] = {t}')
+            else:
+                self.emit(f'{var.load()} = {value}', expr)
+        elif isinstance(expr, my_expr.Set):
+            obj = self.expr(expr.expr)
+            name = expr.name.lexme
+            cache = self.cache('_sc', 'SetCache')
+            t = self.temp()
+            v = self.temp()
+            self.emit(f'{t} = instance_({obj}, {name!r}, {expr.name.line})', expr)
+            self.emit(f'{v} = {self.expr(expr.value)}', expr)
+            # 右侧求值后再检查 Shape，右侧可能给同一个实例加入字段
+            self.emit(f'if {t}.shape is {cache}.shape: {t}.values[{cache}.slot] = {v}')
+            self.emit(f'elif {t}.shape is {cache}.before: {t}.shape = {cache}.after; {t}.values.append({v})')
+            self.emit(f'else: set_field({cache}, {t}, {name!r}, {v})')
+        else:
+            self.emit(self.expr(expr), expr)
+
+    def print_stmt(self, stmt):
+        self.emit(f'lox_print({self.expr(stmt.expr)})', stmt.expr)
+
+    def var_stmt(self, stmt):
+        value = 'None' if stmt.initializer is None else self.expr(stmt.initializer)
+        var = self.declare(stmt.name.lexme, stmt.name)
+        self.store(var, stmt.name.lexme, value, stmt)
+
+    def block_stmt(self, stmt):
+        self.begin_scope()
+        for statement in stmt.statements:
+            self.stmt(statement)
+        self.end_scope()
+
+    def if_stmt(self, stmt):
+        self.emit(f'if {self.condition(stmt.condition)}:', stmt.condition)
+        self.body(stmt.then_branch)
+        if stmt.else_branch is not None:
+            self.emit('else:')
+            self.body(stmt.else_branch)
+
+    def while_stmt(self, stmt):
+        self.emit(f'while {self.condition(stmt.condition)}:', stmt.condition)
+        self.state.loops.append(None)
+        self.body(stmt.body)
+        self.state.loops.pop()
+
+    def for_stmt(self, stmt):
+        self.begin_scope()
+        if stmt.initializer is not None:
+            self.stmt(stmt.initializer)
+        if stmt.condition is None:
+            self.emit('while True:')
+        else:
+            self.emit(f'while {self.condition(stmt.condition)}:', stmt.condition)
+        self.state.loops.append(stmt.increment)
+        if stmt.increment is None:
+            self.body(stmt.body)
+        else:
+            self.body(my_stmt.Block([stmt.body, my_stmt.Expression(stmt.increment)]))
+        self.state.loops.pop()
+        self.end_scope()
+
+    def function(self, stmt, py, this_key=None, is_init=False):
+        '''
+        生成 def 语句；方法的第一个参数是 this
+        '''
+        state = FunctionState(self.state, 1, is_init)
+        self.state = state
+        self.begin_scope()
+        parameters = []
+        if this_key is not None:
+            parameters.append(self.declare('this', this_key))
+        for parameter in stmt.parameters:
+            parameters.append(self.declare(parameter.lexme, parameter))
+        if not is_init:
+            state.py = py
+            state.parameters = parameters
+            state.method = this_key is not None
+        for var in parameters:
+            if var.captured:
+                self.emit(f'{var.py} = Cell({var.py})')
+        self.block_stmt(stmt.body)
+        if is_init:
+            self.emit(f'return {parameters[0].load()}')
+        self.end_scope()
+        self.state = state.enclosing
+        if len(state.tails) > 0:
+            # 同一个 def 生成的函数还要捕获同一组 Cell 才是自身；free 在函数体生成完后才完整
+            for i, target in state.tails:
+                same = ''.join(f' and {target}.__kwdefaults__[{free!r}] is {free}' for free in state.free)
+                state.lines[i] = state.lines[i].replace(TAIL_MARK, same)
+            # 自身尾调用给参数赋新值后 continue，整个函数体（包括把参数放入 Cell）都在循环中
+            state.lines = ['    while True:'] + ['    ' + line for line in state.lines] + ['        return None']
+        names = [var.py for var in parameters]
+        if len(state.free) > 0:
+            names.append('*')
+            names += [f'{free}={free}' for free in state.free]
+        self.emit(f'def {py}({", ".join(names)}):', stmt)
+        indent = '    ' * self.state.indent
+        self.state.lines += [indent + line for line in state.lines] or [indent + '    pass']
+        self.emit(f'{py}.__name__ = {stmt.name.lexme!r}')
+
+    def function_stmt(self, stmt):
+        name = stmt.name.lexme
+        var = self.declare(name, stmt.name)
+        if var is None:
+            py = self.fresh('_f')
+            self.function(stmt, py)
+            self.emit(f'G[{name!r}] = {py}')
+        elif var.captured:
+            # 函数体可能通过 Cell 引用自己，Cell 要在 def 之前创建
+            self.emit(f'{var.py} = Cell(None)')
+            py = self.fresh('_f')
+            self.function(stmt, py)
+            self.emit(f'{var.py}.value = {py}')
+        else:
+            self.function(stmt, var.py)
+
+    def return_stmt(self, stmt):
+        state = self.state
+        if stmt.tail and state.py is not None and len(state.loops) == 0 and len(stmt.expr.arguments) == len(state.parameters) - state.method:
+            self.self_tail_call(stmt)
+        elif stmt.tail:
+            self.emit(f'return {self.tail_value(stmt.expr, self.expr(stmt.expr.callee))}', stmt)
+        elif stmt.expr is not None:
+            self.emit(f'return {self.expr(stmt.expr)}', stmt)
+        elif self.state.is_init:
+            self.emit(f'return {self.lookup("this").load()}', stmt)
+        else:
+            self.emit('return None', stmt)
+
+    def self_tail_call(self, stmt):
+        '''
+        return f(...) 调用的是当前函数（方法则是绑定到任意实例的当前方法）时，给参数赋新值后回到函数开头，不加深 Python 调用栈
+        其他尾调用（包括相互递归）返回 TailCall 交给调用者；Lox 循环中的 return 也返回 TailCall，那里的 continue 会回到 Python 循环的开头
+        '''
+        state = self.state
+        expr = stmt.expr
+        t = self.temp()
+        self.emit(f'{t} = {self.expr(expr.callee)}', stmt)
+        values = [self.expr(argument) for argument in expr.arguments]
+        if state.method:
+            target = f'{t}.function'
+            kind = 'BoundMethod'
+            values.insert(0, f'{t}.receiver')
+        else:
+            target = t
+            kind = 'function'
+        state.tails.append((len(state.lines), target))
+        self.emit(f'if type({t}) is {kind} and {target}.__code__ is {state.py}.__code__{TAIL_MARK}:')
+        state.indent += 1
+        if len(values) == 1:
+            self.emit(f'{state.parameters[0].py}, = {values[0]},', stmt)
+        elif len(values) > 1:
+            self.emit(f'{", ".join(var.py for var in state.parameters)} = {", ".join(values)}', stmt)
+        self.emit('continue')
+        state.indent -= 1
+        self.emit(f'return {self.tail_value(expr, t)}', stmt)
+
+    def break_stmt(self, stmt):
+        self.emit('break', stmt)
+
+    def continue_stmt(self, stmt):
+        increment = self.state.loops[-1]
+        if increment is not None:
+            self.expression_stmt(my_stmt.Expression(increment))
+        self.emit('continue', stmt)
+
+    def class_stmt(self, stmt):
+        name = stmt.name.lexme
+        var = self.declare(name, stmt.name)
+        if var is not None and var.captured:
+            self.emit(f'{var.py} = Cell(None)')
+        sp = 'None'
+        if stmt.sp is not None:
+            sp = self.temp()
+            self.emit(f'{sp} = {self.expr(stmt.sp)}', stmt.sp)
+            self.emit(f"if type({sp}) is not Cls: error({stmt.sp.name.line}, {stmt.sp.name.lexme!r}, 'Superclass must be a class.')")
+            self.begin_scope()
+            self.store(self.declare('super', stmt), 'super', sp, None)
+        methods = []
+        for method in stmt.methods:
+            py = self.fresh('_m')
+            self.function(method, py, method, method.name.lexme == 'init')
+            methods.append(f'{method.name.lexme!r}: {py}')
+        if stmt.sp is not None:
+            self.end_scope()
+        value = f'Cls({name!r}, {sp}, {{{", ".join(methods)}}})'
+        if var is not None and var.captured:
+            self.emit(f'{var.py}.value = {value}', stmt)
+        else:
+            self.store(var, name, value, stmt)
+
+    # ---------------- 表达式 ----------------
+
+    def expr(self, expr):
+        return self.expr_table[type(expr)](expr)
+
+    def is_bool(self, expr):
+        '''
+        结果一定是 bool 的表达式，作为条件时可以直接交给 Python 判断
+        '''
+        if isinstance(expr, (my_expr.Grouping, my_expr.Invariant)):
+            return self.is_bool(expr.expr)
+        if isinstance(expr, my_expr.Literal):
+            return isinstance(expr.value, bool)
+        if isinstance(expr, my_expr.Binary):
+            return expr.operator.lexme in ('==', '!=', '<', '<=', '>', '>=')
+        if isinstance(expr, my_expr.Unary):
+            return expr.operator.lexme == '!'
+        if isinstance(expr, my_expr.Logical):
+            return self.is_bool(expr.left) and self.is_bool(expr.right)
+        return False
+
+    def is_simple(self, expr):
+        '''
+        求值不会有副作用也不会出错的表达式
+        '''
+        if isinstance(expr, my_expr.Literal):
+            return True
+        if isinstance(expr, my_expr.Variable):
+            return self.lookup(expr.name.lexme) is not None
+        return isinstance(expr, my_expr.This)
+
+    def condition(self, expr):
+        if self.is_bool(expr):
+            return self.expr(expr)
+        t = self.temp()
+        return f'({t} := {self.expr(expr)}) is not None and {t} is not False'
+
+    def literal(self, expr):
+        if isinstance(expr.value, float) and not math.isfinite(expr.value): # 折叠可能产生 -inf 和 nan
+            return f"float('{expr.value}')"
+        return repr(expr.value)
+
+    def grouping(self, expr):
+        return self.expr(expr.expr)
+
+    def unary(self, expr):
+        right = self.expr(expr.right)
+        if expr.operator.lexme == '!':
+            if self.is_bool(expr.right):
+                return f'(not {right})'
+            t = self.temp()
+            return f'(({t} := {right}) is None or {t} is False)'
+        if expr.proven is float:
+            return f'(-{right})'
+        t = self.temp()
+        return f'(-{t} if type({t} := {right}) is float else operand_error({expr.operator.line}, \'-\'))'
+
+    def binary(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        op = expr.operator.lexme
+        line = expr.operator.line
+        if op in ('==', '!=') or expr.proven is float:
+            return f'({left} {op} {right})'
+        if expr.proven is str:
+            return f'concat({left}, {right})'
+        a = self.temp()
+        b = self.temp()
+        if op == '+':
+            return f'({a} + {b} if type({a} := {left}) is type({b} := {right}) is float else add({a}, {b}, {line}))'
+        # & 而不是 and：两个操作数都求值之后才报错
+        return f'({a} {op} {b} if (type({a} := {left}) is float) & (type({b} := {right}) is float) else operand_error({line}, {op!r}))'
+
+    def logical(self, expr):
+        left = self.expr(expr.left)
+        right = self.expr(expr.right)
+        op = expr.operator.lexme
+        if self.is_bool(expr.left) and self.is_bool(expr.right):
+            return f'({left} {op} {right})'
+        t = self.temp()
+        if op == 'or':
+            return f'({t} if ({t} := {left}) is not None and {t} is not False else {right})'
+        return f'({right} if ({t} := {left}) is not None and {t} is not False else {t})'
+
+    def variable(self, expr):
+        name = expr.name.lexme
+        var = self.lookup(name)
+        if var is None:
+            return f'(G[{name!r}] if {name!r} in G else undefined({expr.name.line}, {name!r}))'
+        return var.load()
+
+    def assign(self, expr):
+        name = expr.name.lexme
+        var = self.lookup(name)
+        value = self.expr(expr.expr)
+        if var is None:
+            return f'assign_global(G, {name!r}, {value}, {expr.name.line})'
+        if var.captured:
+            return f'set_cell({var.py}, {value})'
+        return f'({var.py} := {value})'
+
+    def this(self, expr):
+        return self.lookup('this').load()
+
+    def super(self, expr):
+        sp = self.lookup('super').load()
+        this = self.lookup('this').load()
+        return f'get_super({sp}, {this}, {expr.method.lexme!r}, {expr.method.line})'
+
+    def call(self, expr):
+        if isinstance(expr.callee, my_expr.Get) and all(self.is_simple(argument) for argument in expr.arguments):
+            return self.invoke(expr)
+        return self.call_value(expr, self.expr(expr.callee))
+
+    def invoke(self, expr):
+        '''
+        参数求值不会出错的 obj.name(...)：接收者的 Shape 与调用处缓存的相同时，直接以 obj 为 this 调用缓存的方法
+        '''
+        get = expr.callee
+        obj = self.expr(get.expr)
+        name = get.name.lexme
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        cache = self.cache('_ic', 'InvokeCache')
+        t = self.temp()
+        fast = self.resolved(f'{cache}.method({", ".join([t] + arguments)})')
+        slow = f'invoke({", ".join([cache, t, repr(name), str(get.name.line), str(expr.paren.line)] + arguments)})'
+        return f'({fast} if type({t} := {obj}) is Instance and {t}.shape is {cache}.shape else {slow})'
+
+    def call_value(self, expr, callee):
+        '''
+        调用表达式，callee 是被调用者的代码
+        '''
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        line = expr.paren.line
+        t = self.temp()
+        fast = self.resolved(f'{t}({", ".join(arguments)})')
+        slow = f'call({t}, {line}{"".join(", " + a for a in arguments)})'
+        if not all(self.is_simple(argument) for argument in expr.arguments):
+            # Call.eval 在求值参数之前检查被调用者
+            slow = f'call(callable_({t}, {line}), {line}{"".join(", " + a for a in arguments)})'
+        return f'({fast} if type({t} := {callee}) is function and {t}.__code__.co_argcount == {len(arguments)} else {slow})'
+
+    def tail_value(self, expr, callee):
+        '''
+        尾部的调用表达式：检查被调用者和参数个数后返回 TailCall，由调用者接着调用
+        '''
+        arguments = [self.expr(argument) for argument in expr.arguments]
+        line = expr.paren.line
+        if not all(self.is_simple(argument) for argument in expr.arguments):
+            callee = f'callable_({callee}, {line})'
+        return f'tail_call({callee}, {line}{"".join(", " + a for a in arguments)})'
+
+    def resolved(self, value):
+        '''
+        直接调用生成的函数时，它返回的 TailCall 在这里接着执行
+        '''
+        r = self.temp()
+        return f'({r} if type({r} := {value}) is not TailCall else resume({r}))'
+
+    def get(self, expr):
+        obj = self.expr(expr.expr)
+        name = expr.name.lexme
+        cache = self.cache('_gc', 'GetCache')
+        t = self.temp()
+        return f'({t}.values[{cache}.slot] if type({t} := {obj}) is Instance and {t}.shape is {cache}.shape else get_property({cache}, {t}, {name!r}, {expr.name.line}))'
+
+    def set(self, expr):
+        obj = self.expr(expr.expr)
+        name = expr.name.lexme
+        value = self.expr(expr.value)
+        cache = self.cache('_sc', 'SetCache')
+        if self.is_simple(expr.value):
+            return f'set_property({cache}, {obj}, {name!r}, {value}, {expr.name.line})'
+        return f'set_property({cache}, instance_({obj}, {name!r}, {expr.name.line}), {name!r}, {value}, {expr.name.line})'
@@ -1,19 +1,122 @@
 
-from my_token import Token
 from my_env import Env
 
-class ReturnValue(Exception):
+'''
+语句执行的结果：正常执行完返回 None，return 返回 ReturnValue，break/continue 返回 BREAK/CONTINUE，
+尾调用 return f(...) 返回 TailCall，包含它们的语句把结果原样返回，直到循环或 Func.call 处理它们
+'''
+
+class ReturnValue:
+    __slots__ = ('value',)
+
     def __init__(self, value):
-        super().__init__()
         self.value = value
 
+class TailCall:
+    '''
+    已经检查过的调用：由当前的 Func.call 在同一个 Python 栈帧中接着执行，尾递归不会加深调用栈
+    '''
+    __slots__ = ('function', 'arguments')
+
+    def __init__(self, function, arguments):
+        self.function = function
+        self.arguments = arguments
+
+class Rope:
+    '''
+    延迟拼接的字符串：left 和 right 是 str 或 Rope，第一次被观察（打印、比较、传给本地函数）时才拼接成 str，
+    之后 left 保存拼接结果，right 为空串；循环中反复 s = s + t 不会每次复制整个字符串
+    只有拼接结果不短于 MIN 个字符时才创建 Rope，所以较短的字符串总是 str
+    '''
+    __slots__ = ('left', 'right', 'length')
+    MIN = 256
+
+    def __init__(self, left, right, length):
+        self.left = left
+        self.right = right
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        if self.right != '' or type(self.left) is not str:
+            parts = []
+            stack = [self.right, self.left]
+            while stack: # 不用递归：长循环拼接出的 Rope 很深
+                node = stack.pop()
+                if type(node) is str:
+                    parts.append(node)
+                else:
+                    stack.append(node.right)
+                    stack.append(node.left)
+            self.left = ''.join(parts)
+            self.right = ''
+        return self.left
+
+    __repr__ = __str__
+
+    def __eq__(self, other):
+        if type(other) is Rope or type(other) is str:
+            return len(other) == self.length and str(other) == str(self)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+strings = (str, Rope)
+
+def concat(left, right):
+    '''
+    两个字符串（str 或 Rope）相加
+    '''
+    length = len(left) + len(right)
+    if length < Rope.MIN: # 这时两个都是 str
+        return left + right
+    return Rope(left, right, length)
+
+def flatten(value):
+    '''
+    传给本地函数的参数：Rope 换成 str
+    '''
+    return str(value) if type(value) is Rope else value
+
+class Cell:
+    '''
+    被内层函数捕获的局部变量：Env 的槽位中存放 Cell，声明它的函数和捕获它的函数通过同一个 Cell 读写
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class LoopControl:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+BREAK = LoopControl('break')
+CONTINUE = LoopControl('continue')
+
 class Func:
-    def __init__(self, name, parameters, body, env, is_init=False):
+    '''
+    env 是 Resolver 算出的函数捕获的 Cell 组成的 Env（没有捕获时是全局作用域），不是定义处的整条作用域链
+    boxed 是被内层函数捕获、调用时要装箱成 Cell 的参数的槽位，padding 是接在参数后面的函数体中局部变量的初值
+    '''
+    __slots__ = ('name', 'parameters', 'body', 'env', 'is_init', 'boxed', 'padding')
+
+    def __init__(self, name, parameters, body, env, is_init=False, boxed=(), padding=()):
         self.name = name
         self.parameters = parameters
         self.body = body
         self.env = env
         self.is_init = is_init
+        self.boxed = boxed
+        self.padding = padding
 
     def __repr__(self):
         return f'(function {self.name})'
@@ -22,74 +125,145 @@ class Func:
         return len(self.parameters)
 
     def call(self, arguments):
-        env = Env(self.env)
-        for i, arg in enumerate(arguments):
-            env.define(self.parameters[i], arg)
-        try:
-            self.body.exec(env)
-        except ReturnValue as value:
-            if self.is_init:
-                return env.get_at(0, 'this')
-            return value.value
+        function = self
+        while True:
+            for slot in function.boxed:
+                arguments[slot] = Cell(arguments[slot])
+            arguments += function.padding
+            env = Env(function.env, arguments) # 参数依次占据槽位 0..n-1，之后是函数体中的局部变量
+            result = function.body.exec(env)
+            if function.is_init:
+                return function.env.values[0]
+            if result is None:
+                return None
+            if type(result) is ReturnValue:
+                return result.value
+            # 尾调用：被调用的也是 Lox 函数时在这个循环中接着执行，类和本地函数直接调用
+            function = result.function
+            arguments = result.arguments
+            if type(function) is not Func:
+                return function.call(arguments)
+
+    def invoke(self, instance, arguments):
+        '''
+        与 bind(instance).call(arguments) 相同，但不创建绑定后的 Func
+        '''
+        for slot in self.boxed:
+            arguments[slot] = Cell(arguments[slot])
+        arguments += self.padding
+        env = Env(Env(self.env, [instance]), arguments)
+        result = self.body.exec(env)
         if self.is_init:
-            return env.get_at(0, 'this')
-        return None
+            return instance
+        if result is None:
+            return None
+        if type(result) is ReturnValue:
+            return result.value
+        return result.function.call(result.arguments)
 
     def bind(self, instance):
-        env = Env(self.env)
-        env.define('this', instance)
-        return Func(self.name, self.parameters, self.body, env, self.is_init)
+        env = Env(self.env, [instance])
+        return Func(self.name, self.parameters, self.body, env, self.is_init, self.boxed, self.padding)
 
 class Cls:
+    '''
+    methods 是展平的方法表：先复制超类的整张方法表，再加入（覆盖）自己的方法，查找方法不必沿超类链逐层查找
+    类创建后方法不再改变，init 直接记录初始化方法（没有时为 None）
+    '''
+    __slots__ = ('name', 'sp', 'methods', 'init', 'shape')
+
     def __init__(self, name, sp, methods):
         self.name = name
-        self.sp = sp
-        self.methods = methods
+        self.sp = None
+        self.methods = {}
+        self.init = None
+        self.shape = Shape({}) # 这个类的实例最初的（没有字段的）Shape
+        if sp is not None:
+            self.inherit(sp)
+        for k, method in methods.items():
+            self.add_method(k, method)
 
     def __repr__(self):
         return f'(class {self.name} < {self.sp})'
 
+    def inherit(self, sp):
+        '''
+        复制超类的方法表，在加入自己的方法之前调用
+        '''
+        self.sp = sp
+        self.methods.update(sp.methods)
+        self.init = sp.init
+
+    def add_method(self, name, method):
+        self.methods[name] = method
+        if name == 'init':
+            self.init = method
+
     def arity(self):
-        init = self.get_method('init')
-        if init is not None:
-            return init.arity()
+        if self.init is not None:
+            return self.init.arity()
         return 0
 
     def call(self, arguments):
         instance = Instance(self)
-        init = self.get_method('init')
-        if init is not None:
-            return init.bind(instance).call(arguments)
+        if self.init is not None:
+            self.init.invoke(instance, arguments)
         return instance
 
     def get_method(self, name):
-        if isinstance(name, Token):
-            k = name.lexme
-        else:
-            k = name
-        if k in self.methods:
-            return self.methods[k]
-        elif self.sp is not None:
-            return self.sp.get_method(k)
-        else:
-            return None
+        return self.methods.get(name)
+
+class Shape:
+    '''
+    实例的字段布局：slots 是字段名到 Instance.values 下标的映射，创建后不再改变
+    加入新字段时沿 transitions 走到（第一次时创建）下一个 Shape，同一个类中按同样顺序加入同样字段的实例共享同一个 Shape，
+    所以 Shape 相同就说明类相同、字段的位置也相同，Get/Set/方法调用按 Shape 缓存查找结果
+    '''
+    __slots__ = ('slots', 'transitions')
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.transitions = {}
+
+    def add(self, name):
+        shape = self.transitions.get(name)
+        if shape is None:
+            slots = dict(self.slots)
+            slots[name] = len(slots)
+            shape = self.transitions[name] = Shape(slots)
+        return shape
 
 class Instance:
+    '''
+    字段的值按 shape.slots 给出的下标存放在 values 中
+    '''
+    __slots__ = ('cls', 'shape', 'values')
+
     def __init__(self, cls):
         self.cls = cls
-        self.fields = {}
+        self.shape = cls.shape
+        self.values = []
 
     def __repr__(self):
         return f'(instance {self.cls})'
 
     def get(self, name, env):
-        if name.lexme in self.fields:
-            return self.fields[name.lexme]
+        slot = self.shape.slots.get(name.lexme)
+        if slot is not None:
+            return self.values[slot]
         method = self.cls.get_method(name.lexme)
         if method is not None:
             return method.bind(self)
         env.runtime_error(name, f'Undefined property {name.lexme}.')
 
     def set(self, name, value):
-        self.fields[name.lexme] = value
+        self.set_field(name.lexme, value)
+
+    def set_field(self, k, value):
+        slot = self.shape.slots.get(k)
+        if slot is None:
+            self.shape = self.shape.add(k)
+            self.values.append(value)
+        else:
+            self.values[slot] = value
 
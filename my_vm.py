@@ -0,0 +1,377 @@
+
+from my_type import Func, Cls, Instance, strings, concat
+from my_compiler import *
+
+class Cell:
+    '''
+    被闭包捕获的变量：声明它的函数和捕获它的闭包共享同一个 Cell
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+class Closure:
+    __slots__ = ('function', 'cells')
+
+    def __init__(self, function, cells):
+        self.function = function
+        self.cells = cells
+
+    def __repr__(self):
+        return f'(function {self.function.name})'
+
+class BoundMethod:
+    __slots__ = ('receiver', 'method')
+
+    def __init__(self, receiver, method):
+        self.receiver = receiver
+        self.method = method
+
+    def __repr__(self):
+        return f'(function {self.method.function.name})'
+
+class VM:
+    '''
+    执行 Compiler 生成的字节码
+    调用 Lox 函数时只压入一个调用帧，不递归调用 Python 函数，调用深度只受 env.max_depth 限制，尾调用替换当前帧不增加深度；全局变量直接使用 env.values，
+    类和实例沿用 my_type 中的 Cls 和 Instance，所以输出与树遍历解释器一致
+    '''
+    def __init__(self, env):
+        self.env = env
+
+    def interpret(self, statements):
+        function = Compiler().compile(statements)
+        return self.run(Closure(function, []))
+
+    def run(self, closure):
+        env = self.env
+        globals_ = env.values
+        max_depth = env.max_depth
+        stack = [closure]
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        function = closure.function
+        code = function.code
+        consts = function.constants
+        cells = closure.cells
+        base = 0
+        ip = 0
+        while True:
+            op, arg = code[ip]
+            ip += 1
+            if op == GET_LOCAL:
+                push(stack[base + arg])
+            elif op == CONSTANT:
+                push(consts[arg])
+            elif op == POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip = arg
+            elif op == ADD:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left + right
+                elif type(left) in strings and type(right) in strings:
+                    stack[-1] = concat(left, right)
+                else:
+                    env.runtime_error(function.tokens[ip-1], 'Operands must be two numbers or two strings.')
+            elif op == NUMBER_OP:
+                right = pop()
+                stack[-1] = arg(stack[-1], right)
+            elif op == SUBTRACT:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left - right
+            elif op == LESS:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left < right
+            elif op == GET_GLOBAL:
+                name = consts[arg]
+                if name not in globals_:
+                    env.runtime_error(function.tokens[ip-1], f'Undefined variable {name}.')
+                push(globals_[name])
+            elif op == CALL:
+                callee = stack[-1-arg]
+                kind = type(callee)
+                if kind is BoundMethod:
+                    stack[-1-arg] = callee.receiver
+                    callee = callee.method
+                    kind = Closure
+                elif kind is Cls:
+                    instance = Instance(callee)
+                    init = callee.init
+                    if init is None:
+                        if arg != 0:
+                            env.runtime_error(function.tokens[ip-1], f'Expected 0 arguments but got {arg}.')
+                        stack[-1] = instance
+                        continue
+                    stack[-1-arg] = instance
+                    callee = init
+                    kind = Closure
+                if kind is Closure:
+                    target = callee.function
+                    if arg != target.arity:
+                        env.runtime_error(function.tokens[ip-1], f'Expected {target.arity} arguments but got {arg}.')
+                    if len(frames) >= max_depth: # frames 中是调用者，长度就是当前的调用深度
+                        env.runtime_error(function.tokens[ip-1], 'Stack overflow.')
+                    frames.append((function, cells, base, ip))
+                    function = target
+                    code = target.code
+                    consts = target.constants
+                    cells = callee.cells
+                    base = len(stack) - arg - 1
+                    ip = 0
+                elif isinstance(callee, Func):
+                    if arg != callee.arity():
+                        env.runtime_error(function.tokens[ip-1], f'Expected {callee.arity()} arguments but got {arg}.')
+                    arguments = stack[len(stack)-arg:]
+                    del stack[len(stack)-arg:]
+                    stack[-1] = callee.call(arguments)
+                else:
+                    env.runtime_error(function.tokens[ip-1], 'Can only call functions and classes.')
+            elif op == INVOKE:
+                n = arg[1]
+                instance = stack[-1-n]
+                if type(instance) is not Instance:
+                    env.runtime_error(function.tokens[ip-1], 'Only instances have properties.')
+                if instance.shape is arg[2]:
+                    method = arg[3]
+                else:
+                    name = arg[0]
+                    slot = instance.shape.slots.get(name)
+                    if slot is not None:
+                        stack[-1-n] = instance.values[slot] # 由下一条 CALL 调用
+                        continue
+                    method = instance.cls.get_method(name)
+                    if method is None:
+                        env.runtime_error(function.tokens[ip-1], f'Undefined property {name}.')
+                    arg[2] = instance.shape
+                    arg[3] = method
+                target = method.function
+                # 参数个数和调用深度的错误报告在下一条 CALL 的位置
+                if n != target.arity:
+                    env.runtime_error(function.tokens[ip], f'Expected {target.arity} arguments but got {n}.')
+                if len(frames) >= max_depth:
+                    env.runtime_error(function.tokens[ip], 'Stack overflow.')
+                frames.append((function, cells, base, ip + 1))
+                function = target
+                code = target.code
+                consts = target.constants
+                cells = method.cells
+                base = len(stack) - n - 1
+                ip = 0
+            elif op == RETURN:
+                value = pop()
+                if len(frames) == 0:
+                    return value
+                del stack[base:]
+                push(value)
+                function, cells, base, ip = frames.pop()
+                code = function.code
+                consts = function.constants
+            elif op == TAIL_CALL:
+                # 与 CALL 相同，但被调用的是 Lox 函数时把它和参数移到当前帧的位置，替换当前帧而不压入新帧
+                callee = stack[-1-arg]
+                kind = type(callee)
+                if kind is BoundMethod:
+                    stack[-1-arg] = callee.receiver
+                    callee = callee.method
+                    kind = Closure
+                elif kind is Cls:
+                    instance = Instance(callee)
+                    init = callee.init
+                    if init is None:
+                        if arg != 0:
+                            env.runtime_error(function.tokens[ip-1], f'Expected 0 arguments but got {arg}.')
+                        stack[-1] = instance
+                        continue
+                    stack[-1-arg] = instance
+                    callee = init
+                    kind = Closure
+                if kind is Closure:
+                    target = callee.function
+                    if arg != target.arity:
+                        env.runtime_error(function.tokens[ip-1], f'Expected {target.arity} arguments but got {arg}.')
+                    stack[base:] = stack[len(stack)-arg-1:]
+                    function = target
+                    code = target.code
+                    consts = target.constants
+                    cells = callee.cells
+                    ip = 0
+                elif isinstance(callee, Func): # 本地函数：结果留在栈顶，由下一条 RETURN 返回
+                    if arg != callee.arity():
+                        env.runtime_error(function.tokens[ip-1], f'Expected {callee.arity()} arguments but got {arg}.')
+                    arguments = stack[len(stack)-arg:]
+                    del stack[len(stack)-arg:]
+                    stack[-1] = callee.call(arguments)
+                else:
+                    env.runtime_error(function.tokens[ip-1], 'Can only call functions and classes.')
+            elif op == SET_LOCAL:
+                stack[base + arg] = stack[-1]
+            elif op == POP:
+                pop()
+            elif op == GET_UPVALUE:
+                push(cells[arg].value)
+            elif op == GET_CELL:
+                push(stack[base + arg].value)
+            elif op == JUMP:
+                ip = arg
+            elif op == GET_PROPERTY:
+                instance = stack[-1]
+                if type(instance) is not Instance:
+                    env.runtime_error(function.tokens[ip-1], 'Only instances have properties.')
+                shape = instance.shape
+                if shape is arg[1]:
+                    stack[-1] = instance.values[arg[2]]
+                    continue
+                name = arg[0]
+                slot = shape.slots.get(name)
+                if slot is not None:
+                    arg[1] = shape
+                    arg[2] = slot
+                    stack[-1] = instance.values[slot]
+                else:
+                    method = instance.cls.get_method(name)
+                    if method is None:
+                        env.runtime_error(function.tokens[ip-1], f'Undefined property {name}.')
+                    stack[-1] = BoundMethod(instance, method)
+            elif op == SET_PROPERTY:
+                value = pop()
+                instance = stack[-1]
+                if type(instance) is not Instance:
+                    env.runtime_error(function.tokens[ip-1], 'Only instances have fields.')
+                shape = instance.shape
+                if shape is arg[1]:
+                    instance.values[arg[2]] = value
+                elif shape is arg[3]:
+                    instance.shape = arg[4]
+                    instance.values.append(value)
+                else:
+                    slot = shape.slots.get(arg[0])
+                    if slot is None:
+                        arg[3] = shape
+                        arg[4] = instance.shape = shape.add(arg[0])
+                        instance.values.append(value)
+                    else:
+                        arg[1] = shape
+                        arg[2] = slot
+                        instance.values[slot] = value
+                stack[-1] = value
+            elif op == MULTIPLY:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left * right
+            elif op == DIVIDE:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left / right
+            elif op == GREATER:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left > right
+            elif op == GREATER_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left >= right
+            elif op == LESS_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = left <= right
+            elif op == EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == NEGATE:
+                if type(stack[-1]) is not float:
+                    env.runtime_error(function.tokens[ip-1], 'Operand must be a number.')
+                stack[-1] = -stack[-1]
+            elif op == JUMP_IF_FALSE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    pop()
+                else:
+                    ip = arg
+            elif op == SET_UPVALUE:
+                cells[arg].value = stack[-1]
+            elif op == SET_CELL:
+                stack[base + arg].value = stack[-1]
+            elif op == MAKE_CELL:
+                stack[base + arg] = Cell(stack[base + arg])
+            elif op == NIL:
+                push(None)
+            elif op == TRUE:
+                push(True)
+            elif op == FALSE:
+                push(False)
+            elif op == POP_N:
+                del stack[-arg:]
+            elif op == PRINT:
+                print(f'{pop()}')
+            elif op == SET_GLOBAL:
+                name = consts[arg]
+                if name not in globals_:
+                    env.runtime_error(function.tokens[ip-1], f'Undefined variable {name}.')
+                globals_[name] = stack[-1]
+            elif op == DEFINE_GLOBAL:
+                globals_[consts[arg]] = pop()
+            elif op == CLOSURE:
+                target = consts[arg]
+                captured = []
+                for is_local, index in target.upvalues:
+                    captured.append(stack[base + index] if is_local else cells[index])
+                push(Closure(target, captured))
+            elif op == CHECK_CALLABLE:
+                callee = stack[-1]
+                if not isinstance(callee, (Closure, BoundMethod, Cls, Func)):
+                    env.runtime_error(function.tokens[ip-1], 'Can only call functions and classes.')
+            elif op == CHECK_INSTANCE:
+                if type(stack[-1]) is not Instance:
+                    env.runtime_error(function.tokens[ip-1], 'Only instances have fields.')
+            elif op == GET_SUPER:
+                sp = pop()
+                name = consts[arg]
+                method = sp.get_method(name)
+                if method is None:
+                    env.runtime_error(function.tokens[ip-1], f'Undefined property {name}.')
+                stack[-1] = BoundMethod(stack[-1], method)
+            elif op == CLASS:
+                push(Cls(consts[arg], None, {}))
+            elif op == INHERIT:
+                sp = pop()
+                if not isinstance(sp, Cls):
+                    env.runtime_error(function.tokens[ip-1], 'Superclass must be a class.')
+                stack[-1].inherit(sp) # 复制超类的方法表，之后的 METHOD 再加入自己的方法
+            elif op == METHOD:
+                method = pop()
+                stack[-1].add_method(consts[arg], method)
+            else:
+                raise RuntimeError(f'unknown opcode {op}')